@@ -0,0 +1,24 @@
+"""
+Micro-benchmarks for the hot paths of the API.
+
+Run them from the project root as modules, e.g.
+`python -m benchmarks.market_cap_parsing`.
+"""
+
+import os
+import sys
+from pathlib import Path
+
+
+def setup_django():
+    """
+    Configures Django with the test settings so benchmarks run without
+    Postgres, Redis or AWS credentials.
+    """
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings.test")
+    os.environ.setdefault("SECRET_KEY", "benchmark")
+
+    import django
+
+    django.setup()
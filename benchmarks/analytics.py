@@ -0,0 +1,47 @@
+"""
+Time to compute the price analytics of many stocks at once.
+
+Runs `compute_analytics` on a year and a half of synthetic daily closes, for a
+growing number of stocks, to show the cost per stock of the vectorized pass.
+Loading the bars from the database is not included.
+"""
+
+import timeit
+from benchmarks import setup_django
+
+setup_django()
+
+import numpy as np  # noqa: E402
+from stocks.services.analytics import compute_analytics  # noqa: E402
+
+
+BARS = 380
+
+
+def synthetic_history(stocks, seed=0):
+    """
+    Returns the dates and closes of random walks, like `load_closes` does.
+    """
+    rng = np.random.default_rng(seed)
+    returns = rng.normal(0.0005, 0.02, size=(stocks, BARS))
+    closes = 100 * np.exp(np.cumsum(returns, axis=1))
+    days = np.busday_offset("2024-11-15", np.arange(-BARS + 1, 1), roll="backward")
+    dates = np.broadcast_to(days.astype("datetime64[D]"), (stocks, BARS))
+    return dates, closes
+
+
+def run(stocks, number=200):
+    dates, closes = synthetic_history(stocks)
+    elapsed = min(
+        timeit.repeat(lambda: compute_analytics(dates, closes), number=number, repeat=3)
+    )
+    per_call = elapsed / number
+    print(
+        f"{stocks:5} stocks {per_call * 1e3:10.3f} ms per pass "
+        f"{per_call / stocks * 1e6:10.2f} us per stock"
+    )
+
+
+if __name__ == "__main__":
+    for stocks in (1, 10, 100, 500):
+        run(stocks)
@@ -0,0 +1,96 @@
+"""
+Bytes per entry and encode/decode time of the Redis cache codecs.
+
+Compares django-redis's default pickle serializer with every codec and
+compression installed, on cached stocks with a growing number of competitors.
+"""
+
+import pickle
+import timeit
+from benchmarks import setup_django
+
+setup_django()
+
+from django.core.exceptions import ImproperlyConfigured  # noqa: E402
+from django.test import override_settings  # noqa: E402
+from django_redis.serializers.pickle import PickleSerializer  # noqa: E402
+from rest_framework.utils.serializer_helpers import ReturnDict  # noqa: E402
+from stocks.cache_codec import CODECS, COMPRESSIONS, StockCacheSerializer  # noqa: E402
+
+
+def stock_data(competitors):
+    """
+    Returns a cached stock like `StockSerializer(stock).data`.
+    """
+    return ReturnDict(
+        {
+            "id": 1,
+            "status": "OK",
+            "request_data": "2024-11-15",
+            "company_code": "AAPL",
+            "company_name": "Apple Inc.",
+            "purchased_amount": 3,
+            "stock_values": {
+                "open": 226.4,
+                "high": 226.92,
+                "low": 224.27,
+                "close": 225.0,
+            },
+            "performance_data": {
+                "five_days": 2.29,
+                "one_month": -2.75,
+                "three_months": 1.26,
+                "year_to_date": 19.13,
+                "one_year": 20.32,
+            },
+            "competitors": [
+                {
+                    "name": f"Competitor {i} Holdings Inc. Cl A",
+                    "market_cap": {"currency": "USD", "value": 3.09e12 / (i + 1)},
+                }
+                for i in range(competitors)
+            ],
+        },
+        serializer=None,
+    )
+
+
+def get_serializers():
+    serializers = {"pickle (django-redis)": PickleSerializer({})}
+    for codec in CODECS:
+        for compression in COMPRESSIONS:
+            with override_settings(
+                STOCK_CACHE_CODEC=codec,
+                STOCK_CACHE_COMPRESSION=compression,
+                STOCK_CACHE_COMPRESS_MIN_BYTES=0,
+            ):
+                try:
+                    serializers[f"{codec}+{compression}"] = StockCacheSerializer({})
+                except ImproperlyConfigured:
+                    pass
+    return serializers
+
+
+def run(name, serializer, data, number=2000):
+    encoded = serializer.dumps(data)
+    assert serializer.loads(encoded) == data
+
+    encode = min(timeit.repeat(lambda: serializer.dumps(data), number=number, repeat=3))
+    decode = min(
+        timeit.repeat(lambda: serializer.loads(encoded), number=number, repeat=3)
+    )
+    print(
+        f"{name:<24} {len(encoded):8} B "
+        f"{encode / number * 1e6:10.2f} us encode "
+        f"{decode / number * 1e6:10.2f} us decode"
+    )
+
+
+if __name__ == "__main__":
+    serializers = get_serializers()
+    for competitors in (10, 50, 200):
+        data = stock_data(competitors)
+        print(f"{competitors} competitors ({len(pickle.dumps(data))} B pickled)")
+        for name, serializer in serializers.items():
+            run(name, serializer, data)
+        print()
@@ -0,0 +1,70 @@
+"""
+Per-competitor cost of parsing scraped market caps such as "$3.09T".
+
+Compares the previous implementation, which rebuilt the Babel symbol map and
+recompiled the regex for every competitor, with the cached index used now.
+"""
+
+import re
+import timeit
+from babel.core import Locale
+from benchmarks import setup_django
+
+setup_django()
+
+from stocks.serializers import MarketCapSerializer, parse_market_cap  # noqa: E402
+
+
+MARKET_CAPS = [
+    "$3.09T",
+    "$2.16T",
+    "$1.43T",
+    "₩376.85T",
+    "¥18.31T",
+    "$97.59B",
+    "$35.35B",
+    "€512M",
+]
+
+
+def parse_market_cap_before(raw_market_cap):
+    match = re.match(r"([^\d.]+)([\d.].*)", raw_market_cap)
+    symbol, value_str = match.group(1), match.group(2)
+
+    locale = Locale.parse("en_US")
+    symbols = {symbol: code for code, symbol in locale.currency_symbols.items()}
+    currency = symbols.get(symbol)
+
+    suffix_mapping = {"T": 1e12, "B": 1e9, "M": 1e6}
+    if value_str[-1] in suffix_mapping:
+        value = float(value_str[:-1]) * suffix_mapping[value_str[-1]]
+    else:
+        value = float(value_str)
+    return {"currency": currency, "value": value}
+
+
+def validate_with_serializer(raw_market_cap):
+    serializer = MarketCapSerializer(
+        data={}, context={"raw_market_cap": raw_market_cap}
+    )
+    serializer.is_valid(raise_exception=True)
+    return serializer.validated_data
+
+
+def run(name, func, number):
+    for raw_market_cap in MARKET_CAPS:
+        assert (
+            func(raw_market_cap)["value"] == parse_market_cap(raw_market_cap)["value"]
+        )
+
+    total = min(
+        timeit.repeat(lambda: [func(m) for m in MARKET_CAPS], number=number, repeat=5)
+    )
+    per_call = total / (number * len(MARKET_CAPS)) * 1e6
+    print(f"{name:<32} {per_call:10.2f} us/competitor")
+
+
+if __name__ == "__main__":
+    run("before (rebuilt index)", parse_market_cap_before, number=20)
+    run("serializer (cached index)", validate_with_serializer, number=200)
+    run("parse_market_cap", parse_market_cap, number=2000)
@@ -0,0 +1,189 @@
+"""
+Parse time and peak memory of the MarketWatch page parsers.
+
+Compares the previous implementation, which built a BeautifulSoup tree of the
+whole page with `html.parser`, with every parser backend installed. The time
+spent finding the end of the sections while streaming the page is compared
+with the previous tracker, which ran `html.parser` over every chunk. Pages are
+read from the HTML files given as arguments, e.g.
+`python -m benchmarks.marketwatch_parsing saved/aapl.html`, and default to a
+synthetic page of the same shape and size as a MarketWatch quote page.
+
+Peak memory is measured with tracemalloc, which only sees the Python heap:
+the trees built in C by lxml and selectolax are not counted.
+"""
+
+import sys
+import timeit
+import tracemalloc
+from html.parser import HTMLParser
+from pathlib import Path
+from bs4 import BeautifulSoup
+from stocks.services.aws_lambda.marketwatch_lambda import lambda_function
+
+
+def build_page(filler_blocks=1500):
+    """
+    Returns a page with the three scraped sections buried in navigation,
+    scripts and articles, like the real one.
+    """
+    filler = "".join(
+        f'<div class="article__content"><a href="/story/{i}">Headline {i}</a>'
+        f"<p>{'Lorem ipsum dolor sit amet. ' * 5}</p>"
+        f'<ul><li class="list__item">Item {i}</li><li>{i * 3}</li></ul></div>'
+        for i in range(filler_blocks)
+    )
+    performance = "".join(
+        f"<tr><td>{period}</td><td><ul><li>{change}%</li></ul></td></tr>"
+        for period, change in [
+            ("5 Day", 2.29),
+            ("1 Month", -2.75),
+            ("3 Month", 1.26),
+            ("YTD", 19.13),
+            ("1 Year", 20.32),
+        ]
+    )
+    competitors = "".join(
+        f"<tr><td><a>Competitor {i} Inc.</a></td><td>{i / 10}%</td><td>${i}.5B</td></tr>"
+        for i in range(10)
+    )
+    return (
+        "<html><head><title>AAPL Stock Price</title>"
+        f"<script>{'var x = 1;' * 2000}</script></head><body>"
+        f"<nav>{filler[: len(filler) // 3]}</nav>"
+        '<h1 class="company__name">Apple Inc.</h1>'
+        f"<main>{filler[len(filler) // 3 :]}"
+        f'<div class="element element--table performance"><table>{performance}</table></div>'
+        '<div class="Competitors"><table><tr><th>Name</th><th>Chg %</th>'
+        f"<th>Market Cap</th></tr>{competitors}</table></div></main>"
+        "<footer>MarketWatch</footer></body></html>"
+    )
+
+
+def parse_before(html):
+    soup = BeautifulSoup(html, "html.parser")
+    company_name = soup.find("h1", {"class": "company__name"})
+    if company_name:
+        company_name = company_name.get_text(strip=True)
+
+    performance_data = {}
+    performance_table = soup.find(
+        "div", {"class": "element element--table performance"}
+    )
+    if performance_table:
+        for row in performance_table.find_all("tr"):
+            cells = row.find_all("td")
+            if len(cells) == 2:
+                key = cells[0].get_text(strip=True).lower().replace(" ", "_")
+                value = cells[1].get_text(strip=True).replace("%", "")
+                performance_data[key] = float(value) if value else 0.0
+
+    competitors = []
+    competitors_section = soup.find("div", {"class": "Competitors"})
+    if competitors_section:
+        for row in competitors_section.find_all("tr")[1:]:
+            cells = row.find_all("td")
+            if len(cells) >= 2:
+                competitors.append(
+                    {
+                        "name": cells[0].get_text(strip=True),
+                        "market_cap": cells[-1].get_text(strip=True),
+                    }
+                )
+
+    return company_name, performance_data, competitors
+
+
+class SectionTrackerBefore(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+        self.pending = dict(lambda_function.SECTIONS)
+        self.current = None
+        self.depth = 0
+
+    @property
+    def done(self):
+        return not self.pending and self.current is None
+
+    def handle_starttag(self, tag, attrs):
+        if self.current:
+            if tag == lambda_function.SECTIONS[self.current][0]:
+                self.depth += 1
+            return
+
+        classes = (dict(attrs).get("class") or "").split()
+        for name, (section_tag, section_classes) in self.pending.items():
+            if tag == section_tag and set(section_classes).issubset(classes):
+                self.current, self.depth = name, 1
+                del self.pending[name]
+                return
+
+    def handle_endtag(self, tag):
+        if self.current and tag == lambda_function.SECTIONS[self.current][0]:
+            self.depth -= 1
+            if not self.depth:
+                self.current = None
+
+
+def track_sections(tracker_class, html):
+    """
+    Feeds the page in streaming chunks until the tracker is done, and returns
+    how much of it was read.
+    """
+    tracker = tracker_class()
+    chunk_size = lambda_function.MARKETWATCH_CHUNK_SIZE
+    for start in range(0, len(html), chunk_size):
+        tracker.feed(html[start : start + chunk_size])
+        if tracker.done:
+            return start + chunk_size
+    return len(html)
+
+
+def peak_memory(func, html):
+    tracemalloc.start()
+    func(html)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def run(name, func, html, number, before=parse_before):
+    assert func(html) == before(html), f"{name} extracted different data"
+
+    total = min(timeit.repeat(lambda: func(html), number=number, repeat=3))
+    per_call = total / number * 1e3
+    peak = peak_memory(func, html) / 2**20
+    print(f"{name:<24} {per_call:10.2f} ms/page {peak:10.2f} MiB peak")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:]:
+        pages = {path: Path(path).read_text() for path in sys.argv[1:]}
+    else:
+        pages = {"synthetic page": build_page()}
+
+    for label, html in pages.items():
+        print(f"{label} ({len(html) / 1024:.0f} KiB)")
+        run("before (full soup)", parse_before, html, number=3)
+        for parser, available in lambda_function.PARSER_AVAILABLE.items():
+            if available:
+                run(
+                    parser,
+                    lambda page, p=parser: lambda_function.parse_marketwatch_page(
+                        page, parser=p
+                    ),
+                    html,
+                    number=3 if parser == "html.parser" else 20,
+                )
+
+        tracked = track_sections(lambda_function.SectionTracker, html)
+        print(f"streaming stops after {tracked / 1024:.0f} KiB")
+        track_before = lambda page: track_sections(SectionTrackerBefore, page)
+        run("tracker before", track_before, html, number=3, before=track_before)
+        run(
+            "tracker",
+            lambda page: track_sections(lambda_function.SectionTracker, page),
+            html,
+            number=20,
+            before=track_before,
+        )
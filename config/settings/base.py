@@ -131,11 +131,17 @@ CACHES = {
         "LOCATION": env("REDIS_URL", default="redis://127.0.0.1:6379/1"),
         "OPTIONS": {
             "CLIENT_CLASS": "django_redis.client.DefaultClient",
+            "SERIALIZER": "stocks.cache_codec.StockCacheSerializer",
         },
         "KEY_PREFIX": "stock",
     }
 }
 
+# Encoding of the cached values, see stocks/cache_codec.py
+STOCK_CACHE_CODEC = env("STOCK_CACHE_CODEC", default="orjson")
+STOCK_CACHE_COMPRESSION = env("STOCK_CACHE_COMPRESSION", default="lz4")
+STOCK_CACHE_COMPRESS_MIN_BYTES = env.int("STOCK_CACHE_COMPRESS_MIN_BYTES", default=1024)
+
 # Logging
 LOGGING = {
     "version": 1,
@@ -173,3 +179,85 @@ LOGGING = {
         },
     },
 }
+
+# AWS Lambda services
+LAMBDA_MAX_WORKERS = env.int("LAMBDA_MAX_WORKERS", default=8)
+LAMBDA_TIMEOUTS = {
+    "polygon_data": env.float("POLYGON_LAMBDA_TIMEOUT", default=10.0),
+    "marketwatch_data": env.float("MARKETWATCH_LAMBDA_TIMEOUT", default=30.0),
+}
+
+# Batch stock endpoint
+STOCK_BATCH_MAX_SYMBOLS = env.int("STOCK_BATCH_MAX_SYMBOLS", default=50)
+# Purchases accepted by one call of the bulk purchase endpoint
+STOCK_PURCHASE_BATCH_MAX_ITEMS = env.int(
+    "STOCK_PURCHASE_BATCH_MAX_ITEMS", default=10000
+)
+# Batch invocations fetch every symbol at once, so they get longer timeouts
+LAMBDA_BATCH_TIMEOUTS = {
+    "polygon_data": env.float("POLYGON_BATCH_LAMBDA_TIMEOUT", default=30.0),
+    "marketwatch_data": env.float("MARKETWATCH_BATCH_LAMBDA_TIMEOUT", default=120.0),
+}
+
+# Single-flight refreshes: concurrent cache misses on a symbol wait for the
+# worker holding its lock instead of invoking the Lambdas again.
+SINGLE_FLIGHT_LOCK_TIMEOUT = env.int("SINGLE_FLIGHT_LOCK_TIMEOUT", default=60)
+SINGLE_FLIGHT_WAIT_TIMEOUT = env.int("SINGLE_FLIGHT_WAIT_TIMEOUT", default=45)
+# Seconds the waiters can read a result the refresh did not cache, like
+# partial data while MarketWatch is down.
+SINGLE_FLIGHT_RESULT_TIMEOUT = env.int("SINGLE_FLIGHT_RESULT_TIMEOUT", default=10)
+
+# Stale-while-revalidate: stale cached data is served right away while the
+# symbol is refreshed in a background thread pool.
+STOCK_CACHE_STALE_WHILE_REVALIDATE = env.bool(
+    "STOCK_CACHE_STALE_WHILE_REVALIDATE", default=True
+)
+STOCK_REFRESH_MAX_WORKERS = env.int("STOCK_REFRESH_MAX_WORKERS", default=2)
+
+# Per-process LRU of fresh stock data in front of Redis, invalidated through
+# Redis pub/sub when the cached data of a stock changes
+STOCK_L1_CACHE_ENABLED = env.bool("STOCK_L1_CACHE_ENABLED", default=False)
+STOCK_L1_CACHE_MAX_SIZE = env.int("STOCK_L1_CACHE_MAX_SIZE", default=256)
+STOCK_L1_CACHE_TTL = env.float("STOCK_L1_CACHE_TTL", default=60.0)
+
+# Price history (GET /api/stock/<symbol>/history/)
+STOCK_HISTORY_PAGE_SIZE = env.int("STOCK_HISTORY_PAGE_SIZE", default=500)
+STOCK_HISTORY_MAX_PAGE_SIZE = env.int("STOCK_HISTORY_MAX_PAGE_SIZE", default=5000)
+STOCK_HISTORY_BATCH_SIZE = env.int("STOCK_HISTORY_BATCH_SIZE", default=1000)
+POLYGON_HISTORY_LAMBDA_TIMEOUT = env.float(
+    "POLYGON_HISTORY_LAMBDA_TIMEOUT", default=60.0
+)
+
+# Analytics (GET /api/stock/<symbol>/analytics/), computed from the price
+# history over this many calendar days and cached per trading day
+STOCK_ANALYTICS_LOOKBACK_DAYS = env.int("STOCK_ANALYTICS_LOOKBACK_DAYS", default=400)
+STOCK_ANALYTICS_CACHE_TIMEOUT = env.int("STOCK_ANALYTICS_CACHE_TIMEOUT", default=86400)
+
+# Portfolio valuation (GET /api/portfolio/), cached until a purchase or a
+# refresh changes it
+STOCK_PORTFOLIO_CACHE_TIMEOUT = env.int("STOCK_PORTFOLIO_CACHE_TIMEOUT", default=86400)
+
+# Cache warmer (python manage.py warm_stock_cache)
+STOCK_WATCHLIST = env.list("STOCK_WATCHLIST", default=[])
+STOCK_WARMER_WORKERS = env.int("STOCK_WARMER_WORKERS", default=4)
+STOCK_WARMER_RATE_LIMIT = env.float("STOCK_WARMER_RATE_LIMIT", default=0)
+
+# Locales whose currency symbols are recognized in scraped market caps, by priority
+MARKET_CAP_LOCALES = env.list("MARKET_CAP_LOCALES", default=["en_US"])
+
+# AWS Lambda client, shared by every thread of a process
+AWS_LAMBDA_MAX_POOL_CONNECTIONS = env.int("AWS_LAMBDA_MAX_POOL_CONNECTIONS", default=10)
+AWS_LAMBDA_CONNECT_TIMEOUT = env.float("AWS_LAMBDA_CONNECT_TIMEOUT", default=5.0)
+AWS_LAMBDA_READ_TIMEOUT = env.float("AWS_LAMBDA_READ_TIMEOUT", default=60.0)
+AWS_LAMBDA_RETRY_MODE = env("AWS_LAMBDA_RETRY_MODE", default="standard")
+AWS_LAMBDA_MAX_ATTEMPTS = env.int("AWS_LAMBDA_MAX_ATTEMPTS", default=3)
+
+# Where the upstream services run: LambdaDataSource (AWS), LocalDataSource
+# (in-process handlers) or FixtureDataSource (saved responses, for offline tests)
+STOCKS_DATA_SOURCE = env(
+    "STOCKS_DATA_SOURCE",
+    default="stocks.services.data_sources.LambdaDataSource",
+)
+STOCKS_DATA_SOURCE_FIXTURES_DIR = env(
+    "STOCKS_DATA_SOURCE_FIXTURES_DIR", default=str(BASE_DIR.parent / "fixtures")
+)
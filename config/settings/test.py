@@ -1,9 +1,14 @@
+import tempfile
+from pathlib import Path
 from .base import *
 
 DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": ":memory:",
+        # In a file, unlike in shared memory, writers of concurrent
+        # connections wait for each other instead of failing.
+        "TEST": {"NAME": str(Path(tempfile.gettempdir()) / "stocks_test.sqlite3")},
     }
 }
 
@@ -0,0 +1,84 @@
+import logging
+import time
+import uuid
+from contextlib import contextmanager
+from django.conf import settings
+from django.core.cache import cache
+from redis.exceptions import LockError
+
+
+logger = logging.getLogger("stocks")
+
+LOCK_POLL_INTERVAL = 0.1
+
+
+@contextmanager
+def cache_lock(key, timeout, blocking_timeout):
+    """
+    Holds a lock stored next to the cached data and yields whether it was acquired.
+
+    Uses the Redis lock from django-redis when available, and falls back to a
+    lock built on `cache.add` for the other cache backends.
+    """
+    if hasattr(cache, "lock"):
+        lock = cache.lock(
+            key,
+            timeout=timeout,
+            sleep=LOCK_POLL_INTERVAL,
+            blocking_timeout=blocking_timeout,
+        )
+        acquired = lock.acquire()
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                try:
+                    lock.release()
+                except LockError:
+                    logger.warning(f"Lock {key} expired before being released")
+        return
+
+    token = uuid.uuid4().hex
+    deadline = time.monotonic() + blocking_timeout
+    acquired = cache.add(key, token, timeout=timeout)
+    while not acquired and time.monotonic() < deadline:
+        time.sleep(LOCK_POLL_INTERVAL)
+        acquired = cache.add(key, token, timeout=timeout)
+    try:
+        yield acquired
+    finally:
+        if acquired and cache.get(key) == token:
+            cache.delete(key)
+
+
+def single_flight(key, read, refresh):
+    """
+    Runs `refresh` for `key` in one worker at a time.
+
+    Callers that arrive while a refresh is running wait for it, then `read` the
+    result it stored instead of refreshing again. If the wait times out the
+    caller refreshes on its own rather than failing the request.
+
+    The result of each refresh is also kept for SINGLE_FLIGHT_RESULT_TIMEOUT
+    seconds, so the waiters get it even when `refresh` did not store it, like
+    the partial data returned while MarketWatch is down.
+    """
+    result_key = f"result_{key}"
+    with cache_lock(
+        f"lock_{key}",
+        timeout=settings.SINGLE_FLIGHT_LOCK_TIMEOUT,
+        blocking_timeout=settings.SINGLE_FLIGHT_WAIT_TIMEOUT,
+    ) as acquired:
+        if not acquired:
+            logger.warning(f"Timed out waiting for the refresh of {key}")
+
+        data = read()
+        if data is None:
+            data = cache.get(result_key)
+        if data is not None:
+            logger.info(f"Refresh of {key} was done by another worker")
+            return data
+
+        data = refresh()
+        cache.set(result_key, data, timeout=settings.SINGLE_FLIGHT_RESULT_TIMEOUT)
+        return data
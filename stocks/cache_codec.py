@@ -0,0 +1,174 @@
+"""
+Compact serializer for the values stored in Redis.
+
+django-redis pickles every value by default. Cached stocks are plain dicts,
+so they are encoded with orjson instead, or with the standard json module,
+or with msgpack when it is installed. Values larger than
+STOCK_CACHE_COMPRESS_MIN_BYTES are also compressed with lz4, zlib or zstd.
+
+Every value starts with a header naming its format version, codec and
+compression. Changing the settings therefore never breaks entries that are
+already stored. Entries without a header were pickled by the default
+serializer and are still read. Entries in an unknown format read as a miss.
+"""
+
+import json
+import logging
+import pickle
+import zlib
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django_redis.serializers.base import BaseSerializer
+
+
+logger = logging.getLogger("stocks")
+
+MAGIC = b"\xc5"
+FORMAT_VERSION = 1
+
+
+def json_codec():
+    return (
+        lambda value: json.dumps(value, separators=(",", ":")).encode(),
+        json.loads,
+    )
+
+
+def orjson_codec():
+    import orjson
+
+    # Dates and dataclasses would come back as strings and dicts, so they are
+    # refused and pickled, like with the json codec.
+    option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+    return lambda value: orjson.dumps(value, option=option), orjson.loads
+
+
+def msgpack_codec():
+    import msgpack
+
+    return (
+        lambda value: msgpack.packb(value, use_bin_type=True),
+        lambda data: msgpack.unpackb(data, raw=False),
+    )
+
+
+def pickle_codec():
+    return (
+        lambda value: pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+        pickle.loads,
+    )
+
+
+def zlib_compression():
+    return zlib.compress, zlib.decompress
+
+
+def zstd_compression():
+    import zstandard
+
+    # zstandard contexts are not thread-safe, so every call gets its own.
+    return (
+        lambda data: zstandard.ZstdCompressor().compress(data),
+        lambda data: zstandard.ZstdDecompressor().decompress(data),
+    )
+
+
+def lz4_compression():
+    import lz4.frame
+
+    return lz4.frame.compress, lz4.frame.decompress
+
+
+def no_compression():
+    return bytes, bytes
+
+
+# The ids are written to the stored values, so they must never change.
+CODECS = {
+    "pickle": (0, pickle_codec),
+    "orjson": (1, orjson_codec),
+    "msgpack": (2, msgpack_codec),
+    "json": (3, json_codec),
+}
+
+COMPRESSIONS = {
+    "none": (0, no_compression),
+    "zlib": (1, zlib_compression),
+    "zstd": (2, zstd_compression),
+    "lz4": (3, lz4_compression),
+}
+
+
+def load(registry, name):
+    """
+    Returns the id and the functions of a codec or compression.
+    """
+    if name not in registry:
+        raise ImproperlyConfigured(f"Unknown cache codec or compression '{name}'")
+    id_, factory = registry[name]
+    try:
+        return id_, factory()
+    except ImportError as e:
+        raise ImproperlyConfigured(f"'{name}' is not installed: {e}")
+
+
+class StockCacheSerializer(BaseSerializer):
+    """
+    django-redis serializer configured by STOCK_CACHE_CODEC,
+    STOCK_CACHE_COMPRESSION and STOCK_CACHE_COMPRESS_MIN_BYTES.
+
+    Values the codec can't encode, like arbitrary objects, are pickled.
+    JSON codecs return tuples as lists.
+    """
+
+    def __init__(self, options):
+        super().__init__(options)
+        self.codec_id, (self.encode, _) = load(CODECS, settings.STOCK_CACHE_CODEC)
+        self.compression_id, (self.compress, _) = load(
+            COMPRESSIONS, settings.STOCK_CACHE_COMPRESSION
+        )
+        self.compress_min_bytes = settings.STOCK_CACHE_COMPRESS_MIN_BYTES
+        self.pickle_id, (self.encode_pickle, _) = load(CODECS, "pickle")
+        self.decoders = {}
+
+    def dumps(self, value):
+        codec_id = self.codec_id
+        try:
+            data = self.encode(value)
+        except TypeError:
+            codec_id, data = self.pickle_id, self.encode_pickle(value)
+
+        compression_id = 0
+        if self.compression_id and len(data) >= self.compress_min_bytes:
+            compression_id, data = self.compression_id, self.compress(data)
+
+        return MAGIC + bytes([FORMAT_VERSION, codec_id, compression_id]) + data
+
+    def loads(self, value):
+        if not value.startswith(MAGIC):
+            # Stored by django-redis's default pickle serializer
+            return pickle.loads(value)
+
+        try:
+            version, codec_id, compression_id = value[1:4]
+            if version != FORMAT_VERSION:
+                raise ValueError(f"unknown format version {version}")
+            decode = self.get_decoder(CODECS, codec_id)
+            decompress = self.get_decoder(COMPRESSIONS, compression_id)
+            return decode(decompress(value[4:]))
+        except Exception as e:
+            logger.warning(f"Could not decode cached value, ignoring it: {e}")
+            return None
+
+    def get_decoder(self, registry, id_):
+        """
+        Returns the decode function of any codec or compression, whatever the
+        current settings are.
+        """
+        names = {i: name for name, (i, _) in registry.items()}
+        if id_ not in names:
+            raise ValueError(f"unknown codec or compression id {id_}")
+        name = names[id_]
+        if name not in self.decoders:
+            self.decoders[name] = load(registry, name)[1][1]
+        return self.decoders[name]
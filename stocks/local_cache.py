@@ -0,0 +1,266 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.renderers import JSONRenderer
+
+
+logger = logging.getLogger("stocks")
+
+INVALIDATION_CHANNEL = "stocks:invalidate"
+LISTENER_RETRY_INTERVAL = 5
+
+_local_cache = None
+_local_cache_lock = threading.Lock()
+
+RenderedStock = namedtuple("RenderedStock", ["request_data", "etag", "body"])
+
+
+class LocalCache:
+    """
+    Bounded LRU of the fresh stock responses held by one process, in front of Redis.
+
+    Entries are keyed by symbol and trading day and expire after `ttl`
+    seconds, which bounds how long an entry can outlive a missed invalidation.
+    """
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, stock_symbol, last_valid_day):
+        key = (stock_symbol, last_valid_day)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires_at, data = entry
+            if expires_at <= time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return data
+
+    def set(self, stock_symbol, last_valid_day, data):
+        key = (stock_symbol, last_valid_day)
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, data)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, stock_symbol):
+        with self.lock:
+            for key in [k for k in self.entries if k[0] == stock_symbol]:
+                del self.entries[key]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class CacheMetrics:
+    """
+    Hits and misses of each cache tier in this process.
+    """
+
+    def __init__(self):
+        self.counts = {}
+        self.lock = threading.Lock()
+
+    def record(self, tier, hit):
+        with self.lock:
+            hits, misses = self.counts.get(tier, (0, 0))
+            self.counts[tier] = (hits + 1, misses) if hit else (hits, misses + 1)
+
+    def snapshot(self):
+        with self.lock:
+            counts = dict(self.counts)
+        return {
+            tier: {
+                "hits": hits,
+                "misses": misses,
+                "hit_ratio": round(hits / (hits + misses), 4),
+            }
+            for tier, (hits, misses) in counts.items()
+        }
+
+    def reset(self):
+        with self.lock:
+            self.counts.clear()
+
+
+metrics = CacheMetrics()
+
+
+def supports_pubsub():
+    # Only django-redis exposes its Redis client.
+    return hasattr(cache, "client")
+
+
+def get_redis_connection():
+    from django_redis import get_redis_connection
+
+    return get_redis_connection("default")
+
+
+def handle_invalidations(pubsub, local_cache):
+    """
+    Drops the symbols published on the invalidation channel from the local cache.
+    """
+    for message in pubsub.listen():
+        if message["type"] != "message":
+            continue
+        for stock_symbol in message["data"].decode().split(","):
+            local_cache.invalidate(stock_symbol)
+
+
+def listen_for_invalidations(local_cache):
+    while True:
+        try:
+            pubsub = get_redis_connection().pubsub()
+            pubsub.subscribe(INVALIDATION_CHANNEL)
+            # Invalidations published while disconnected were missed.
+            local_cache.clear()
+            handle_invalidations(pubsub, local_cache)
+        except Exception as e:
+            logger.warning(f"Lost the cache invalidation channel: {e}")
+        time.sleep(LISTENER_RETRY_INTERVAL)
+
+
+def get_local_cache():
+    """
+    Returns the local cache of this process, or None when it is disabled.
+
+    The first call starts the thread that applies the invalidations published
+    by the other processes.
+    """
+    global _local_cache
+    if not settings.STOCK_L1_CACHE_ENABLED:
+        return None
+    if _local_cache is None:
+        with _local_cache_lock:
+            if _local_cache is None:
+                local_cache = LocalCache(
+                    settings.STOCK_L1_CACHE_MAX_SIZE, settings.STOCK_L1_CACHE_TTL
+                )
+                if supports_pubsub():
+                    threading.Thread(
+                        target=listen_for_invalidations,
+                        args=(local_cache,),
+                        name="stocks-cache-invalidation",
+                        daemon=True,
+                    ).start()
+                else:
+                    logger.warning(
+                        "The cache backend has no pub/sub, local cache entries "
+                        "of other processes will only expire"
+                    )
+                _local_cache = local_cache
+    return _local_cache
+
+
+def reset_local_cache():
+    """
+    Drops the local cache so it is rebuilt, with its listener, on next use.
+
+    Runs in forked children, which don't inherit the listener thread.
+    """
+    global _local_cache, _local_cache_lock
+    _local_cache = None
+    _local_cache_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=reset_local_cache)
+
+
+def render_stock(data):
+    """
+    Renders the data of a stock to the JSON body of its response, with the
+    ETag of that body.
+    """
+    body = JSONRenderer().render(data)
+    etag = f'"{hashlib.md5(body, usedforsecurity=False).hexdigest()}"'
+    return RenderedStock(data.get("request_data"), etag, body)
+
+
+def load_rendered_stock(value):
+    if isinstance(value, (tuple, list)) and len(value) == len(RenderedStock._fields):
+        return RenderedStock(*value)
+    return None
+
+
+def get_cached_stock(stock_symbol, last_valid_day):
+    """
+    Reads the cached response of a stock, trying the local cache before Redis.
+
+    Returns the rendered response when it is up to date with the last trading
+    day. Otherwise returns None and the stale data cached for the stock, if any.
+    """
+    local_cache = get_local_cache()
+    if local_cache is not None:
+        rendered = local_cache.get(stock_symbol, last_valid_day)
+        metrics.record("l1", rendered is not None)
+        if rendered is not None:
+            return rendered, None
+
+    rendered = load_rendered_stock(cache.get(f"stock_json_{stock_symbol}"))
+    data = None
+    if rendered is None or rendered.request_data != last_valid_day:
+        rendered = None
+        data = cache.get(f"stock_{stock_symbol}")
+        if data and last_valid_day == data.get("request_data"):
+            # Cached before the responses were rendered along with the data
+            rendered = render_stock(data)
+            cache.set(f"stock_json_{stock_symbol}", tuple(rendered), timeout=86400 * 7)
+
+    metrics.record("redis", rendered is not None)
+    if rendered is not None and local_cache is not None:
+        local_cache.set(stock_symbol, last_valid_day, rendered)
+    return rendered, data
+
+
+def cache_stocks(stocks_data):
+    """
+    Caches the data of stocks along with their rendered responses, and drops
+    them from the local cache of every process.
+    """
+    values = {}
+    for stock_symbol, data in stocks_data.items():
+        values[f"stock_{stock_symbol}"] = data
+        # Stored as a plain tuple so entries don't depend on the class path.
+        values[f"stock_json_{stock_symbol}"] = tuple(render_stock(data))
+    cache.set_many(values, timeout=86400 * 7)
+    invalidate_stocks(list(stocks_data))
+
+
+def invalidate_stocks(stock_symbols):
+    """
+    Drops stocks from the local cache of every process after their cached
+    data changed.
+    """
+    if not stock_symbols:
+        return
+    local_cache = get_local_cache()
+    if local_cache is None:
+        return
+
+    for stock_symbol in stock_symbols:
+        local_cache.invalidate(stock_symbol)
+    if supports_pubsub():
+        try:
+            get_redis_connection().publish(
+                INVALIDATION_CHANNEL, ",".join(stock_symbols)
+            )
+        except Exception as e:
+            logger.error(f"Could not publish the invalidation of {stock_symbols}: {e}")
@@ -0,0 +1,46 @@
+from datetime import date, timedelta
+from django.core.management.base import BaseCommand, CommandError
+from stocks.services.history import backfill_history
+from stocks.utils import get_last_valid_day
+
+
+class Command(BaseCommand):
+    help = "Stores the daily bars of stocks over a date range from Polygon."
+
+    def add_arguments(self, parser):
+        parser.add_argument("symbols", nargs="+", help="Symbols to backfill.")
+        parser.add_argument(
+            "--from",
+            dest="start_date",
+            type=date.fromisoformat,
+            help="First day to backfill (YYYY-MM-DD). Defaults to a year ago.",
+        )
+        parser.add_argument(
+            "--to",
+            dest="end_date",
+            type=date.fromisoformat,
+            help="Last day to backfill (YYYY-MM-DD). Defaults to the last trading day.",
+        )
+
+    def handle(self, *args, **options):
+        end_date = options["end_date"] or date.fromisoformat(get_last_valid_day())
+        start_date = options["start_date"] or end_date - timedelta(days=365)
+        if start_date > end_date:
+            raise CommandError("--from must not be after --to.")
+
+        failed = 0
+        for symbol in (s.upper() for s in options["symbols"]):
+            try:
+                saved = backfill_history(symbol, start_date, end_date)
+                self.stdout.write(
+                    f"{symbol}: {saved} bars from {start_date} to {end_date}"
+                )
+            except Exception as e:
+                failed += 1
+                self.stdout.write(self.style.ERROR(f"{symbol}: {e}"))
+
+        summary = f"Backfilled {len(options['symbols']) - failed}/{len(options['symbols'])} symbols"
+        if failed:
+            self.stdout.write(self.style.WARNING(summary))
+        else:
+            self.stdout.write(self.style.SUCCESS(summary))
@@ -0,0 +1,61 @@
+from django.core.management.base import BaseCommand, CommandError
+from stocks.services.warmer import warm_stock_cache
+
+
+class Command(BaseCommand):
+    help = "Fills the stock cache with the data of the last trading day."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "symbols",
+            nargs="*",
+            help="Symbols to warm. Defaults to STOCK_WATCHLIST or every stored stock.",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            help="Number of symbols refreshed at the same time.",
+        )
+        parser.add_argument(
+            "--rate-limit",
+            type=float,
+            help="Maximum number of refreshes started per second (0 for no limit).",
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Refresh symbols even if they are already cached for the day.",
+        )
+
+    def handle(self, *args, **options):
+        symbols = [s.upper() for s in options["symbols"]] or None
+
+        results = warm_stock_cache(
+            symbols,
+            workers=options["workers"],
+            rate_limit=options["rate_limit"],
+            force=options["force"],
+            on_result=self.report,
+        )
+
+        failed = [r for r in results if r["status"] == "failed"]
+        total_time = sum(r["elapsed"] for r in results)
+        summary = (
+            f"Warmed {len(results) - len(failed)}/{len(results)} symbols "
+            f"({total_time:.2f}s of refresh time)"
+        )
+        if failed:
+            self.stdout.write(self.style.WARNING(summary))
+            # A non-zero exit status lets schedulers notice the failures
+            raise CommandError(
+                f"Failed to warm {', '.join(r['symbol'] for r in failed)}."
+            )
+        self.stdout.write(self.style.SUCCESS(summary))
+
+    def report(self, result, done, total):
+        line = f"[{done}/{total}] {result['symbol']} {result['status']} in {result['elapsed']:.2f}s"
+        if result["error"]:
+            line = f"{line}: {result['error']}"
+            self.stdout.write(self.style.ERROR(line))
+        else:
+            self.stdout.write(line)
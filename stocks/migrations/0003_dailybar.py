@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("stocks", "0002_alter_stock_request_data"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DailyBar",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField()),
+                ("open_value", models.FloatField(blank=True, default=0.0)),
+                ("high", models.FloatField(blank=True, default=0.0)),
+                ("low", models.FloatField(blank=True, default=0.0)),
+                ("close", models.FloatField(blank=True, default=0.0)),
+                ("volume", models.FloatField(blank=True, null=True)),
+                (
+                    "stock",
+                    models.ForeignKey(
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="daily_bars",
+                        to="stocks.stock",
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("stock", "date"), name="stocks_dailybar_stock_date"
+                    )
+                ],
+            },
+        ),
+    ]
@@ -1,6 +1,20 @@
 from django.db import models
 
 
+class StockQuerySet(models.QuerySet):
+    def with_related(self):
+        """
+        Loads the stock values, performance and competitors needed to serialize
+        a stock, in two queries regardless of the number of competitors.
+        """
+        return self.select_related("stock_values", "performance_data").prefetch_related(
+            models.Prefetch(
+                "competitors",
+                queryset=Competitor.objects.select_related("market_cap"),
+            )
+        )
+
+
 class Stock(models.Model):
     status = models.CharField(max_length=100, blank=True)
     purchased_amount = models.IntegerField(default=0)
@@ -9,6 +23,8 @@ class Stock(models.Model):
     company_code = models.CharField(max_length=20, unique=True)
     company_name = models.CharField(max_length=255, blank=True)
 
+    objects = StockQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.company_name}/{self.company_code}"
 
@@ -59,3 +75,33 @@ class Competitor(models.Model):
 
     def __str__(self):
         return self.name
+
+
+class DailyBar(models.Model):
+    """
+    Open, high, low and close of a stock on one trading day.
+
+    Unlike StockValues, which only holds the latest values, a row is kept for
+    every trading day so that price history can be read without Polygon.
+    """
+
+    # The unique (stock, date) index also serves the lookups by stock.
+    stock = models.ForeignKey(
+        Stock, on_delete=models.CASCADE, related_name="daily_bars", db_index=False
+    )
+    date = models.DateField()
+    open_value = models.FloatField(blank=True, default=0.0)
+    high = models.FloatField(blank=True, default=0.0)
+    low = models.FloatField(blank=True, default=0.0)
+    close = models.FloatField(blank=True, default=0.0)
+    volume = models.FloatField(blank=True, null=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["stock", "date"], name="stocks_dailybar_stock_date"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.stock.company_code} on {self.date}"
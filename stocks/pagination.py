@@ -0,0 +1,20 @@
+from django.conf import settings
+from rest_framework.pagination import CursorPagination
+
+
+class DailyBarPagination(CursorPagination):
+    """
+    Keyset pagination of a stock's daily bars, oldest first.
+
+    The cursor holds the date of the last bar of the page, so every page is
+    read from the (stock, date) index however deep into the history it is.
+    """
+
+    ordering = "date"
+    page_size_query_param = "limit"
+
+    def get_page_size(self, request):
+        # Read from the settings on each request rather than at import.
+        self.page_size = settings.STOCK_HISTORY_PAGE_SIZE
+        self.max_page_size = settings.STOCK_HISTORY_MAX_PAGE_SIZE
+        return super().get_page_size(request)
@@ -1,7 +1,70 @@
 import re
+from functools import lru_cache
 from babel.core import Locale
+from django.conf import settings
 from rest_framework import serializers
-from .models import Stock, StockValues, StockPerformance, Competitor, MarketCap
+from .models import (
+    Stock,
+    StockValues,
+    StockPerformance,
+    Competitor,
+    MarketCap,
+    DailyBar,
+)
+
+
+MARKET_CAP_RE = re.compile(r"([^\d.]+)([\d.].*)")
+SUFFIX_MULTIPLIERS = {"T": 1e12, "B": 1e9, "M": 1e6}
+
+
+@lru_cache(maxsize=None)
+def get_currency_index(locales):
+    """
+    Maps currency symbols to ISO codes for the given locales, built once per
+    tuple of locales. Earlier locales win when they use the same symbol.
+    """
+    index = {}
+    for locale_name in reversed(locales):
+        locale = Locale.parse(locale_name)
+        index.update({symbol: code for code, symbol in locale.currency_symbols.items()})
+    return index
+
+
+def parse_currency_from_symbol(symbol):
+    """
+    Maps a currency symbol to its ISO code.
+    """
+    code = get_currency_index(tuple(settings.MARKET_CAP_LOCALES)).get(symbol)
+    if not code:
+        raise serializers.ValidationError(f"Symbol {symbol} not recognized.")
+    return code
+
+
+def parse_value_from_string(value_str):
+    """
+    Generate a float number from a string
+    """
+    multiplier = SUFFIX_MULTIPLIERS.get(value_str[-1])
+    if multiplier:
+        return float(value_str[:-1]) * multiplier
+    return float(value_str)
+
+
+def parse_market_cap(raw_market_cap):
+    """
+    Parses a scraped market cap such as "$3.1T" into its currency and value,
+    without the cost of a serializer.
+    """
+    match = MARKET_CAP_RE.match(raw_market_cap)
+    if not match:
+        raise serializers.ValidationError(
+            f"Market cap {raw_market_cap} could not be parsed."
+        )
+    symbol, value_str = match.groups()
+    return {
+        "currency": parse_currency_from_symbol(symbol),
+        "value": parse_value_from_string(value_str),
+    }
 
 
 class MarketCapSerializer(serializers.ModelSerializer):
@@ -19,43 +82,9 @@ class MarketCapSerializer(serializers.ModelSerializer):
         raw_market_cap = self.context.get("raw_market_cap", None)
         if not raw_market_cap:
             raise serializers.ValidationError("Market cap data is required.")
-        symbol, value_str = self.get_values_from_string(raw_market_cap)
-
-        data["currency"] = self.parse_currency_from_symbol(symbol)
-        data["value"] = self.parse_value_from_string(value_str)
+        data.update(parse_market_cap(raw_market_cap))
         return data
 
-    def get_values_from_string(self, raw_market_cap):
-        match = re.match(r"([^\d.]+)([\d.].*)", raw_market_cap)
-        if match:
-            return match.group(1), match.group(2)
-        return None, None
-
-    def parse_currency_from_symbol(self, symbol):
-        """
-        Maps symbols to ISO codes using Babel and find the right one.
-        """
-        locale = Locale.parse("en_US")
-        symbols = {symbol: code for code, symbol in locale.currency_symbols.items()}
-
-        symbol = symbols.get(symbol)
-        if not symbol:
-            raise serializers.ValidationError(f"Symbol {symbol} not recognized.")
-        return symbol
-
-    def parse_value_from_string(self, value_str):
-        """
-        Generate a float number from a string
-        """
-        suffix_mapping = {"T": 1e12, "B": 1e9, "M": 1e6}
-
-        if value_str[-1] in suffix_mapping:
-            multiplier = suffix_mapping[value_str[-1]]
-            base_value = float(value_str[:-1])
-            return base_value * multiplier
-        else:
-            return float(value_str)
-
 
 class CompetitorSerializer(serializers.ModelSerializer):
     market_cap_id = serializers.PrimaryKeyRelatedField(
@@ -93,6 +122,12 @@ class StockPerformanceSerializer(serializers.ModelSerializer):
         fields = ["five_days", "one_month", "three_months", "year_to_date", "one_year"]
 
 
+class DailyBarSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = DailyBar
+        fields = ["date", "open_value", "high", "low", "close", "volume"]
+
+
 class StockSerializer(serializers.ModelSerializer):
     stock_values = StockValuesSerializer(required=False, allow_null=True)
     performance_data = StockPerformanceSerializer(required=False, allow_null=True)
@@ -122,5 +157,64 @@ class StockResponseSerializer(serializers.Serializer):
     competitors = serializers.ListField()
 
 
+class StockBatchResponseSerializer(serializers.Serializer):
+    results = StockResponseSerializer(many=True)
+    errors = serializers.DictField(child=serializers.CharField())
+
+
+class StockPurchaseResultSerializer(serializers.Serializer):
+    status = serializers.ChoiceField(choices=["added", "rejected"])
+    symbol = serializers.CharField(required=False)
+    amount = serializers.IntegerField(required=False)
+    purchased_amount = serializers.IntegerField(required=False)
+    error = serializers.CharField(required=False)
+
+
+class StockPurchaseBatchResponseSerializer(serializers.Serializer):
+    results = StockPurchaseResultSerializer(many=True)
+    purchased_amounts = serializers.DictField(child=serializers.IntegerField())
+
+
+class StockHistoryResponseSerializer(serializers.Serializer):
+    next = serializers.URLField(allow_null=True)
+    previous = serializers.URLField(allow_null=True)
+    results = DailyBarSerializer(many=True)
+
+
+class StockAnalyticsResponseSerializer(serializers.Serializer):
+    company_code = serializers.CharField()
+    as_of = serializers.DateField()
+    bars = serializers.IntegerField()
+    returns = serializers.DictField(child=serializers.FloatField(allow_null=True))
+    volatility = serializers.DictField(child=serializers.FloatField(allow_null=True))
+    moving_averages = serializers.DictField(
+        child=serializers.FloatField(allow_null=True)
+    )
+    max_drawdown = serializers.FloatField(allow_null=True)
+
+
+class PositionSerializer(serializers.Serializer):
+    company_code = serializers.CharField()
+    company_name = serializers.CharField()
+    purchased_amount = serializers.IntegerField()
+    request_data = serializers.DateField(allow_null=True)
+    close = serializers.FloatField(allow_null=True)
+    market_value = serializers.FloatField(allow_null=True)
+    day_change = serializers.FloatField(allow_null=True)
+    day_change_percent = serializers.FloatField(allow_null=True)
+    weight = serializers.FloatField(allow_null=True)
+
+
+class PortfolioResponseSerializer(serializers.Serializer):
+    positions = PositionSerializer(many=True)
+    total_market_value = serializers.FloatField()
+    total_day_change = serializers.FloatField()
+    total_day_change_percent = serializers.FloatField(allow_null=True)
+
+
 class StockRequestSerializer(serializers.Serializer):
     amount = serializers.FloatField(help_text="Stock amount (e.g., 10)")
+
+
+class StockPurchaseSerializer(StockRequestSerializer):
+    symbol = serializers.CharField(help_text="Stock symbol (e.g., AAPL)")
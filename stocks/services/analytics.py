@@ -0,0 +1,193 @@
+"""
+Price analytics computed from the stored daily bars.
+
+The closes of every requested stock are loaded with a single query into a
+matrix with one row per stock, right-aligned on each stock's last bar, so
+every metric is computed for all of them at once with NumPy. Windows are
+counted in trading days (bars).
+"""
+
+import logging
+import numpy as np
+from datetime import timedelta
+from ..models import DailyBar
+
+
+logger = logging.getLogger("stocks")
+
+TRADING_DAYS_PER_YEAR = 252
+# Named like the StockPerformance fields scraped from MarketWatch
+RETURN_HORIZONS = {"five_days": 5, "one_month": 21, "three_months": 63, "one_year": 252}
+VOLATILITY_WINDOWS = {"one_month": 21, "three_months": 63}
+SMA_WINDOWS = (20, 50, 200)
+EMA_SPANS = (12, 26)
+
+
+def load_closes(stock_symbols, end_date, lookback_days):
+    """
+    Returns the dates and closes of the stocks' bars over the lookback window,
+    as two (stocks x bars) arrays right-aligned on the last bar of each stock
+    and padded on the left with NaT and NaN.
+    """
+    bars = (
+        DailyBar.objects.filter(
+            stock__company_code__in=stock_symbols,
+            date__gt=end_date - timedelta(days=lookback_days),
+            date__lte=end_date,
+        )
+        .order_by("stock", "date")
+        .values_list("stock__company_code", "date", "close")
+    )
+    series = {stock_symbol: ([], []) for stock_symbol in stock_symbols}
+    for stock_symbol, day, close in bars:
+        series[stock_symbol][0].append(day)
+        series[stock_symbol][1].append(close)
+
+    length = max((len(days) for days, _ in series.values()), default=0)
+    dates = np.full((len(stock_symbols), length), np.datetime64("NaT"), "datetime64[D]")
+    closes = np.full((len(stock_symbols), length), np.nan)
+    for row, stock_symbol in enumerate(stock_symbols):
+        days, values = series[stock_symbol]
+        if days:
+            dates[row, length - len(days) :] = days
+            closes[row, length - len(values) :] = values
+    return dates, closes
+
+
+def nan_rows(closes):
+    return np.full(closes.shape[0], np.nan)
+
+
+def trailing_return(closes, bars):
+    """
+    Percent change of the last close over the previous `bars` bars.
+    """
+    if closes.shape[1] <= bars:
+        return nan_rows(closes)
+    return (closes[:, -1] / closes[:, -1 - bars] - 1) * 100
+
+
+def year_to_date_return(dates, closes):
+    """
+    Percent change of the last close since the last close of the previous year.
+    """
+    year_start = dates[:, -1].astype("datetime64[Y]").astype("datetime64[D]")
+    before_year = dates < year_start[:, None]
+    # Dates are sorted, so the last bar of the previous year is the last match.
+    last_index = closes.shape[1] - 1 - np.argmax(before_year[:, ::-1], axis=1)
+    base = closes[np.arange(closes.shape[0]), last_index]
+    base = np.where(before_year.any(axis=1), base, np.nan)
+    return (closes[:, -1] / base - 1) * 100
+
+
+def volatility(closes, window):
+    """
+    Annualized standard deviation of the daily log returns over the last
+    `window` bars, in percent.
+    """
+    if closes.shape[1] <= window:
+        return nan_rows(closes)
+    returns = np.diff(np.log(closes[:, -window - 1 :]), axis=1)
+    # Rows with missing bars in the window stay NaN.
+    return returns.std(axis=1, ddof=1) * np.sqrt(TRADING_DAYS_PER_YEAR) * 100
+
+
+def simple_moving_average(closes, window):
+    if closes.shape[1] < window:
+        return nan_rows(closes)
+    return closes[:, -window:].mean(axis=1)
+
+
+def exponential_moving_average(closes, span):
+    """
+    Exponential moving average of the whole history at the last bar, with
+    weights normalized over the available bars, as one matrix-vector product.
+    Rows with fewer than `span` bars are NaN.
+    """
+    decay = 1 - 2 / (span + 1)
+    weights = decay ** np.arange(closes.shape[1])[::-1]
+    available = ~np.isnan(closes)
+    average = (np.where(available, closes, 0) @ weights) / (available @ weights)
+    return np.where(available.sum(axis=1) >= span, average, np.nan)
+
+
+def max_drawdown(closes):
+    """
+    Largest fall from a previous peak over the history, in percent.
+    """
+    peaks = np.fmax.accumulate(closes, axis=1)
+    return np.nanmin(closes / peaks - 1, axis=1) * 100
+
+
+def compute_analytics(dates, closes):
+    """
+    Computes every metric for each row of `closes`, returning arrays with one
+    value per row. Rows must hold at least one bar.
+    """
+    # Missing bars propagate as NaN instead of warning.
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return {
+            "returns": {
+                **{
+                    name: trailing_return(closes, bars)
+                    for name, bars in RETURN_HORIZONS.items()
+                },
+                "year_to_date": year_to_date_return(dates, closes),
+            },
+            "volatility": {
+                name: volatility(closes, window)
+                for name, window in VOLATILITY_WINDOWS.items()
+            },
+            "moving_averages": {
+                **{
+                    f"sma_{window}": simple_moving_average(closes, window)
+                    for window in SMA_WINDOWS
+                },
+                **{
+                    f"ema_{span}": exponential_moving_average(closes, span)
+                    for span in EMA_SPANS
+                },
+            },
+            "max_drawdown": max_drawdown(closes),
+        }
+
+
+def select_row(metrics, row):
+    """
+    Picks the values of one row out of the computed metrics, with None instead
+    of NaN for the metrics its history is too short for.
+    """
+    if isinstance(metrics, dict):
+        return {name: select_row(values, row) for name, values in metrics.items()}
+    value = float(metrics[row])
+    return round(value, 4) if np.isfinite(value) else None
+
+
+def get_stock_analytics(stock_symbols, end_date, lookback_days):
+    """
+    Computes the analytics of several stocks from their bars up to `end_date`,
+    in one query and one vectorized pass.
+
+    Returns the analytics of each stock with stored bars in the window.
+    """
+    stock_symbols = list(stock_symbols)
+    dates, closes = load_closes(stock_symbols, end_date, lookback_days)
+
+    rows = [
+        row
+        for row in range(len(stock_symbols))
+        if closes.shape[1] and not np.isnan(closes[row, -1])
+    ]
+    if not rows:
+        return {}
+    metrics = compute_analytics(dates[rows], closes[rows])
+
+    analytics = {}
+    for position, row in enumerate(rows):
+        analytics[stock_symbols[row]] = {
+            "company_code": stock_symbols[row],
+            "as_of": str(dates[row, -1]),
+            "bars": int(np.count_nonzero(~np.isnan(closes[row]))),
+            **select_row(metrics, position),
+        }
+    return analytics
@@ -0,0 +1,157 @@
+"""
+HTTP cache shared by the Lambdas for the pages they fetch upstream.
+
+Every response is stored with its `ETag`, `Last-Modified`, a digest of its
+body and the data parsed from it. The next request for the same URL is sent
+with `If-None-Match`/`If-Modified-Since`, and a `304 Not Modified` answer, or
+a body with the same digest, returns the stored data without parsing again.
+
+The storage is selected with the `HTTP_CACHE_BACKEND` environment variable:
+`file` (under `HTTP_CACHE_DIR`, which survives between the invocations of a
+warm container), `redis` (at `HTTP_CACHE_REDIS_URL`, shared by every
+container) or empty to disable the cache. Like the trading calendar, this
+module is zipped next to the `lambda_function.py` of each Lambda.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from pathlib import Path
+from urllib.parse import urlencode
+
+
+logger = logging.getLogger(__name__)
+
+HTTP_CACHE_BACKEND = os.getenv("HTTP_CACHE_BACKEND", "")
+HTTP_CACHE_DIR = os.getenv("HTTP_CACHE_DIR", "/tmp/http-cache")
+HTTP_CACHE_REDIS_URL = os.getenv("HTTP_CACHE_REDIS_URL", "redis://localhost:6379/0")
+# Seconds an entry is kept, enough to span a trading day
+HTTP_CACHE_TTL = int(os.getenv("HTTP_CACHE_TTL", "86400"))
+
+
+class FileStorage:
+    """
+    Stores each entry as a JSON file in a directory.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = Path(directory or HTTP_CACHE_DIR)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def get(self, key):
+        path = self.directory / f"{key}.json"
+        if not path.exists():
+            return None
+        return json.loads(path.read_text())
+
+    def set(self, key, entry):
+        # Written to a temporary file first so readers never see half an entry.
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, self.directory / f"{key}.json")
+
+
+class RedisStorage:
+    """
+    Stores each entry as a JSON string in Redis, expiring after `ttl` seconds.
+    """
+
+    def __init__(self, url=HTTP_CACHE_REDIS_URL, ttl=HTTP_CACHE_TTL):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+
+    def get(self, key):
+        value = self.client.get(f"http_cache:{key}")
+        return json.loads(value) if value else None
+
+    def set(self, key, entry):
+        self.client.set(f"http_cache:{key}", json.dumps(entry), ex=self.ttl)
+
+
+STORAGES = {
+    "file": FileStorage,
+    "redis": RedisStorage,
+}
+
+
+class HTTPCache:
+    def __init__(self, storage):
+        self.storage = storage
+
+    def get_entry(self, key):
+        try:
+            return self.storage.get(key)
+        except Exception as e:
+            logger.warning(f"Could not read HTTP cache entry {key}: {e}")
+            return None
+
+    def set_entry(self, key, entry):
+        try:
+            self.storage.set(key, entry)
+        except Exception as e:
+            logger.warning(f"Could not write HTTP cache entry {key}: {e}")
+
+    def fetch(self, get, url, read, parse, params=None, **kwargs):
+        """
+        Sends a conditional GET request with `get` and returns the response
+        together with its data, which is None unless the response is a 200
+        or a 304 for a stored entry.
+
+        `read(response)` returns the body as text and `parse(body)` the data
+        to return, which must be serializable to JSON.
+        """
+        key = cache_key(url, params)
+        entry = self.get_entry(key)
+
+        headers = dict(kwargs.pop("headers", None) or {})
+        if entry and entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry and entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        if params is not None:
+            kwargs["params"] = params
+        response = get(url, headers=headers, **kwargs)
+
+        if response.status_code == 304 and entry:
+            response.close()
+            return response, entry["data"]
+        if response.status_code != 200:
+            return response, None
+
+        body = read(response)
+        digest = hashlib.sha256(body.encode()).hexdigest()
+        if entry and entry.get("digest") == digest:
+            data = entry["data"]
+        else:
+            data = parse(body)
+
+        self.set_entry(
+            key,
+            {
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "digest": digest,
+                "data": data,
+            },
+        )
+        return response, data
+
+
+def cache_key(url, params=None):
+    if params:
+        url = f"{url}?{urlencode(sorted(params.items()))}"
+    return hashlib.sha256(url.encode()).hexdigest()
+
+
+def build_http_cache(backend=HTTP_CACHE_BACKEND):
+    """
+    Returns an HTTPCache with the configured storage, or None when disabled.
+    """
+    if not backend:
+        return None
+    return HTTPCache(STORAGES[backend]())
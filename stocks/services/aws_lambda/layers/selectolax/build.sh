@@ -0,0 +1,25 @@
+#!/bin/bash
+
+set -e
+
+LAYER_NAME="selectolax-layer"
+PYTHON_VERSION="python3.10"
+
+echo "Creating directory structure for the layer..."
+rm -rf build python
+mkdir -p python/lib/$PYTHON_VERSION/site-packages
+
+# selectolax is a C extension, so the wheel must match the Lambda runtime
+echo "Installing selectolax into the layer structure..."
+pip install selectolax \
+    --platform manylinux2014_x86_64 \
+    --python-version 3.10 \
+    --only-binary=:all: \
+    -t python/lib/$PYTHON_VERSION/site-packages
+
+echo "Zipping the layer..."
+zip -r ${LAYER_NAME}.zip python
+
+rm -rf python
+
+echo "Build completed. Output: ${LAYER_NAME}.zip"
@@ -1,6 +1,25 @@
+import codecs
 import os
+import re
 import requests
-from bs4 import BeautifulSoup
+from concurrent.futures import ThreadPoolExecutor
+from bs4 import BeautifulSoup, SoupStrainer
+
+try:
+    from ..http_cache import build_http_cache
+except ImportError:
+    # On AWS the shared modules are zipped next to this file.
+    from http_cache import build_http_cache
+
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:
+    LexborHTMLParser = None
+
+try:
+    from lxml import html as lxml_html
+except ImportError:
+    lxml_html = None
 
 
 BRIGHTDATA_USER = os.getenv("BRIGHTDATA_USER")
@@ -13,14 +32,62 @@ PROXIES = {
 
 MARKETWATCH_BASE_URL = "https://www.marketwatch.com/investing/stock/{symbol}"
 
+# Pages scraped at the same time through the proxy by a batch invocation
+MARKETWATCH_MAX_CONCURRENCY = int(os.getenv("MARKETWATCH_MAX_CONCURRENCY", "5"))
+
+# Read the page in chunks and stop downloading once every section was read
+MARKETWATCH_STREAM = os.getenv("MARKETWATCH_STREAM", "true").lower() == "true"
+MARKETWATCH_CHUNK_SIZE = int(os.getenv("MARKETWATCH_CHUNK_SIZE", "16384"))
+
+# (connect, read) timeouts in seconds
+REQUEST_TIMEOUT = (
+    float(os.getenv("MARKETWATCH_CONNECT_TIMEOUT", "3.05")),
+    float(os.getenv("MARKETWATCH_READ_TIMEOUT", "10")),
+)
+
+# One of "selectolax", "lxml", "html.parser" or "auto" for the fastest installed
+MARKETWATCH_PARSER = os.getenv("MARKETWATCH_PARSER", "auto")
+
+COMPANY_NAME_CLASSES = ("company__name",)
+PERFORMANCE_CLASSES = ("element", "element--table", "performance")
+COMPETITORS_CLASSES = ("Competitors",)
+http_cache = build_http_cache()
+
+# Tag and classes of each section read from the page
+SECTIONS = {
+    "company_name": ("h1", COMPANY_NAME_CLASSES),
+    "performance": ("div", PERFORMANCE_CLASSES),
+    "competitors": ("div", COMPETITORS_CLASSES),
+}
+SECTION_CLASSES = {
+    COMPANY_NAME_CLASSES[0],
+    PERFORMANCE_CLASSES[-1],
+    COMPETITORS_CLASSES[0],
+}
+
+# Patterns scanned while streaming, instead of parsing the page
+TAG_CLASS_PATTERN = re.compile(
+    r"<(\w+)[^>]*?\sclass\s*=\s*(?:\"([^\"]*)\"|'([^']*)')", re.IGNORECASE
+)
+SECTION_TAG_PATTERNS = {
+    tag: re.compile(rf"<(/?){tag}\b[^>]*>", re.IGNORECASE)
+    for tag, _ in SECTIONS.values()
+}
+
 
 def lambda_handler(event, context):
     try:
         symbol = event.get("symbol")
-        if not symbol:
-            raise ValueError("'symbol' parameter is required.")
+        symbols = event.get("symbols")
 
-        data = get_marketwatch_data(symbol)
+        if symbols is not None:
+            if not symbols:
+                raise ValueError("'symbols' parameter must not be empty.")
+            data = get_marketwatch_data_many(symbols)
+        elif not symbol:
+            raise ValueError("'symbol' parameter is required.")
+        else:
+            data = get_marketwatch_data(symbol)
 
         return {
             "statusCode": 200,
@@ -38,39 +105,292 @@ def get_marketwatch_data(symbol):
     Scrapes performance and competitors data from the Marketwatch page.
     """
     url = MARKETWATCH_BASE_URL.format(symbol=symbol.lower())
-    response = requests.get(url, proxies=PROXIES, verify=False)
+    read = read_sections if MARKETWATCH_STREAM else (lambda response: response.text)
 
-    if response.status_code != 200:
+    if http_cache is None:
+        response = requests.get(
+            url,
+            proxies=PROXIES,
+            verify=False,
+            stream=MARKETWATCH_STREAM,
+            timeout=REQUEST_TIMEOUT,
+        )
+        data = None
+        if response.status_code == 200:
+            data = parse_marketwatch_page(read(response))
+    else:
+        # A page that didn't change since the last scrape is not parsed again.
+        response, data = http_cache.fetch(
+            requests.get,
+            url,
+            read=read,
+            parse=parse_marketwatch_page,
+            proxies=PROXIES,
+            verify=False,
+            stream=MARKETWATCH_STREAM,
+            timeout=REQUEST_TIMEOUT,
+        )
+
+    if data is None:
+        response.close()
         raise ValueError(f"Could not fetch data from MarketWatch for {symbol}")
 
-    soup = BeautifulSoup(response.text, "html.parser")
-    company_name = soup.find("h1", {"class": "company__name"})
-    if company_name:
-        company_name = company_name.get_text(strip=True)
+    company_name, performance_data, competitors = data
+    return company_name, performance_data, competitors
+
 
-    performance_data = {}
-    performance_table = soup.find(
-        "div", {"class": "element element--table performance"}
+def get_marketwatch_data_many(symbols):
+    """
+    Scrapes several symbols, at most MARKETWATCH_MAX_CONCURRENCY at a time
+    through the proxy. Returns the data of each symbol in `results` and the
+    error of each symbol that failed in `errors`.
+    """
+    results, errors = {}, {}
+    max_workers = min(MARKETWATCH_MAX_CONCURRENCY, len(symbols))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            symbol: executor.submit(get_marketwatch_data, symbol) for symbol in symbols
+        }
+        for symbol, future in futures.items():
+            try:
+                results[symbol] = future.result()
+            except Exception as e:
+                errors[symbol] = str(e)
+    return {"results": results, "errors": errors}
+
+
+class SectionTracker:
+    """
+    Tells when every section of the page was closed, from the HTML fed to it
+    in chunks.
+
+    The page is not parsed: the classes of the pending sections are searched
+    with `str.find`, and tags are only matched inside a section, to find where
+    it closes. Only the text not scanned yet, and a tag cut by the end of a
+    chunk, are kept.
+    """
+
+    def __init__(self):
+        self.pending = dict(SECTIONS)
+        # Section being read, and the nesting of its tag inside it
+        self.current = None
+        self.depth = 0
+        self.buffer = ""
+
+    @property
+    def done(self):
+        return not self.pending and self.current is None
+
+    def feed(self, text):
+        self.buffer += text
+        position = 0
+        while not self.done:
+            if self.current:
+                position = self.scan_section(position)
+                if self.current:
+                    break
+            else:
+                position = self.find_section(position)
+                if position is None:
+                    return
+                if not self.current:
+                    break
+        # Keep an unclosed tag at the end for the next chunk
+        tag_start = self.buffer.rfind("<")
+        if tag_start != -1 and self.buffer.find(">", tag_start) == -1:
+            position = min(position, tag_start)
+        self.buffer = self.buffer[position:]
+
+    def find_section(self, position):
+        """
+        Opens the next pending section found from `position` and returns where
+        it starts, or the end of the text scanned without finding one. Returns
+        None when the tag of a section class is not complete yet.
+        """
+        buffer = self.buffer
+        while True:
+            found = [
+                (index, len(section_classes[-1]))
+                for _, section_classes in self.pending.values()
+                if (index := buffer.find(section_classes[-1], position)) != -1
+            ]
+            if not found:
+                return len(buffer)
+            index, length = min(found)
+            position = index + length
+
+            tag_start = buffer.rfind("<", 0, index)
+            if tag_start == -1 or buffer.find(">", tag_start, index) != -1:
+                # Text, not a tag
+                continue
+            tag_end = buffer.find(">", position)
+            if tag_end == -1:
+                self.buffer = buffer[tag_start:]
+                return None
+
+            tag = TAG_CLASS_PATTERN.match(buffer, tag_start, tag_end + 1)
+            if tag is None:
+                continue
+            classes = (tag.group(2) or tag.group(3) or "").split()
+            for name, (section_tag, section_classes) in self.pending.items():
+                if tag.group(1).lower() == section_tag and set(
+                    section_classes
+                ).issubset(classes):
+                    self.current, self.depth = name, 1
+                    del self.pending[name]
+                    return tag_end + 1
+
+    def scan_section(self, position):
+        """
+        Follows the nesting of the current section's tag from `position` and
+        returns where the section closed, or the end of the text scanned.
+        """
+        pattern = SECTION_TAG_PATTERNS[SECTIONS[self.current][0]]
+        for match in pattern.finditer(self.buffer, position):
+            self.depth += -1 if match.group(1) else 1
+            if not self.depth:
+                self.current = None
+                return match.end()
+        return len(self.buffer)
+
+
+def read_sections(response):
+    """
+    Reads the page until every section was closed, then drops the connection
+    without downloading the rest. Returns the HTML read.
+    """
+    decoder = codecs.getincrementaldecoder(response.encoding or "utf-8")(
+        errors="replace"
     )
-    if performance_table:
-        rows = performance_table.find_all("tr")
-        for row in rows:
-            cells = row.find_all("td")
-            if len(cells) == 2:
-                key = cells[0].get_text(strip=True).lower().replace(" ", "_")
-                value = cells[1].get_text(strip=True).replace("%", "")
-                performance_data[key] = float(value) if value else 0.0
+    tracker = SectionTracker()
+    chunks = []
+    try:
+        for chunk in response.iter_content(chunk_size=MARKETWATCH_CHUNK_SIZE):
+            text = decoder.decode(chunk)
+            chunks.append(text)
+            tracker.feed(text)
+            if tracker.done:
+                break
+        else:
+            chunks.append(decoder.decode(b"", final=True))
+    finally:
+        response.close()
+    return "".join(chunks)
 
-    competitors = []
-    competitors_section = soup.find("div", {"class": "Competitors"})
 
-    if competitors_section:
-        rows = competitors_section.find_all("tr")[1:]
-        for row in rows:
-            cells = row.find_all("td")
-            if len(cells) >= 2:
-                competitor_name = cells[0].get_text(strip=True)
-                market_cap = cells[-1].get_text(strip=True)
-                competitors.append({"name": competitor_name, "market_cap": market_cap})
+def parse_marketwatch_page(html, parser=None):
+    """
+    Extracts the company name, performance data and competitors of a page.
+
+    Only the three sections the API needs are read from the parsed page.
+    """
+    extract_sections = PARSERS[resolve_parser(parser or MARKETWATCH_PARSER)]
+    company_name, performance_rows, competitor_rows = extract_sections(html)
+
+    performance_data = {}
+    for cells in performance_rows:
+        if len(cells) == 2:
+            key = cells[0].lower().replace(" ", "_")
+            value = cells[1].replace("%", "")
+            performance_data[key] = float(value) if value else 0.0
+
+    competitors = []
+    # The first row holds the column headers.
+    for cells in competitor_rows[1:]:
+        if len(cells) >= 2:
+            competitors.append({"name": cells[0], "market_cap": cells[-1]})
 
     return company_name, performance_data, competitors
+
+
+def resolve_parser(name):
+    if name != "auto":
+        if name not in PARSERS or not PARSER_AVAILABLE[name]:
+            raise ValueError(f"HTML parser '{name}' is not available")
+        return name
+    return next(n for n in ("selectolax", "lxml", "html.parser") if PARSER_AVAILABLE[n])
+
+
+def extract_with_selectolax(html):
+    tree = LexborHTMLParser(html)
+
+    def rows(selector):
+        section = tree.css_first(selector)
+        if section is None:
+            return []
+        return [
+            [td.text(strip=True) for td in tr.css("td")] for tr in section.css("tr")
+        ]
+
+    company_name = tree.css_first("h1." + ".".join(COMPANY_NAME_CLASSES))
+    return (
+        company_name.text(strip=True) if company_name is not None else None,
+        rows("div." + ".".join(PERFORMANCE_CLASSES)),
+        rows("div." + ".".join(COMPETITORS_CLASSES)),
+    )
+
+
+def extract_with_lxml(html):
+    tree = lxml_html.fromstring(html)
+
+    def find(tag, classes):
+        conditions = "".join(
+            f"[contains(concat(' ', normalize-space(@class), ' '), ' {c} ')]"
+            for c in classes
+        )
+        found = tree.xpath(f"//{tag}{conditions}")
+        return found[0] if found else None
+
+    def text(element):
+        return "".join(t.strip() for t in element.itertext())
+
+    def rows(section):
+        if section is None:
+            return []
+        return [[text(td) for td in tr.iter("td")] for tr in section.iter("tr")]
+
+    company_name = find("h1", COMPANY_NAME_CLASSES)
+    return (
+        text(company_name) if company_name is not None else None,
+        rows(find("div", PERFORMANCE_CLASSES)),
+        rows(find("div", COMPETITORS_CLASSES)),
+    )
+
+
+def has_section_class(class_value):
+    classes = class_value.split() if isinstance(class_value, str) else class_value
+    return bool(classes) and not SECTION_CLASSES.isdisjoint(classes)
+
+
+def extract_with_html_parser(html):
+    # Only the section tags, and what they contain, are turned into a tree.
+    strainer = SoupStrainer(["h1", "div"], class_=has_section_class)
+    soup = BeautifulSoup(html, "html.parser", parse_only=strainer)
+
+    def rows(section):
+        if section is None:
+            return []
+        return [
+            [td.get_text(strip=True) for td in tr.find_all("td")]
+            for tr in section.find_all("tr")
+        ]
+
+    company_name = soup.find("h1", class_=COMPANY_NAME_CLASSES[0])
+    return (
+        company_name.get_text(strip=True) if company_name else None,
+        rows(soup.find("div", {"class": " ".join(PERFORMANCE_CLASSES)})),
+        rows(soup.find("div", {"class": COMPETITORS_CLASSES[0]})),
+    )
+
+
+PARSERS = {
+    "selectolax": extract_with_selectolax,
+    "lxml": extract_with_lxml,
+    "html.parser": extract_with_html_parser,
+}
+
+PARSER_AVAILABLE = {
+    "selectolax": LexborHTMLParser is not None,
+    "lxml": lxml_html is not None,
+    "html.parser": True,
+}
@@ -1,20 +1,99 @@
+import json
 import os
-from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta, timezone
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    from ..http_cache import build_http_cache
+    from ..trading_calendar import last_trading_day, previous_trading_day
+except ImportError:
+    # On AWS the shared modules are zipped next to this file.
+    from http_cache import build_http_cache
+    from trading_calendar import last_trading_day, previous_trading_day
 
 
 POLYGON_API_URL = "https://api.polygon.io/v1/open-close/{symbol}/{date}"
+POLYGON_AGGS_URL = (
+    "https://api.polygon.io/v2/aggs/ticker/{symbol}/range/1/day/{start}/{end}"
+)
+POLYGON_GROUPED_URL = (
+    "https://api.polygon.io/v2/aggs/grouped/locale/us/market/stocks/{date}"
+)
 API_KEY = os.getenv("POLYGON_API_KEY")
 
+# Use the aggregates endpoint, which returns the latest daily bar in one request
+USE_AGGREGATES = os.getenv("POLYGON_USE_AGGREGATES", "false").lower() == "true"
+# Calendar days searched by the aggregates endpoint, enough for any market closure
+AGGREGATES_LOOKBACK_DAYS = int(os.getenv("POLYGON_AGGREGATES_LOOKBACK_DAYS", "10"))
+
+# (connect, read) timeouts in seconds
+REQUEST_TIMEOUT = (
+    float(os.getenv("POLYGON_CONNECT_TIMEOUT", "3.05")),
+    float(os.getenv("POLYGON_READ_TIMEOUT", "10")),
+)
+MAX_RETRIES = int(os.getenv("POLYGON_MAX_RETRIES", "3"))
+BACKOFF_FACTOR = float(os.getenv("POLYGON_BACKOFF_FACTOR", "0.5"))
+BACKOFF_MAX = float(os.getenv("POLYGON_BACKOFF_MAX", "8"))
+POOL_MAXSIZE = int(os.getenv("POLYGON_POOL_MAXSIZE", "10"))
+# Batches of at least this many symbols fetch the whole market in one request
+GROUPED_MIN_SYMBOLS = int(os.getenv("POLYGON_GROUPED_MIN_SYMBOLS", "20"))
+
+
+def build_session():
+    """
+    Creates the HTTP session shared by every invocation of a warm container.
+
+    The pooled adapter keeps connections to Polygon alive between requests and
+    retries rate limits and server errors with a bounded exponential backoff.
+    """
+    retry = Retry(
+        total=MAX_RETRIES,
+        backoff_factor=BACKOFF_FACTOR,
+        backoff_max=BACKOFF_MAX,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(["GET"]),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=1, pool_maxsize=POOL_MAXSIZE, max_retries=retry
+    )
+
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.headers.update({"Authorization": f"Bearer {API_KEY}"})
+    return session
+
+
+session = build_session()
+http_cache = build_http_cache()
+
 
 def lambda_handler(event, context):
     try:
         symbol = event.get("symbol")
+        symbols = event.get("symbols")
         start_date = event.get("start_date")
-        if not symbol or not start_date:
-            raise ValueError("Both 'symbol' and 'start_date' parameters are required.")
+        end_date = event.get("end_date")
+        use_aggregates = event.get("use_aggregates", USE_AGGREGATES)
 
-        data = get_stock_data(symbol, start_date)
+        if symbols is not None:
+            if not symbols or not start_date:
+                raise ValueError(
+                    "Both 'symbols' and 'start_date' parameters are required."
+                )
+            data = get_stocks_data(symbols, start_date, use_aggregates)
+        elif not symbol or not start_date:
+            raise ValueError("Both 'symbol' and 'start_date' parameters are required.")
+        elif end_date:
+            data = get_daily_bars(symbol, start_date, end_date)
+        elif use_aggregates:
+            data = get_latest_bar(symbol, start_date)
+        else:
+            data = get_stock_data(symbol, start_date)
 
         return {
             "statusCode": 200,
@@ -27,31 +106,169 @@ def lambda_handler(event, context):
         }
 
 
+def fetch_json(url, params=None):
+    """
+    Sends a GET request to Polygon and returns the response with its JSON
+    data, going through the HTTP cache when it's enabled.
+    """
+    if http_cache is None:
+        kwargs = {"params": params} if params else {}
+        response = session.get(url, timeout=REQUEST_TIMEOUT, **kwargs)
+        data = response.json() if response.status_code == 200 else None
+        return response, data
+
+    return http_cache.fetch(
+        session.get,
+        url,
+        read=lambda response: response.text,
+        parse=json.loads,
+        params=params,
+        timeout=REQUEST_TIMEOUT,
+    )
+
+
 def get_stock_data(symbol, start_date):
     """
     Make a request to the Polygon.io API to fetch stock data
+
+    Weekends and exchange holidays are skipped without querying Polygon, so
+    a 404 only happens when the data of a trading day isn't published yet.
     """
     max_retries = 3
     retry_count = 0
-    current_date = start_date
-
-    headers = {"Authorization": f"Bearer {API_KEY}"}
+    current_date = last_trading_day(date.fromisoformat(start_date))
 
     while retry_count <= max_retries:
-        url = POLYGON_API_URL.format(symbol=symbol, date=current_date)
-        response = requests.get(url, headers=headers)
+        url = POLYGON_API_URL.format(symbol=symbol, date=current_date.isoformat())
+        response, data = fetch_json(url)
 
-        if response.status_code == 200:
-            return response.json()
+        if response.status_code in (200, 304):
+            return data
         elif response.status_code == 404:
             retry_count += 1
-            current_date = datetime.strptime(current_date, "%Y-%m-%d") - timedelta(
-                days=1
-            )
-            current_date = current_date.isoformat().split("T")[0]
+            current_date = previous_trading_day(current_date)
         else:
             response.raise_for_status()
 
     raise ValueError(
         f"Stock data not found for {symbol} in the last {max_retries} days."
     )
+
+
+def get_latest_bar(symbol, start_date):
+    """
+    Fetches the latest daily bar up to the given date with a single request
+    to the Polygon.io aggregates endpoint, in the format of the open-close
+    endpoint.
+    """
+    end = date.fromisoformat(start_date)
+    start = end - timedelta(days=AGGREGATES_LOOKBACK_DAYS)
+    url = POLYGON_AGGS_URL.format(
+        symbol=symbol, start=start.isoformat(), end=end.isoformat()
+    )
+    response, data = fetch_json(
+        url, params={"adjusted": "true", "sort": "desc", "limit": 1}
+    )
+    response.raise_for_status()
+
+    results = (data or {}).get("results")
+    if not results:
+        raise ValueError(
+            f"Stock data not found for {symbol} in the last {AGGREGATES_LOOKBACK_DAYS} days."
+        )
+
+    return format_bar(symbol, results[0])
+
+
+def get_daily_bars(symbol, start_date, end_date):
+    """
+    Fetches every daily bar of a symbol between two dates, oldest first, in
+    the format of the open-close endpoint.
+    """
+    url = POLYGON_AGGS_URL.format(symbol=symbol, start=start_date, end=end_date)
+    params = {"adjusted": "true", "sort": "asc", "limit": 50000}
+    bars = []
+    while url:
+        response, data = fetch_json(url, params=params)
+        response.raise_for_status()
+        data = data or {}
+        bars.extend(format_bar(symbol, bar) for bar in data.get("results", []))
+        # Longer ranges are split into pages, whose URL carries the query.
+        url, params = data.get("next_url"), None
+    return bars
+
+
+def format_bar(symbol, bar):
+    """
+    Converts a daily aggregate bar to the format of the open-close endpoint.
+    """
+    # Daily bars start at midnight Eastern Time, which is the same day in UTC.
+    bar_date = datetime.fromtimestamp(bar["t"] / 1000, tz=timezone.utc).date()
+    return {
+        "status": "OK",
+        "from": bar_date.isoformat(),
+        "symbol": symbol,
+        "open": bar["o"],
+        "high": bar["h"],
+        "low": bar["l"],
+        "close": bar["c"],
+        "volume": bar["v"],
+    }
+
+
+def get_grouped_daily(start_date):
+    """
+    Fetches the daily bars of every US stock on the last trading day up to
+    the given date, keyed by ticker.
+    """
+    max_retries = 3
+    retry_count = 0
+    current_date = last_trading_day(date.fromisoformat(start_date))
+
+    while retry_count <= max_retries:
+        url = POLYGON_GROUPED_URL.format(date=current_date.isoformat())
+        response, data = fetch_json(url, params={"adjusted": "true"})
+        response.raise_for_status()
+
+        # The bars of a day are published after the close, until then the
+        # day has no results.
+        results = (data or {}).get("results")
+        if results:
+            return {bar["T"]: bar for bar in results}
+        retry_count += 1
+        current_date = previous_trading_day(current_date)
+
+    raise ValueError(f"Grouped daily data not found in the last {max_retries} days.")
+
+
+def get_stocks_data(symbols, start_date, use_aggregates=False):
+    """
+    Fetches the data of several stocks. Returns the data of each symbol in
+    `results` and the error of each symbol that failed in `errors`.
+
+    Batches of GROUPED_MIN_SYMBOLS or more are read from the grouped daily
+    bars of the whole market in a single request. Smaller ones fetch each
+    symbol on its own, a pool of connections at a time.
+    """
+    results, errors = {}, {}
+
+    if len(symbols) >= GROUPED_MIN_SYMBOLS:
+        bars = get_grouped_daily(start_date)
+        for symbol in symbols:
+            if symbol in bars:
+                results[symbol] = format_bar(symbol, bars[symbol])
+            else:
+                errors[symbol] = f"Stock data not found for {symbol}."
+        return {"results": results, "errors": errors}
+
+    fetch = get_latest_bar if use_aggregates else get_stock_data
+    with ThreadPoolExecutor(max_workers=min(POOL_MAXSIZE, len(symbols))) as executor:
+        futures = {
+            symbol: executor.submit(fetch, symbol, start_date) for symbol in symbols
+        }
+        for symbol, future in futures.items():
+            try:
+                results[symbol] = future.result()
+            except Exception as e:
+                errors[symbol] = str(e)
+    return {"results": results, "errors": errors}
@@ -0,0 +1,130 @@
+"""
+NYSE trading calendar: holidays and early closes.
+
+The calendar is computed from the exchange rules, so it needs no data files or
+network calls, and each year is cached the first time it's used. It only uses
+the standard library, so it is shared by the Django app and zipped next to
+the `lambda_function.py` of the Lambdas that need it.
+"""
+
+from datetime import date, timedelta
+from functools import lru_cache
+
+
+# Unscheduled closures that no rule can predict
+SPECIAL_CLOSURES = {
+    date(2012, 10, 29): "Hurricane Sandy",
+    date(2012, 10, 30): "Hurricane Sandy",
+    date(2018, 12, 5): "National Day of Mourning for George H.W. Bush",
+    date(2025, 1, 9): "National Day of Mourning for Jimmy Carter",
+}
+
+
+def easter_sunday(year):
+    """
+    Returns the date of Easter Sunday (anonymous Gregorian algorithm).
+    """
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return date(year, month, day + 1)
+
+
+def nth_weekday(year, month, weekday, n):
+    """
+    Returns the n-th given weekday of a month, counting from the end when n < 0.
+    """
+    if n > 0:
+        first = date(year, month, 1)
+        return first + timedelta(days=(weekday - first.weekday()) % 7 + 7 * (n - 1))
+    last = date(year + month // 12, month % 12 + 1, 1) - timedelta(days=1)
+    return last - timedelta(days=(last.weekday() - weekday) % 7 + 7 * (-n - 1))
+
+
+def observed(day):
+    """
+    Moves a holiday falling on a weekend to the closest weekday.
+    """
+    if day.weekday() == 5:
+        return day - timedelta(days=1)
+    if day.weekday() == 6:
+        return day + timedelta(days=1)
+    return day
+
+
+@lru_cache(maxsize=None)
+def holidays(year):
+    """
+    Returns the full-day closures of a year, mapped to their names.
+    """
+    closures = {
+        nth_weekday(year, 2, 0, 3): "Washington's Birthday",
+        easter_sunday(year) - timedelta(days=2): "Good Friday",
+        nth_weekday(year, 5, 0, -1): "Memorial Day",
+        observed(date(year, 7, 4)): "Independence Day",
+        nth_weekday(year, 9, 0, 1): "Labor Day",
+        nth_weekday(year, 11, 3, 4): "Thanksgiving Day",
+        observed(date(year, 12, 25)): "Christmas Day",
+    }
+
+    # New Year's Day is not moved back to the last Friday of the previous year.
+    new_year = date(year, 1, 1)
+    if new_year.weekday() != 5:
+        closures[observed(new_year)] = "New Year's Day"
+    if year >= 1998:
+        closures[nth_weekday(year, 1, 0, 3)] = "Martin Luther King, Jr. Day"
+    if year >= 2022:
+        closures[observed(date(year, 6, 19))] = "Juneteenth"
+
+    closures.update({d: name for d, name in SPECIAL_CLOSURES.items() if d.year == year})
+    return closures
+
+
+@lru_cache(maxsize=None)
+def early_closes(year):
+    """
+    Returns the days of a year when the market closes at 1:00 p.m. ET.
+    """
+    closes = {nth_weekday(year, 11, 3, 4) + timedelta(days=1)}
+
+    independence_eve = date(year, 7, 3)
+    if independence_eve.weekday() < 4:
+        closes.add(independence_eve)
+
+    christmas_eve = date(year, 12, 24)
+    if christmas_eve.weekday() < 4:
+        closes.add(christmas_eve)
+
+    return closes - set(holidays(year))
+
+
+def is_trading_day(day):
+    return day.weekday() < 5 and day not in holidays(day.year)
+
+
+def is_early_close(day):
+    return day in early_closes(day.year)
+
+
+def last_trading_day(day):
+    """
+    Returns the given day if the market opens on it, or else the closest
+    trading day before it.
+    """
+    while not is_trading_day(day):
+        day -= timedelta(days=1)
+    return day
+
+
+def previous_trading_day(day):
+    """
+    Returns the closest trading day strictly before the given day.
+    """
+    return last_trading_day(day - timedelta(days=1))
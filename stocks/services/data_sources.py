@@ -0,0 +1,139 @@
+import json
+import logging
+from functools import lru_cache
+from pathlib import Path
+from django.conf import settings
+from django.utils.module_loading import import_string
+from .. import utils
+
+
+logger = logging.getLogger("stocks")
+
+LAMBDA_HANDLERS = {
+    "polygon_data": "stocks.services.aws_lambda.polygon_lambda.lambda_function.lambda_handler",
+    "marketwatch_data": "stocks.services.aws_lambda.marketwatch_lambda.lambda_function.lambda_handler",
+}
+
+
+class BaseDataSource:
+    """
+    Runs an upstream service and returns its response in the Lambda format,
+    a dict with a `statusCode` and a `body`.
+
+    `timeout` is how many seconds the caller waits for the response. Sources
+    that can stop waiting on their own give up after it.
+    """
+
+    def invoke(self, service_name, payload, timeout=None):
+        raise NotImplementedError
+
+
+class LambdaDataSource(BaseDataSource):
+    """
+    Invokes the services deployed on AWS Lambda.
+    """
+
+    def invoke(self, service_name, payload, timeout=None):
+        return utils.invoke_lambda(service_name, payload, timeout=timeout)
+
+
+class LocalDataSource(BaseDataSource):
+    """
+    Calls the Lambda handlers in-process, skipping the AWS round trip.
+
+    Handlers run in the calling thread, so the fetches made through
+    `fetch_data_from_lambdas` still run concurrently in its thread pool.
+    """
+
+    def invoke(self, service_name, payload, timeout=None):
+        handler = import_string(LAMBDA_HANDLERS[service_name])
+        response = handler(payload, None)
+        # Serialize like the Lambda runtime does, so tuples become lists and
+        # non-JSON values fail the same way they would on AWS.
+        return json.loads(json.dumps(response))
+
+
+class FixtureDataSource(BaseDataSource):
+    """
+    Replays Lambda responses saved as JSON files, for offline load tests.
+
+    Responses are read from `<STOCKS_DATA_SOURCE_FIXTURES_DIR>/<service>/<SYMBOL>.json`,
+    falling back to `_default.json` in the same directory. Batch payloads get
+    the response of each symbol gathered in the batch format. Date ranges are
+    read from the list of bars in `<service>/history/<SYMBOL>.json` instead.
+    """
+
+    def __init__(self):
+        self.fixtures_dir = Path(settings.STOCKS_DATA_SOURCE_FIXTURES_DIR)
+
+    @lru_cache(maxsize=None)
+    def load_fixture(self, service_name, symbol):
+        service_dir = self.fixtures_dir / service_name
+        for path in (service_dir / f"{symbol}.json", service_dir / "_default.json"):
+            if path.exists():
+                return path.read_text()
+        return None
+
+    def invoke(self, service_name, payload, timeout=None):
+        if payload.get("symbols") is not None:
+            return self.invoke_batch(service_name, payload)
+
+        symbol = str(payload.get("symbol", "")).upper()
+        if payload.get("end_date"):
+            return self.invoke_range(service_name, symbol, payload)
+
+        fixture = self.load_fixture(service_name, symbol)
+        if fixture is None:
+            return {
+                "statusCode": 500,
+                "body": {"error": f"No fixture for {service_name}/{symbol}"},
+            }
+        # Every call gets its own copy, as the callers may mutate it.
+        return json.loads(fixture)
+
+    def invoke_range(self, service_name, symbol, payload):
+        """
+        Answers a date range payload with the saved bars dated inside it.
+        """
+        fixture = self.load_fixture(f"{service_name}/history", symbol)
+        if fixture is None:
+            return {
+                "statusCode": 500,
+                "body": {"error": f"No history fixture for {service_name}/{symbol}"},
+            }
+        response = json.loads(fixture)
+        if response.get("statusCode") == 200:
+            response["body"] = [
+                bar
+                for bar in response["body"]
+                if payload.get("start_date", "") <= bar["from"] <= payload["end_date"]
+            ]
+        return response
+
+    def invoke_batch(self, service_name, payload):
+        """
+        Answers a batch payload like the Lambdas do, with the body of each
+        symbol in `results` and the error of each failing one in `errors`.
+        """
+        results, errors = {}, {}
+        for symbol in payload["symbols"]:
+            single_payload = {k: v for k, v in payload.items() if k != "symbols"}
+            response = self.invoke(service_name, {**single_payload, "symbol": symbol})
+            if response.get("statusCode") == 200:
+                results[symbol] = response.get("body")
+            else:
+                errors[symbol] = response.get("body", {}).get("error", "Unknown error")
+        return {"statusCode": 200, "body": {"results": results, "errors": errors}}
+
+
+@lru_cache(maxsize=None)
+def load_data_source(path):
+    logger.info(f"Using data source {path}")
+    return import_string(path)()
+
+
+def get_data_source():
+    """
+    Returns the data source selected by the STOCKS_DATA_SOURCE setting.
+    """
+    return load_data_source(settings.STOCKS_DATA_SOURCE)
@@ -0,0 +1,66 @@
+import logging
+from datetime import timedelta
+from django.conf import settings
+from ..models import Stock
+from ..utils import fetch_data_from_lambdas
+from .persistence import build_daily_bar, get_stock_values_data, upsert_daily_bars
+
+
+logger = logging.getLogger("stocks")
+
+# Each invocation fetches at most a year of bars, which keeps its response
+# far below the Lambda payload limit.
+BACKFILL_WINDOW_DAYS = 366
+
+
+def get_backfill_windows(start_date, end_date):
+    """
+    Splits a date range into consecutive windows of BACKFILL_WINDOW_DAYS.
+    """
+    windows = []
+    while start_date <= end_date:
+        window_end = min(
+            start_date + timedelta(days=BACKFILL_WINDOW_DAYS - 1), end_date
+        )
+        windows.append((start_date, window_end))
+        start_date = window_end + timedelta(days=1)
+    return windows
+
+
+def backfill_history(stock_symbol, start_date, end_date):
+    """
+    Stores the daily bars of a stock between two dates, read from Polygon's
+    aggregates, and returns how many were saved.
+
+    Bars already stored are overwritten, so a range can be backfilled again.
+    """
+    stock, _ = Stock.objects.get_or_create(company_code=stock_symbol)
+
+    saved = 0
+    for window_start, window_end in get_backfill_windows(start_date, end_date):
+        results = fetch_data_from_lambdas(
+            {
+                "polygon_data": {
+                    "symbol": stock_symbol,
+                    "start_date": window_start.isoformat(),
+                    "end_date": window_end.isoformat(),
+                }
+            },
+            timeouts={"polygon_data": settings.POLYGON_HISTORY_LAMBDA_TIMEOUT},
+        )
+        bars, error = results["polygon_data"]
+        if error:
+            raise error
+        if not isinstance(bars, list):
+            raise ValueError(
+                f"polygon_data returned {type(bars).__name__} instead of a list of bars"
+            )
+
+        upsert_daily_bars(
+            [build_daily_bar(stock, get_stock_values_data(bar), bar) for bar in bars]
+        )
+        saved += len(bars)
+        logger.info(
+            f"Backfilled {len(bars)} bars of {stock_symbol} from {window_start} to {window_end}"
+        )
+    return saved
@@ -0,0 +1,266 @@
+import logging
+from collections import defaultdict
+from datetime import date
+from django.conf import settings
+from django.db import transaction
+from rest_framework.exceptions import ValidationError
+from ..models import (
+    Competitor,
+    DailyBar,
+    MarketCap,
+    Stock,
+    StockPerformance,
+    StockValues,
+)
+from ..serializers import (
+    StockPerformanceSerializer,
+    StockValuesSerializer,
+    parse_market_cap,
+)
+
+
+logger = logging.getLogger("stocks")
+
+STOCK_VALUES_FIELDS = ["open_value", "high", "low", "close"]
+DAILY_BAR_FIELDS = STOCK_VALUES_FIELDS + ["volume"]
+PERFORMANCE_FIELDS = [
+    "five_days",
+    "one_month",
+    "three_months",
+    "year_to_date",
+    "one_year",
+]
+
+
+def get_stock_values_data(polygon_data):
+    """
+    Maps the Polygon response to the StockValues fields.
+    """
+    return {
+        "open_value": polygon_data.get("open"),
+        "high": polygon_data.get("high"),
+        "low": polygon_data.get("low"),
+        "close": polygon_data.get("close"),
+    }
+
+
+def build_daily_bar(stock, stock_values, polygon_data):
+    """
+    Returns the history row of the validated stock values of a trading day.
+    """
+    return DailyBar(
+        stock=stock,
+        date=date.fromisoformat(polygon_data.get("from")),
+        volume=polygon_data.get("volume"),
+        **stock_values,
+    )
+
+
+def upsert_daily_bars(daily_bars):
+    """
+    Inserts daily bars, overwriting the ones already stored for the same stock
+    and day, in one query per batch.
+    """
+    DailyBar.objects.bulk_create(
+        daily_bars,
+        update_conflicts=True,
+        unique_fields=["stock", "date"],
+        update_fields=DAILY_BAR_FIELDS,
+        batch_size=settings.STOCK_HISTORY_BATCH_SIZE,
+    )
+
+
+def get_performance_data(performance_data):
+    """
+    Maps the MarketWatch performance table to the StockPerformance fields.
+    """
+    return {
+        "five_days": performance_data.get("5_day", 0.0),
+        "one_month": performance_data.get("1_month", 0.0),
+        "three_months": performance_data.get("3_month", 0.0),
+        "year_to_date": performance_data.get("ytd", 0.0),
+        "one_year": performance_data.get("1_year", 0.0),
+    }
+
+
+def parse_competitors(competitors):
+    """
+    Validates the scraped competitors and returns their market caps by name.
+    """
+    market_caps = {}
+    for competitor in competitors:
+        raw_market_cap = competitor.get("market_cap")
+        if not raw_market_cap:
+            raise ValidationError("Market cap data is required.")
+        market_caps[competitor.get("name")] = parse_market_cap(raw_market_cap)
+    return market_caps
+
+
+def validate_data(serializer_class, data):
+    serializer = serializer_class(data=data)
+    serializer.is_valid(raise_exception=True)
+    return serializer.validated_data
+
+
+def build_record(stock_symbol, polygon_data, marketwatch_data):
+    """
+    Validates the upstream data of a stock without touching the database.
+    """
+    record = {
+        "stock": Stock(
+            company_code=stock_symbol,
+            status=polygon_data.get("status") or "",
+            request_data=date.fromisoformat(polygon_data.get("from")),
+        ),
+        "stock_values": validate_data(
+            StockValuesSerializer, get_stock_values_data(polygon_data)
+        ),
+        "performance_data": None,
+        "competitors": None,
+    }
+
+    if marketwatch_data:
+        company_name, performance_data, competitors = marketwatch_data
+        record["stock"].company_name = company_name or ""
+        record["performance_data"] = validate_data(
+            StockPerformanceSerializer, get_performance_data(performance_data)
+        )
+        record["competitors"] = parse_competitors(competitors)
+    return record
+
+
+def get_stored_competitors(stocks):
+    """
+    Returns the stored competitors of each stock id, by name.
+
+    Competitors already prefetched on a stock are reused; the others are
+    loaded with their market caps in a single query.
+    """
+    competitors_by_stock = defaultdict(dict)
+    stocks_to_load = []
+    for stock in stocks:
+        prefetched = getattr(stock, "_prefetched_objects_cache", {})
+        if "competitors" in prefetched:
+            competitors_by_stock[stock.pk] = {
+                c.name: c for c in prefetched["competitors"]
+            }
+        else:
+            stocks_to_load.append(stock)
+
+    if stocks_to_load:
+        stored_competitors = Competitor.objects.select_related("market_cap").filter(
+            stock__in=stocks_to_load
+        )
+        for competitor in stored_competitors:
+            competitors_by_stock[competitor.stock_id][competitor.name] = competitor
+    return competitors_by_stock
+
+
+@transaction.atomic
+def upsert_competitors(competitors_by_stock):
+    """
+    Diffs the incoming competitors of each stock against the stored ones.
+
+    `competitors_by_stock` maps each stock to the market caps of its
+    competitors, keyed by name. Known competitors get their MarketCap updated in
+    place, new ones are bulk inserted and the ones no longer listed are removed,
+    using the same number of queries whatever the number of competitors.
+    """
+    existing_by_stock = get_stored_competitors(competitors_by_stock)
+
+    updated_market_caps, new_market_caps, new_competitors = [], [], []
+    stale_market_cap_ids = []
+    for stock, market_caps in competitors_by_stock.items():
+        existing = existing_by_stock[stock.pk]
+        for name, market_cap_data in market_caps.items():
+            competitor = existing.pop(name, None)
+            if competitor:
+                market_cap = competitor.market_cap
+                if (market_cap.currency, market_cap.value) != (
+                    market_cap_data["currency"],
+                    market_cap_data["value"],
+                ):
+                    market_cap.currency = market_cap_data["currency"]
+                    market_cap.value = market_cap_data["value"]
+                    updated_market_caps.append(market_cap)
+            else:
+                market_cap = MarketCap(**market_cap_data)
+                new_market_caps.append(market_cap)
+                new_competitors.append(
+                    Competitor(stock=stock, name=name, market_cap=market_cap)
+                )
+        stale_market_cap_ids.extend(c.market_cap_id for c in existing.values())
+
+    MarketCap.objects.bulk_update(updated_market_caps, ["currency", "value"])
+    MarketCap.objects.bulk_create(new_market_caps)
+    Competitor.objects.bulk_create(new_competitors)
+    if stale_market_cap_ids:
+        # Deleting the market caps cascades to their competitors.
+        MarketCap.objects.filter(pk__in=stale_market_cap_ids).delete()
+
+
+def save_stocks_data(stocks_data):
+    """
+    Upserts the upstream data of several stocks in one transaction.
+
+    `stocks_data` maps each symbol to its `(polygon_data, marketwatch_data)`
+    tuple, where `marketwatch_data` is None when only Polygon answered; the
+    stored company name, performance and competitors are then kept. Returns a
+    dict with the error of each symbol whose data could not be validated.
+    """
+    records, errors = {}, {}
+    for stock_symbol, (polygon_data, marketwatch_data) in stocks_data.items():
+        try:
+            records[stock_symbol] = build_record(
+                stock_symbol, polygon_data, marketwatch_data
+            )
+        except (ValidationError, TypeError, ValueError) as e:
+            logger.error(f"Invalid upstream data for {stock_symbol}: {e}")
+            errors[stock_symbol] = str(e)
+
+    full_records = [r for r in records.values() if r["competitors"] is not None]
+    partial_records = [r for r in records.values() if r["competitors"] is None]
+
+    with transaction.atomic():
+        Stock.objects.bulk_create(
+            [r["stock"] for r in full_records],
+            update_conflicts=True,
+            unique_fields=["company_code"],
+            update_fields=["status", "request_data", "company_name"],
+        )
+        Stock.objects.bulk_create(
+            [r["stock"] for r in partial_records],
+            update_conflicts=True,
+            unique_fields=["company_code"],
+            update_fields=["status", "request_data"],
+        )
+        StockValues.objects.bulk_create(
+            [
+                StockValues(stock=r["stock"], **r["stock_values"])
+                for r in records.values()
+            ],
+            update_conflicts=True,
+            unique_fields=["stock"],
+            update_fields=STOCK_VALUES_FIELDS,
+        )
+        upsert_daily_bars(
+            [
+                build_daily_bar(
+                    record["stock"], record["stock_values"], stocks_data[symbol][0]
+                )
+                for symbol, record in records.items()
+            ]
+        )
+        StockPerformance.objects.bulk_create(
+            [
+                StockPerformance(stock=r["stock"], **r["performance_data"])
+                for r in full_records
+            ],
+            update_conflicts=True,
+            unique_fields=["stock"],
+            update_fields=PERFORMANCE_FIELDS,
+        )
+        if full_records:
+            upsert_competitors({r["stock"]: r["competitors"] for r in full_records})
+
+    return errors
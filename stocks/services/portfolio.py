@@ -0,0 +1,125 @@
+import logging
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F, OuterRef, Subquery, Sum, Window
+from django.db.models.functions import Coalesce
+from ..models import DailyBar, Stock
+
+
+logger = logging.getLogger("stocks")
+
+PORTFOLIO_CACHE_KEY = "portfolio"
+POSITION_FIELDS = ["company_code", "company_name", "purchased_amount", "request_data"]
+
+
+def get_positions():
+    """
+    Values every purchased stock at its last close in a single query.
+
+    The day change is measured from the previous close stored in the price
+    history, or from the open when there is none. Totals are window sums over
+    every position, so each row also carries its weight in the portfolio.
+    Stocks never refreshed have no close and are left out of the totals.
+    """
+    previous_close = (
+        DailyBar.objects.filter(stock=OuterRef("pk"), date__lt=OuterRef("request_data"))
+        .order_by("-date")
+        .values("close")[:1]
+    )
+    return (
+        Stock.objects.filter(purchased_amount__gt=0)
+        .values(*POSITION_FIELDS)
+        .annotate(
+            close=F("stock_values__close"),
+            previous_close=Coalesce(
+                Subquery(previous_close), F("stock_values__open_value")
+            ),
+            market_value=F("purchased_amount") * F("close"),
+            day_change=F("purchased_amount") * (F("close") - F("previous_close")),
+            total_market_value=Window(Sum("market_value")),
+            total_day_change=Window(Sum("day_change")),
+        )
+        .order_by(F("market_value").desc(nulls_last=True), "company_code")
+    )
+
+
+def to_number(value):
+    return None if value is None else round(value, 4)
+
+
+def percent(part, whole):
+    if part is None or not whole:
+        return None
+    return round(part / whole * 100, 4)
+
+
+def previous_value(market_value, day_change):
+    if market_value is None or day_change is None:
+        return None
+    return market_value - day_change
+
+
+def to_isoformat(day):
+    return None if day is None else day.isoformat()
+
+
+def compute_portfolio():
+    """
+    Returns the valuation of every position and of the whole portfolio.
+    """
+    positions, totals = [], {"total_market_value": 0.0, "total_day_change": 0.0}
+    for row in get_positions():
+        totals = {
+            "total_market_value": row["total_market_value"] or 0.0,
+            "total_day_change": row["total_day_change"] or 0.0,
+        }
+        positions.append(
+            {
+                "company_code": row["company_code"],
+                "company_name": row["company_name"],
+                "purchased_amount": row["purchased_amount"],
+                "request_data": to_isoformat(row["request_data"]),
+                "close": to_number(row["close"]),
+                "market_value": to_number(row["market_value"]),
+                "day_change": to_number(row["day_change"]),
+                "day_change_percent": percent(
+                    row["day_change"],
+                    previous_value(row["market_value"], row["day_change"]),
+                ),
+                "weight": percent(row["market_value"], row["total_market_value"]),
+            }
+        )
+
+    return {
+        "positions": positions,
+        "total_market_value": to_number(totals["total_market_value"]),
+        "total_day_change": to_number(totals["total_day_change"]),
+        "total_day_change_percent": percent(
+            totals["total_day_change"],
+            previous_value(totals["total_market_value"], totals["total_day_change"]),
+        ),
+    }
+
+
+def get_portfolio():
+    """
+    Returns the cached portfolio valuation, computing it on a miss.
+
+    Returns the valuation and whether it came from the cache.
+    """
+    portfolio = cache.get(PORTFOLIO_CACHE_KEY)
+    if portfolio is not None:
+        return portfolio, True
+
+    portfolio = compute_portfolio()
+    cache.set(
+        PORTFOLIO_CACHE_KEY, portfolio, timeout=settings.STOCK_PORTFOLIO_CACHE_TIMEOUT
+    )
+    return portfolio, False
+
+
+def invalidate_portfolio():
+    """
+    Drops the cached valuation after purchases or prices changed.
+    """
+    cache.delete(PORTFOLIO_CACHE_KEY)
@@ -0,0 +1,129 @@
+import logging
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from ..local_cache import cache_stocks, invalidate_stocks
+from ..models import Stock
+from .portfolio import invalidate_portfolio
+
+
+logger = logging.getLogger("stocks")
+
+
+def add_purchased_units(stock_symbol, amount):
+    """
+    Increments the purchased amount of a stock in the database, so concurrent
+    purchases are never lost. Returns whether the stock had to be created.
+    """
+    updated = Stock.objects.filter(company_code=stock_symbol).update(
+        purchased_amount=F("purchased_amount") + amount,
+        purchased_status="active",
+    )
+    if updated:
+        return False
+
+    try:
+        with transaction.atomic():
+            Stock.objects.create(
+                company_code=stock_symbol,
+                purchased_amount=amount,
+                purchased_status="active",
+            )
+        return True
+    except IntegrityError:
+        # Created by a concurrent purchase since the update
+        Stock.objects.filter(company_code=stock_symbol).update(
+            purchased_amount=F("purchased_amount") + amount,
+            purchased_status="active",
+        )
+        return False
+
+
+def patch_cached_purchases(purchased_amounts):
+    """
+    Writes the new purchased amounts into the cached data of the stocks, which
+    otherwise stays valid, instead of dropping it. The cached data is read with
+    one `get_many` and written back with one `set_many`.
+
+    The rendered responses of the stocks whose data is no longer cached are
+    deleted, as they still hold the previous amount.
+    """
+    cached_data = cache.get_many([f"stock_{s}" for s in purchased_amounts])
+    patched, uncached = {}, []
+    for stock_symbol, purchased_amount in purchased_amounts.items():
+        data = cached_data.get(f"stock_{stock_symbol}")
+        if not data:
+            uncached.append(stock_symbol)
+            continue
+        data["purchased_amount"] = purchased_amount
+        data["purchased_status"] = "active"
+        patched[stock_symbol] = data
+    if patched:
+        cache_stocks(patched)
+    if uncached:
+        cache.delete_many([f"stock_json_{s}" for s in uncached])
+        invalidate_stocks(uncached)
+
+
+def record_purchase(stock_symbol, amount):
+    """
+    Adds purchased units to a stock, creating it on its first purchase.
+
+    The cache is patched inside the transaction, while the stock's row is
+    still locked by the increment, so concurrent purchases of a symbol patch
+    it one at a time and the last write holds the final amount.
+
+    Returns the new purchased amount and whether the stock was created.
+    """
+    with transaction.atomic():
+        created = add_purchased_units(stock_symbol, amount)
+        purchased_amount = (
+            Stock.objects.filter(company_code=stock_symbol)
+            .values_list("purchased_amount", flat=True)
+            .get()
+        )
+        patch_cached_purchases({stock_symbol: purchased_amount})
+    invalidate_portfolio()
+    logger.info(f"Purchased {amount} units of {stock_symbol}, now {purchased_amount}")
+    return purchased_amount, created
+
+
+def record_purchases(amounts):
+    """
+    Adds the purchased units of several stocks in one transaction, creating
+    the stocks purchased for the first time.
+
+    `amounts` maps each symbol to its total amount. The stocks are created,
+    locked and incremented with three queries however many there are, and
+    their rows stay locked, in symbol order, while the cache is patched.
+
+    Returns the new purchased amount of each stock.
+    """
+    if not amounts:
+        return {}
+    stock_symbols = sorted(amounts)
+    with transaction.atomic():
+        Stock.objects.bulk_create(
+            [Stock(company_code=s, purchased_status="active") for s in stock_symbols],
+            ignore_conflicts=True,
+        )
+        current_amounts = dict(
+            Stock.objects.filter(company_code__in=stock_symbols)
+            .order_by("company_code")
+            .select_for_update()
+            .values_list("company_code", "purchased_amount")
+        )
+        Stock.objects.filter(company_code__in=stock_symbols).update(
+            purchased_amount=F("purchased_amount")
+            + Case(
+                *[When(company_code=s, then=Value(amounts[s])) for s in stock_symbols],
+                output_field=IntegerField(),
+            ),
+            purchased_status="active",
+        )
+        # The rows are locked, so the amounts read before the update are exact.
+        purchased_amounts = {s: current_amounts[s] + amounts[s] for s in stock_symbols}
+        patch_cached_purchases(purchased_amounts)
+    invalidate_portfolio()
+    logger.info(f"Purchased units of {len(stock_symbols)} stocks in one batch")
+    return purchased_amounts
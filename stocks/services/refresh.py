@@ -0,0 +1,196 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, transaction
+from ..cache import single_flight
+from ..local_cache import cache_stocks
+from ..models import Stock
+from ..serializers import (
+    StockSerializer,
+    StockValuesSerializer,
+    StockPerformanceSerializer,
+)
+from ..utils import fetch_upstream_data
+from .persistence import (
+    build_daily_bar,
+    get_performance_data,
+    get_stock_values_data,
+    parse_competitors,
+    upsert_competitors,
+    upsert_daily_bars,
+)
+from .portfolio import invalidate_portfolio
+
+
+logger = logging.getLogger("stocks")
+
+_refresh_executor = None
+_pending_refreshes = set()
+_refresh_lock = threading.Lock()
+
+
+def get_stock(company_code):
+    return Stock.objects.with_related().filter(company_code=company_code).first()
+
+
+def get_cached_data(cache_key, last_valid_day):
+    """
+    Returns the cached stock data if it is up to date with the last trading day.
+    """
+    cached_data = cache.get(cache_key)
+    if cached_data and last_valid_day == cached_data.get("request_data"):
+        return cached_data
+    return None
+
+
+def create_or_update_stock_data(stock_symbol, company_name, polygon_data):
+    stock = get_stock(stock_symbol)
+
+    if company_name is None:
+        company_name = stock.company_name if stock else ""
+
+    stock_data = {
+        "status": polygon_data.get("status"),
+        "request_data": polygon_data.get("from"),
+        "company_code": stock_symbol,
+        "company_name": company_name,
+    }
+
+    stock_serializer = StockSerializer(instance=stock, data=stock_data)
+    stock_serializer.is_valid(raise_exception=True)
+    return stock_serializer.save()
+
+
+def create_or_update_stock_values(stock, polygon_data):
+    """
+    Updates stock values using the polygon data, and records them in the
+    stock's price history.
+    """
+    stock_values_data = get_stock_values_data(polygon_data)
+
+    stock_values_serializer = StockValuesSerializer(
+        instance=getattr(stock, "stock_values", None), data=stock_values_data
+    )
+    stock_values_serializer.is_valid(raise_exception=True)
+    stock_values_serializer.save(stock=stock)
+    upsert_daily_bars(
+        [build_daily_bar(stock, stock_values_serializer.validated_data, polygon_data)]
+    )
+
+
+def create_or_update_performance_data(stock, performance_data):
+    """
+    Updates stock performance data using the provided data.
+    """
+    stock_performance_data = get_performance_data(performance_data)
+
+    stock_performance_serializer = StockPerformanceSerializer(
+        instance=getattr(stock, "performance_data", None),
+        data=stock_performance_data,
+    )
+    stock_performance_serializer.is_valid(raise_exception=True)
+    stock_performance_serializer.save(stock=stock)
+
+
+def create_or_update_competitors(stock, competitors):
+    """
+    Updates the stock's competitors data.
+    """
+    upsert_competitors({stock: parse_competitors(competitors)})
+
+
+def refresh_stock(stock_symbol, last_valid_day):
+    """
+    Fetches the upstream data of a stock, saves it and caches the result.
+
+    The stock is re-read and cached while its row is locked, as purchases do
+    when they patch the cache, so the cached data never holds a purchased
+    amount older than the last purchase.
+    """
+    logger.info(f"Fetching data for {stock_symbol}")
+    polygon_data, marketwatch_data = fetch_upstream_data(stock_symbol, last_valid_day)
+    company_name = marketwatch_data[0] if marketwatch_data else None
+
+    stock = create_or_update_stock_data(stock_symbol, company_name, polygon_data)
+    create_or_update_stock_values(stock, polygon_data)
+    if marketwatch_data:
+        _, performance_data, competitors = marketwatch_data
+        create_or_update_performance_data(stock, performance_data)
+        create_or_update_competitors(stock, competitors)
+    invalidate_portfolio()
+
+    with transaction.atomic():
+        list(
+            Stock.objects.select_for_update()
+            .filter(pk=stock.pk)
+            .values_list("pk", flat=True)
+        )
+        # Re-read once with everything the serializer needs instead of letting
+        # it lazily query each relation and competitor market cap.
+        stock = get_stock(stock_symbol)
+        stock_serializer = StockSerializer(stock)
+        data = stock_serializer.data
+        # Partial data is served but not cached, so the next request retries
+        # the source that failed.
+        if marketwatch_data:
+            cache_stocks({stock_symbol: data})
+    return data
+
+
+def refresh_stock_once(stock_symbol, last_valid_day):
+    """
+    Refreshes a stock unless another worker is already doing it, in which case
+    the data it cached is returned.
+    """
+    cache_key = f"stock_{stock_symbol}"
+    return single_flight(
+        cache_key,
+        read=lambda: get_cached_data(cache_key, last_valid_day),
+        refresh=lambda: refresh_stock(stock_symbol, last_valid_day),
+    )
+
+
+def get_refresh_executor():
+    """
+    Returns the process-wide thread pool used for background refreshes.
+    """
+    global _refresh_executor
+    with _refresh_lock:
+        if _refresh_executor is None:
+            _refresh_executor = ThreadPoolExecutor(
+                max_workers=settings.STOCK_REFRESH_MAX_WORKERS,
+                thread_name_prefix="stocks-refresh",
+            )
+    return _refresh_executor
+
+
+def run_background_refresh(stock_symbol, last_valid_day):
+    try:
+        refresh_stock_once(stock_symbol, last_valid_day)
+        logger.info(f"Background refresh of {stock_symbol} finished")
+    except Exception as e:
+        logger.error(f"Background refresh of {stock_symbol} failed: {e}")
+    finally:
+        with _refresh_lock:
+            _pending_refreshes.discard(stock_symbol)
+        # Worker threads open their own database connections.
+        connections.close_all()
+
+
+def schedule_refresh(stock_symbol, last_valid_day):
+    """
+    Refreshes a stock in the background and returns whether it was scheduled.
+
+    A symbol already waiting for or running a background refresh in this
+    process is not scheduled again.
+    """
+    with _refresh_lock:
+        if stock_symbol in _pending_refreshes:
+            return False
+        _pending_refreshes.add(stock_symbol)
+
+    get_refresh_executor().submit(run_background_refresh, stock_symbol, last_valid_day)
+    logger.info(f"Background refresh of {stock_symbol} scheduled")
+    return True
@@ -0,0 +1,116 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from django.conf import settings
+from django.db import connections
+from ..models import Stock
+from ..utils import get_last_valid_day
+from .refresh import get_cached_data, refresh_stock, refresh_stock_once
+
+
+logger = logging.getLogger("stocks")
+
+
+class RateLimiter:
+    """
+    Spaces out calls so that at most `rate` of them start per second.
+    """
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self.next_slot = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            slot = max(self.next_slot, now)
+            self.next_slot = slot + self.interval
+        time.sleep(slot - now)
+
+
+def get_tracked_symbols():
+    """
+    Returns the configured watchlist, or every stored stock when it is empty.
+    """
+    if settings.STOCK_WATCHLIST:
+        return [s.upper() for s in settings.STOCK_WATCHLIST]
+    return list(
+        Stock.objects.order_by("company_code").values_list("company_code", flat=True)
+    )
+
+
+def warm_symbol(stock_symbol, last_valid_day, rate_limiter, force):
+    """
+    Refreshes the cached data of a stock and returns its result.
+    """
+    started_at = time.monotonic()
+    try:
+        if not force and get_cached_data(f"stock_{stock_symbol}", last_valid_day):
+            status, error = "cached", None
+        else:
+            rate_limiter.wait()
+            if force:
+                refresh_stock(stock_symbol, last_valid_day)
+            else:
+                refresh_stock_once(stock_symbol, last_valid_day)
+            status, error = "refreshed", None
+    except Exception as e:
+        logger.error(f"Error while warming {stock_symbol}: {e}")
+        status, error = "failed", str(e)
+    finally:
+        # Worker threads open their own database connections.
+        connections.close_all()
+
+    return {
+        "symbol": stock_symbol,
+        "status": status,
+        "error": error,
+        "elapsed": time.monotonic() - started_at,
+    }
+
+
+def warm_stock_cache(
+    stock_symbols=None, workers=None, rate_limit=None, force=False, on_result=None
+):
+    """
+    Fills the stock cache for the new trading day before the market opens.
+
+    Symbols default to `get_tracked_symbols()`. They are refreshed through the
+    same code path as `StockAPIView`, `workers` at a time and starting at most
+    `rate_limit` refreshes per second. Symbols already cached for the day are
+    skipped unless `force` is set. `on_result` is called with the result of
+    each symbol as soon as it's done. Returns the results of every symbol.
+    """
+    if stock_symbols is None:
+        stock_symbols = get_tracked_symbols()
+    workers = workers or settings.STOCK_WARMER_WORKERS
+    if rate_limit is None:
+        rate_limit = settings.STOCK_WARMER_RATE_LIMIT
+
+    last_valid_day = get_last_valid_day()
+    rate_limiter = RateLimiter(rate_limit)
+    logger.info(
+        f"Warming {len(stock_symbols)} symbols for {last_valid_day} with {workers} workers"
+    )
+
+    results = []
+    if not stock_symbols:
+        return results
+
+    with ThreadPoolExecutor(
+        max_workers=workers, thread_name_prefix="stocks-warmer"
+    ) as executor:
+        futures = [
+            executor.submit(warm_symbol, s, last_valid_day, rate_limiter, force)
+            for s in stock_symbols
+        ]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            if on_result:
+                on_result(result, len(results), len(futures))
+    return results
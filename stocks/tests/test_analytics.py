@@ -0,0 +1,143 @@
+import pytest
+from datetime import date, timedelta
+from unittest.mock import patch
+from django.core.cache import cache
+from django.urls import reverse
+from rest_framework.test import APIClient
+from stocks.models import DailyBar, Stock
+from stocks.services import analytics
+from stocks.services.analytics import get_stock_analytics
+from stocks.utils import get_last_valid_day
+
+
+def store_bars(stock_symbol, closes, end_date):
+    """
+    Stores one bar per weekday ending on `end_date` with the given closes.
+    """
+    stock, _ = Stock.objects.get_or_create(company_code=stock_symbol)
+    days, day = [], end_date
+    while len(days) < len(closes):
+        if day.weekday() < 5:
+            days.append(day)
+        day -= timedelta(days=1)
+    DailyBar.objects.bulk_create(
+        [
+            DailyBar(stock=stock, date=day, close=close)
+            for day, close in zip(reversed(days), closes)
+        ]
+    )
+    return list(reversed(days))
+
+
+def reference_ema(closes, span):
+    """Unvectorized exponential moving average with normalized weights"""
+    alpha = 2 / (span + 1)
+    numerator = denominator = 0.0
+    for close in closes:
+        numerator = numerator * (1 - alpha) + close
+        denominator = denominator * (1 - alpha) + 1
+    return numerator / denominator
+
+
+@pytest.mark.django_db
+class TestStockAnalytics:
+    """Tests for the analytics computed from the price history"""
+
+    def test_metrics(self):
+        """Test returns, averages and drawdown against their definitions"""
+        closes = [100.0 * 1.01**i for i in range(300)]
+        closes[150] = closes[149] * 0.5
+        days = store_bars("AAPL", closes, date(2024, 11, 15))
+
+        result = get_stock_analytics(["AAPL"], date(2024, 11, 15), 450)["AAPL"]
+
+        assert result["as_of"] == "2024-11-15"
+        assert result["bars"] == 300
+        assert result["returns"]["five_days"] == pytest.approx(
+            (1.01**5 - 1) * 100, abs=1e-4
+        )
+        assert result["returns"]["one_year"] == pytest.approx(
+            (closes[-1] / closes[-253] - 1) * 100, abs=1e-4
+        )
+        last_of_2023 = max(i for i, day in enumerate(days) if day.year == 2023)
+        assert result["returns"]["year_to_date"] == pytest.approx(
+            (closes[-1] / closes[last_of_2023] - 1) * 100, abs=1e-4
+        )
+        assert result["moving_averages"]["sma_20"] == pytest.approx(
+            sum(closes[-20:]) / 20, abs=1e-4
+        )
+        assert result["moving_averages"]["ema_12"] == pytest.approx(
+            reference_ema(closes, 12), abs=1e-4
+        )
+        # Constant daily growth has no volatility.
+        assert result["volatility"]["one_month"] == pytest.approx(0, abs=1e-4)
+        assert result["max_drawdown"] == pytest.approx(-50.0, abs=1e-4)
+
+    def test_many_stocks_in_one_pass(self, django_assert_num_queries):
+        """Test stocks with histories of different lengths are computed together"""
+        store_bars("AAPL", [float(i) for i in range(1, 31)], date(2024, 11, 15))
+        store_bars("MSFT", [10.0, 11.0, 12.0], date(2024, 11, 14))
+
+        with django_assert_num_queries(1), patch.object(
+            analytics, "compute_analytics", wraps=analytics.compute_analytics
+        ) as compute:
+            results = get_stock_analytics(
+                ["AAPL", "MSFT", "NOPE"], date(2024, 11, 15), 400
+            )
+
+        compute.assert_called_once()
+        assert set(results) == {"AAPL", "MSFT"}
+        assert results["AAPL"]["moving_averages"]["sma_20"] == pytest.approx(20.5)
+        assert results["MSFT"]["as_of"] == "2024-11-14"
+        assert results["MSFT"]["returns"]["five_days"] is None
+        assert results["MSFT"]["moving_averages"]["sma_20"] is None
+        assert results["MSFT"]["max_drawdown"] == 0.0
+
+
+@pytest.mark.django_db
+class TestStockAnalyticsAPIView:
+    """Tests for StockAnalyticsAPIView"""
+
+    def setup_method(self):
+        self.client = APIClient()
+        cache.clear()
+        self.last_valid_day = get_last_valid_day()
+        self.url = reverse("stocks:stock-analytics", kwargs={"stock_symbol": "aapl"})
+
+    @patch("stocks.utils.invoke_lambda")
+    def test_get_analytics_cached_per_trading_day(self, mock_invoke_lambda):
+        """Test analytics up to the last trading day are computed once"""
+        store_bars(
+            "AAPL",
+            [100.0 + i for i in range(30)],
+            date.fromisoformat(self.last_valid_day),
+        )
+
+        response = self.client.get(self.url)
+        assert response.status_code == 200
+        assert response["X-Cache"] == "MISS"
+        assert response.json()["as_of"] == self.last_valid_day
+        assert response.json()["returns"]["five_days"] == pytest.approx(
+            (129 / 124 - 1) * 100, abs=1e-4
+        )
+
+        with patch.object(analytics, "load_closes") as mock_load_closes:
+            response = self.client.get(self.url)
+        assert response["X-Cache"] == "HIT"
+        mock_load_closes.assert_not_called()
+        mock_invoke_lambda.assert_not_called()
+
+    def test_get_analytics_without_last_bar_not_cached(self):
+        """Test analytics missing the last trading day are recomputed"""
+        end_date = date.fromisoformat(self.last_valid_day) - timedelta(days=7)
+        store_bars("AAPL", [100.0, 101.0], end_date)
+
+        assert self.client.get(self.url).status_code == 200
+        assert self.client.get(self.url)["X-Cache"] == "MISS"
+
+    def test_get_analytics_without_history(self):
+        """Test a stock without stored bars is not found"""
+        response = self.client.get(self.url)
+
+        assert response.status_code == 404
+        assert response.json()["error"] == "No price history stored for AAPL."
@@ -0,0 +1,96 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.core.cache import cache
+from django.test import override_settings
+from stocks.cache import cache_lock, single_flight
+
+
+class TestSingleFlight:
+    """Tests for the single-flight refresh of cached data"""
+
+    def setup_method(self):
+        """Start every test with an empty cache"""
+        cache.clear()
+
+    def test_cache_lock_is_exclusive(self):
+        """Test a held lock can't be acquired until it's released"""
+        with cache_lock("lock_test", timeout=5, blocking_timeout=0) as acquired:
+            assert acquired
+            with cache_lock("lock_test", timeout=5, blocking_timeout=0) as other:
+                assert not other
+        with cache_lock("lock_test", timeout=5, blocking_timeout=0) as acquired:
+            assert acquired
+
+    def test_single_flight_refreshes_once(self):
+        """Test concurrent misses on the same key trigger a single refresh"""
+        refresh_calls = []
+        started = threading.Event()
+
+        def refresh():
+            refresh_calls.append(threading.get_ident())
+            started.set()
+            time.sleep(0.3)
+            cache.set("stock_AAPL", {"company_code": "AAPL"})
+            return {"company_code": "AAPL"}
+
+        def request():
+            return single_flight(
+                "stock_AAPL", read=lambda: cache.get("stock_AAPL"), refresh=refresh
+            )
+
+        with ThreadPoolExecutor(max_workers=10) as executor:
+            leader = executor.submit(request)
+            started.wait(timeout=5)
+            followers = [executor.submit(request) for _ in range(9)]
+            results = [leader.result()] + [f.result() for f in followers]
+
+        assert len(refresh_calls) == 1
+        assert all(r == {"company_code": "AAPL"} for r in results)
+
+    def test_single_flight_shares_uncached_results(self):
+        """Test waiting callers get the result of a refresh that cached nothing"""
+        refresh_calls = []
+        started = threading.Event()
+
+        def refresh():
+            refresh_calls.append(threading.get_ident())
+            started.set()
+            time.sleep(0.3)
+            return {"partial": True}
+
+        def request():
+            return single_flight("stock_AAPL", read=lambda: None, refresh=refresh)
+
+        with ThreadPoolExecutor(max_workers=10) as executor:
+            leader = executor.submit(request)
+            started.wait(timeout=5)
+            followers = [executor.submit(request) for _ in range(9)]
+            results = [leader.result()] + [f.result() for f in followers]
+
+        assert len(refresh_calls) == 1
+        assert all(r == {"partial": True} for r in results)
+
+    @override_settings(SINGLE_FLIGHT_RESULT_TIMEOUT=0)
+    def test_single_flight_retries_after_uncached_result_expires(self):
+        """Test a later caller refreshes again once the shared result expired"""
+        calls = []
+
+        def refresh():
+            calls.append(1)
+            return {"partial": True}
+
+        for _ in range(2):
+            assert single_flight("stock_AAPL", read=lambda: None, refresh=refresh)
+        assert len(calls) == 2
+
+    @override_settings(SINGLE_FLIGHT_WAIT_TIMEOUT=0)
+    def test_single_flight_refreshes_when_wait_times_out(self):
+        """Test a caller refreshes on its own when the lock is not released in time"""
+        with cache_lock("lock_stock_AAPL", timeout=5, blocking_timeout=0):
+            data = single_flight(
+                "stock_AAPL",
+                read=lambda: None,
+                refresh=lambda: {"company_code": "AAPL"},
+            )
+        assert data == {"company_code": "AAPL"}
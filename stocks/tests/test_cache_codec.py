@@ -0,0 +1,116 @@
+import pickle
+import pytest
+from datetime import date
+from django.core.exceptions import ImproperlyConfigured
+from django.test import override_settings
+from rest_framework.utils.serializer_helpers import ReturnDict
+from stocks import cache_codec
+from stocks.cache_codec import StockCacheSerializer
+
+
+def stock_data(competitors=10):
+    return {
+        "status": "OK",
+        "request_data": "2024-11-15",
+        "company_code": "AAPL",
+        "company_name": "Apple Inc.",
+        "purchased_amount": 3,
+        "stock_values": {"open": 226.4, "high": 226.92, "low": 224.27, "close": 225.0},
+        "performance_data": {"five_days": 2.29, "one_month": -2.75, "ytd": 19.13},
+        "competitors": [
+            {
+                "name": f"Competitor {i} Inc.",
+                "market_cap": {"currency": "USD", "value": 3.09e12 / (i + 1)},
+            }
+            for i in range(competitors)
+        ],
+    }
+
+
+def make_serializer(codec, compression="none", min_bytes=1024):
+    with override_settings(
+        STOCK_CACHE_CODEC=codec,
+        STOCK_CACHE_COMPRESSION=compression,
+        STOCK_CACHE_COMPRESS_MIN_BYTES=min_bytes,
+    ):
+        try:
+            return StockCacheSerializer({})
+        except ImproperlyConfigured as e:
+            pytest.skip(str(e))
+
+
+class TestStockCacheSerializer:
+    """Tests for the serializer of the Redis cache"""
+
+    @pytest.mark.parametrize("codec", list(cache_codec.CODECS))
+    @pytest.mark.parametrize("compression", list(cache_codec.COMPRESSIONS))
+    def test_round_trip(self, codec, compression):
+        """Test every codec and compression decodes what it encoded"""
+        serializer = make_serializer(codec, compression, min_bytes=0)
+        data = stock_data()
+
+        encoded = serializer.dumps(data)
+
+        assert encoded[:2] == cache_codec.MAGIC + bytes([cache_codec.FORMAT_VERSION])
+        assert serializer.loads(encoded) == data
+
+    def test_compresses_large_values_only(self):
+        """Test values under the threshold are stored uncompressed"""
+        serializer = make_serializer("json", "zlib", min_bytes=1024)
+
+        small = serializer.dumps({"company_code": "AAPL"})
+        large = serializer.dumps(stock_data(competitors=50))
+
+        assert small[3] == cache_codec.COMPRESSIONS["none"][0]
+        assert large[3] == cache_codec.COMPRESSIONS["zlib"][0]
+        assert len(large) < len(pickle.dumps(stock_data(competitors=50)))
+
+    def test_reads_values_written_with_other_settings(self):
+        """Test changing the codec doesn't break the entries already stored"""
+        writer = make_serializer("msgpack", "zstd", min_bytes=0)
+        reader = make_serializer("json")
+
+        assert reader.loads(writer.dumps(stock_data())) == stock_data()
+
+    def test_reads_legacy_pickled_values(self):
+        """Test values pickled by the default django-redis serializer are read"""
+        serializer = make_serializer("json")
+
+        assert serializer.loads(pickle.dumps(stock_data())) == stock_data()
+
+    def test_unknown_format_reads_as_miss(self):
+        """Test values in an unknown format are ignored instead of failing"""
+        serializer = make_serializer("json")
+        encoded = bytearray(serializer.dumps(stock_data()))
+        encoded[1] = cache_codec.FORMAT_VERSION + 1
+
+        assert serializer.loads(bytes(encoded)) is None
+        assert serializer.loads(cache_codec.MAGIC + b"\x01\x7f\x00{}") is None
+
+    @pytest.mark.parametrize("codec", ["json", "orjson"])
+    def test_falls_back_to_pickle(self, codec):
+        """Test values the codec can't encode are pickled"""
+        serializer = make_serializer(codec)
+        value = {"day": date(2024, 11, 15)}
+
+        encoded = serializer.dumps(value)
+
+        assert encoded[2] == cache_codec.CODECS["pickle"][0]
+        assert serializer.loads(encoded) == value
+
+    def test_defaults(self):
+        """Test the values are encoded with orjson and lz4 by default"""
+        serializer = StockCacheSerializer({})
+
+        # Cached stocks are the ReturnDict built by StockSerializer.
+        encoded = serializer.dumps(ReturnDict(stock_data(), serializer=None))
+
+        assert encoded[2] == cache_codec.CODECS["orjson"][0]
+        assert encoded[3] == cache_codec.COMPRESSIONS["lz4"][0]
+        assert serializer.loads(encoded) == stock_data()
+
+    def test_unknown_codec(self):
+        """Test an unknown codec is a configuration error"""
+        with override_settings(STOCK_CACHE_CODEC="yaml"):
+            with pytest.raises(ImproperlyConfigured):
+                StockCacheSerializer({})
@@ -0,0 +1,129 @@
+import pytest
+import time
+from datetime import date
+from io import StringIO
+from unittest.mock import patch
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.test import override_settings
+from stocks.models import Stock
+from stocks.services.warmer import RateLimiter
+from stocks.utils import get_last_valid_day
+
+
+@pytest.mark.django_db
+class TestWarmStockCacheCommand:
+    """Tests for the warm_stock_cache management command"""
+
+    def setup_method(self):
+        """Initialize reusable objects and mocks for tests"""
+        cache.clear()
+        for symbol in ["AAPL", "MSFT", "TSLA"]:
+            Stock.objects.create(company_code=symbol)
+
+        self.refresh_patcher = patch("stocks.services.warmer.refresh_stock_once")
+        self.mock_refresh = self.refresh_patcher.start()
+
+    def teardown_method(self):
+        """Stop the mocks after each test"""
+        self.refresh_patcher.stop()
+
+    @pytest.fixture(autouse=True)
+    def empty_watchlist(self, settings):
+        """Ignore the watchlist configured in the environment"""
+        settings.STOCK_WATCHLIST = []
+
+    def call(self, *args):
+        out = StringIO()
+        call_command("warm_stock_cache", *args, stdout=out)
+        return out.getvalue()
+
+    def test_warms_every_stored_stock(self):
+        """Test the command refreshes every stored stock and reports progress"""
+        output = self.call("--workers", "2")
+
+        refreshed = {c.args[0] for c in self.mock_refresh.call_args_list}
+        assert refreshed == {"AAPL", "MSFT", "TSLA"}
+        assert "[3/3]" in output
+        assert "Warmed 3/3 symbols" in output
+
+    def test_skips_symbols_already_cached(self):
+        """Test the command leaves symbols cached for the day untouched"""
+        cache.set("stock_AAPL", {"request_data": get_last_valid_day()})
+
+        output = self.call()
+        refreshed = {c.args[0] for c in self.mock_refresh.call_args_list}
+        assert refreshed == {"MSFT", "TSLA"}
+        assert "AAPL cached" in output
+
+    @override_settings(STOCK_WATCHLIST=["nvda"])
+    def test_warms_configured_watchlist(self):
+        """Test the command uses the watchlist when it is configured"""
+        self.call()
+        self.mock_refresh.assert_called_once_with("NVDA", get_last_valid_day())
+
+    def test_reports_failed_symbols(self):
+        """Test a failing symbol doesn't stop the others"""
+
+        def refresh(symbol, last_valid_day):
+            if symbol == "MSFT":
+                raise ValueError("polygon_data error")
+
+        self.mock_refresh.side_effect = refresh
+
+        out = StringIO()
+        with pytest.raises(CommandError, match="Failed to warm MSFT"):
+            call_command("warm_stock_cache", "aapl", "msft", stdout=out)
+
+        output = out.getvalue()
+        assert "MSFT failed" in output
+        assert "polygon_data error" in output
+        assert "Warmed 1/2 symbols" in output
+
+
+@pytest.mark.django_db
+class TestBackfillStockHistoryCommand:
+    """Tests for the backfill_stock_history management command"""
+
+    def call(self, *args):
+        out = StringIO()
+        call_command("backfill_stock_history", *args, stdout=out)
+        return out.getvalue()
+
+    @patch("stocks.management.commands.backfill_stock_history.backfill_history")
+    def test_backfills_each_symbol(self, mock_backfill):
+        """Test each symbol is backfilled over the range and failures are reported"""
+
+        def backfill(symbol, start_date, end_date):
+            if symbol == "NOPE":
+                raise ValueError("polygon_data error: not found")
+            return 250
+
+        mock_backfill.side_effect = backfill
+
+        output = self.call("aapl", "nope", "--from", "2024-01-01", "--to", "2024-12-31")
+
+        mock_backfill.assert_any_call("AAPL", date(2024, 1, 1), date(2024, 12, 31))
+        assert "AAPL: 250 bars" in output
+        assert "NOPE: polygon_data error: not found" in output
+        assert "Backfilled 1/2 symbols" in output
+
+
+class TestRateLimiter:
+    """Tests for the warmer rate limiter"""
+
+    def test_spaces_out_calls(self):
+        """Test calls are spaced by the configured rate"""
+        limiter = RateLimiter(20)
+        started_at = time.monotonic()
+        for _ in range(5):
+            limiter.wait()
+        assert time.monotonic() - started_at >= 0.2
+
+    def test_no_limit(self):
+        """Test a rate of zero never waits"""
+        limiter = RateLimiter(0)
+        started_at = time.monotonic()
+        for _ in range(100):
+            limiter.wait()
+        assert time.monotonic() - started_at < 0.1
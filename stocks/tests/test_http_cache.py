@@ -0,0 +1,137 @@
+import json
+import pytest
+from unittest.mock import MagicMock, patch
+from stocks.services.aws_lambda import http_cache
+from stocks.services.aws_lambda.polygon_lambda import lambda_function as polygon_lambda
+
+
+def make_response(status_code, text="", headers=None):
+    response = MagicMock()
+    response.status_code = status_code
+    response.text = text
+    response.headers = headers or {}
+    return response
+
+
+class TestHTTPCache:
+    """Tests for the HTTP cache of the Lambdas"""
+
+    def setup_method(self):
+        self.parse = MagicMock(side_effect=json.loads)
+        self.get = MagicMock()
+
+    def fetch(self, cache, **kwargs):
+        return cache.fetch(
+            self.get,
+            "https://example.com/page",
+            read=lambda response: response.text,
+            parse=self.parse,
+            **kwargs,
+        )
+
+    def test_not_modified_returns_stored_data(self, tmp_path):
+        """Test a 304 answer returns the stored data without parsing"""
+        cache = http_cache.HTTPCache(http_cache.FileStorage(tmp_path))
+        self.get.return_value = make_response(
+            200,
+            '{"close": 152.0}',
+            {"ETag": '"v1"', "Last-Modified": "Fri, 15 Nov 2024 21:00:00 GMT"},
+        )
+        _, data = self.fetch(cache, timeout=5)
+        assert data == {"close": 152.0}
+        assert self.get.call_args.kwargs == {"headers": {}, "timeout": 5}
+
+        self.get.return_value = make_response(304)
+        response, data = self.fetch(cache, timeout=5)
+
+        assert data == {"close": 152.0}
+        assert self.get.call_args.kwargs["headers"] == {
+            "If-None-Match": '"v1"',
+            "If-Modified-Since": "Fri, 15 Nov 2024 21:00:00 GMT",
+        }
+        assert self.parse.call_count == 1
+        response.close.assert_called_once()
+
+    def test_unchanged_body_is_not_parsed_again(self, tmp_path):
+        """Test a body with the same digest reuses the stored data"""
+        cache = http_cache.HTTPCache(http_cache.FileStorage(tmp_path))
+        self.get.return_value = make_response(200, '{"close": 152.0}')
+        self.fetch(cache)
+        _, data = self.fetch(cache)
+        assert data == {"close": 152.0}
+        assert self.parse.call_count == 1
+
+        self.get.return_value = make_response(200, '{"close": 160.0}')
+        _, data = self.fetch(cache)
+        assert data == {"close": 160.0}
+        assert self.parse.call_count == 2
+
+    def test_errors_are_not_stored(self, tmp_path):
+        """Test responses other than a 200 return no data and store nothing"""
+        cache = http_cache.HTTPCache(http_cache.FileStorage(tmp_path))
+        self.get.return_value = make_response(404)
+
+        response, data = self.fetch(cache)
+
+        assert response.status_code == 404
+        assert data is None
+        assert list(tmp_path.iterdir()) == []
+
+    def test_params_are_part_of_the_key(self, tmp_path):
+        """Test the same URL with other query parameters is another entry"""
+        cache = http_cache.HTTPCache(http_cache.FileStorage(tmp_path))
+        self.get.return_value = make_response(200, "[1]", {"ETag": '"v1"'})
+        self.fetch(cache, params={"limit": 1})
+
+        self.fetch(cache, params={"limit": 2})
+
+        assert self.get.call_args.kwargs == {"headers": {}, "params": {"limit": 2}}
+
+    def test_storage_errors_are_ignored(self):
+        """Test a failing storage only disables the cache"""
+        storage = MagicMock()
+        storage.get.side_effect = ConnectionError("Redis is down")
+        storage.set.side_effect = ConnectionError("Redis is down")
+        self.get.return_value = make_response(200, '{"close": 152.0}')
+
+        _, data = self.fetch(http_cache.HTTPCache(storage))
+
+        assert data == {"close": 152.0}
+
+    @patch("redis.Redis.from_url")
+    def test_redis_storage(self, mock_from_url):
+        """Test entries are stored in Redis as JSON with an expiry"""
+        client = mock_from_url.return_value
+        storage = http_cache.RedisStorage("redis://cache:6379/1", ttl=60)
+
+        storage.set("key", {"digest": "abc"})
+        client.set.assert_called_once_with("http_cache:key", '{"digest": "abc"}', ex=60)
+        client.get.return_value = b'{"digest": "abc"}'
+        assert storage.get("key") == {"digest": "abc"}
+        mock_from_url.assert_called_once_with("redis://cache:6379/1")
+
+    def test_build_http_cache(self, tmp_path):
+        """Test the cache is disabled unless a backend is configured"""
+        assert http_cache.build_http_cache("") is None
+        with patch.object(http_cache, "HTTP_CACHE_DIR", str(tmp_path)):
+            cache = http_cache.build_http_cache("file")
+        assert isinstance(cache.storage, http_cache.FileStorage)
+        assert cache.storage.directory == tmp_path
+        with pytest.raises(KeyError):
+            http_cache.build_http_cache("memcached")
+
+    @patch("stocks.services.aws_lambda.polygon_lambda.lambda_function.session.get")
+    def test_polygon_lambda_sends_conditional_requests(self, mock_get, tmp_path):
+        """Test the Polygon Lambda reuses stored data on a 304"""
+        body = {"status": "OK", "from": "2024-11-20", "close": 152.0}
+        mock_get.side_effect = [
+            make_response(200, json.dumps(body), {"ETag": '"v1"'}),
+            make_response(304),
+        ]
+        cache = http_cache.HTTPCache(http_cache.FileStorage(tmp_path))
+
+        with patch.object(polygon_lambda, "http_cache", cache):
+            assert polygon_lambda.get_stock_data("AAPL", "2024-11-20") == body
+            assert polygon_lambda.get_stock_data("AAPL", "2024-11-20") == body
+
+        assert mock_get.call_args.kwargs["headers"] == {"If-None-Match": '"v1"'}
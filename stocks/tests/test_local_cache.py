@@ -0,0 +1,154 @@
+import pytest
+from unittest.mock import MagicMock, patch
+from django.core.cache import cache
+from django.urls import reverse
+from rest_framework.test import APIClient
+from stocks import local_cache
+from stocks.local_cache import CacheMetrics, LocalCache
+from stocks.models import Stock
+from stocks.utils import get_last_valid_day
+
+
+class TestLocalCache:
+    """Tests for the per-process LRU cache"""
+
+    def test_evicts_least_recently_used(self):
+        """Test the oldest unused entry is dropped when the cache is full"""
+        l1 = LocalCache(max_size=2, ttl=60)
+        l1.set("AAPL", "2024-11-15", {"company_code": "AAPL"})
+        l1.set("MSFT", "2024-11-15", {"company_code": "MSFT"})
+        l1.get("AAPL", "2024-11-15")
+        l1.set("TSLA", "2024-11-15", {"company_code": "TSLA"})
+
+        assert l1.get("MSFT", "2024-11-15") is None
+        assert l1.get("AAPL", "2024-11-15") == {"company_code": "AAPL"}
+        assert len(l1) == 2
+
+    def test_entries_expire(self):
+        """Test entries older than the TTL are not returned"""
+        l1 = LocalCache(max_size=2, ttl=60)
+        with patch("stocks.local_cache.time.monotonic", return_value=100.0):
+            l1.set("AAPL", "2024-11-15", {"company_code": "AAPL"})
+        with patch("stocks.local_cache.time.monotonic", return_value=159.0):
+            assert l1.get("AAPL", "2024-11-15") is not None
+        with patch("stocks.local_cache.time.monotonic", return_value=160.0):
+            assert l1.get("AAPL", "2024-11-15") is None
+
+    def test_keyed_by_trading_day(self):
+        """Test data of another trading day is a miss"""
+        l1 = LocalCache(max_size=2, ttl=60)
+        l1.set("AAPL", "2024-11-14", {"company_code": "AAPL"})
+
+        assert l1.get("AAPL", "2024-11-15") is None
+
+    def test_invalidations_from_pubsub(self):
+        """Test the symbols published on the channel are dropped"""
+        l1 = LocalCache(max_size=4, ttl=60)
+        for symbol in ("AAPL", "MSFT", "TSLA"):
+            l1.set(symbol, "2024-11-15", {"company_code": symbol})
+        pubsub = MagicMock()
+        pubsub.listen.return_value = [
+            {"type": "subscribe", "data": 1},
+            {"type": "message", "data": b"AAPL,TSLA"},
+        ]
+
+        local_cache.handle_invalidations(pubsub, l1)
+
+        assert l1.get("AAPL", "2024-11-15") is None
+        assert l1.get("TSLA", "2024-11-15") is None
+        assert l1.get("MSFT", "2024-11-15") is not None
+
+    def test_metrics(self):
+        """Test hit ratios are computed for each tier"""
+        metrics = CacheMetrics()
+        metrics.record("l1", True)
+        metrics.record("l1", False)
+        metrics.record("l1", True)
+        metrics.record("redis", False)
+
+        assert metrics.snapshot() == {
+            "l1": {"hits": 2, "misses": 1, "hit_ratio": 0.6667},
+            "redis": {"hits": 0, "misses": 1, "hit_ratio": 0.0},
+        }
+
+
+@pytest.mark.django_db
+class TestTwoTierCache:
+    """Tests for the local cache in front of Redis"""
+
+    @pytest.fixture(autouse=True)
+    def enable_local_cache(self, settings):
+        settings.STOCK_L1_CACHE_ENABLED = True
+
+    def setup_method(self):
+        self.client = APIClient()
+        cache.clear()
+        local_cache.reset_local_cache()
+        local_cache.metrics.reset()
+        self.last_valid_day = get_last_valid_day()
+        Stock.objects.create(
+            status="OK",
+            purchased_amount=1,
+            request_data=self.last_valid_day,
+            company_code="AAPL",
+            company_name="Apple Inc.",
+        )
+        cache.set(
+            "stock_AAPL",
+            {
+                "company_code": "AAPL",
+                "purchased_amount": 1,
+                "request_data": self.last_valid_day,
+            },
+        )
+
+    def teardown_method(self):
+        local_cache.reset_local_cache()
+        local_cache.metrics.reset()
+
+    def test_hits_are_served_from_the_local_cache(self):
+        """Test a symbol read from Redis once is then served locally"""
+        url = reverse("stocks:stock-detail", args=["AAPL"])
+        self.client.get(url)
+
+        with patch("stocks.local_cache.cache.get") as mock_cache_get:
+            response = self.client.get(url)
+
+        assert response.status_code == 200
+        assert response["X-Cache"] == "HIT"
+        assert response.json()["company_code"] == "AAPL"
+        mock_cache_get.assert_not_called()
+
+        response = self.client.get(reverse("stocks:cache-metrics"))
+        assert response.json()["l1_enabled"] is True
+        assert response.json()["tiers"] == {
+            "l1": {"hits": 1, "misses": 1, "hit_ratio": 0.5},
+            "redis": {"hits": 1, "misses": 0, "hit_ratio": 1.0},
+        }
+
+    def test_purchase_invalidates_the_local_cache(self):
+        """Test a purchase is visible right away and published to other processes"""
+        url = reverse("stocks:stock-detail", args=["AAPL"])
+        self.client.get(url)
+
+        with patch.object(
+            local_cache, "supports_pubsub", return_value=True
+        ), patch.object(local_cache, "get_redis_connection") as mock_connection:
+            self.client.post(url, {"amount": 2}, format="json")
+
+        mock_connection.return_value.publish.assert_called_once_with(
+            local_cache.INVALIDATION_CHANNEL, "AAPL"
+        )
+        assert self.client.get(url).json()["purchased_amount"] == 3
+
+    def test_disabled(self, settings):
+        """Test only Redis is used when the local cache is disabled"""
+        settings.STOCK_L1_CACHE_ENABLED = False
+        url = reverse("stocks:stock-detail", args=["AAPL"])
+        self.client.get(url)
+        self.client.get(url)
+
+        assert local_cache.get_local_cache() is None
+        assert local_cache.metrics.snapshot() == {
+            "redis": {"hits": 2, "misses": 0, "hit_ratio": 1.0},
+        }
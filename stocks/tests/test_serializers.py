@@ -1,5 +1,9 @@
 import pytest
+from django.test import override_settings
+from rest_framework.exceptions import ValidationError
 from stocks.serializers import (
+    get_currency_index,
+    parse_market_cap,
     StockSerializer,
     StockValuesSerializer,
     StockPerformanceSerializer,
@@ -85,3 +89,33 @@ class TestSerializers:
         assert competitor.name == "Google Inc."
         assert competitor.market_cap == self.market_cap
         assert competitor.stock == self.stock
+
+    def test_market_cap_serializer_parses_raw_market_cap(self):
+        """Test MarketCapSerializer parses the scraped market cap string"""
+        serializer = MarketCapSerializer(
+            data={}, context={"raw_market_cap": "₩376.85T"}
+        )
+        assert serializer.is_valid()
+        market_cap = serializer.save()
+        assert market_cap.currency == "KRW"
+        assert market_cap.value == 376.85e12
+
+    def test_parse_market_cap(self):
+        """Test parse_market_cap handles suffixes and rejects unknown values"""
+        assert parse_market_cap("$3.09T") == {"currency": "USD", "value": 3.09e12}
+        assert parse_market_cap("€512M") == {"currency": "EUR", "value": 512e6}
+        assert parse_market_cap("$950") == {"currency": "USD", "value": 950.0}
+
+        with pytest.raises(ValidationError, match="Symbol XX not recognized."):
+            parse_market_cap("XX1.5B")
+        with pytest.raises(ValidationError, match="could not be parsed"):
+            parse_market_cap("N/A")
+
+    @override_settings(MARKET_CAP_LOCALES=["en_US", "en_CA"])
+    def test_currency_index_covers_several_locales(self):
+        """Test the currency index merges locales, the first one having priority"""
+        index = get_currency_index(("en_US", "en_CA"))
+        assert index["$"] == "USD"
+        assert index["US$"] == "USD"
+        assert parse_market_cap("CA$2B")["currency"] == "CAD"
+        assert get_currency_index(("en_US", "en_CA")) is index
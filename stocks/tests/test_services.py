@@ -1,17 +1,72 @@
+import json
 import pytest
 from unittest.mock import patch, MagicMock
+from stocks.services.aws_lambda.polygon_lambda import lambda_function as polygon_lambda
 from stocks.services.aws_lambda.polygon_lambda.lambda_function import get_stock_data
+from stocks.services.aws_lambda.marketwatch_lambda import (
+    lambda_function as marketwatch_lambda,
+)
 from stocks.services.aws_lambda.marketwatch_lambda.lambda_function import (
     get_marketwatch_data,
 )
+from stocks.models import Competitor, DailyBar, MarketCap, Stock
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.test import override_settings
+from stocks.services import refresh
+from stocks.services.data_sources import (
+    FixtureDataSource,
+    load_data_source,
+    LambdaDataSource,
+    LocalDataSource,
+    get_data_source,
+)
+from stocks.utils import fetch_data_from_lambda
+from stocks.services.history import backfill_history, get_backfill_windows
+from stocks.services.persistence import save_stocks_data
 from datetime import date
 
 
+MARKETWATCH_PAGE = """
+<html>
+    <head><title>Mocked MarketWatch</title></head>
+    <body>
+        <h1 class="company__name">Tesla Inc.</h1>
+        <div class="element element--table performance">
+            <table>
+                <tr>
+                    <td>5 Day</td>
+                    <td>-2.68%</td>
+                </tr>
+                <tr>
+                    <td>1 Month</td>
+                    <td>7.21%</td>
+                </tr>
+            </table>
+        </div>
+        <div class="Competitors">
+            <table>
+                <tr>
+                    <th>Name</th>
+                    <th>Chg %</th>
+                    <th>Market Cap</th>
+                </tr>
+                <tr>
+                    <td>Ford Motor Co.</td>
+                    <td>$0.8T</td>
+                </tr>
+            </table>
+        </div>
+    </body>
+</html>
+"""
+
+
 @pytest.mark.django_db
 class TestServices:
     """Tests for external services"""
 
-    @patch("stocks.services.aws_lambda.polygon_lambda.lambda_function.requests.get")
+    @patch("stocks.services.aws_lambda.polygon_lambda.lambda_function.session.get")
     def test_get_stock_data_success(self, mock_requests):
         """Test get_stock_data returns correct data on success"""
         mock_response = MagicMock()
@@ -31,7 +86,7 @@ class TestServices:
         assert stock_data["open"] == 150.0
         assert stock_data["high"] == 155.0
 
-    @patch("stocks.services.aws_lambda.polygon_lambda.lambda_function.requests.get")
+    @patch("stocks.services.aws_lambda.polygon_lambda.lambda_function.session.get")
     def test_get_stock_data_404_retry(self, mock_requests):
         """Test get_stock_data retries on 404 error"""
         mock_response_404 = MagicMock()
@@ -59,7 +114,7 @@ class TestServices:
             == (date.today().replace(day=date.today().day - 1)).isoformat()
         )
 
-    @patch("stocks.services.aws_lambda.polygon_lambda.lambda_function.requests.get")
+    @patch("stocks.services.aws_lambda.polygon_lambda.lambda_function.session.get")
     def test_get_stock_data_fail_after_retries(self, mock_requests):
         """Test get_stock_data raises an error after max retries"""
         mock_response_404 = MagicMock()
@@ -71,40 +126,222 @@ class TestServices:
         ):
             get_stock_data("AAPL", date.today().isoformat())
 
+    @patch("stocks.services.aws_lambda.polygon_lambda.lambda_function.session.get")
+    def test_get_stock_data_uses_timeouts(self, mock_requests):
+        """Test get_stock_data always sets a timeout on its requests"""
+        mock_response = MagicMock()
+        mock_response.status_code = 200
+        mock_response.json.return_value = {"status": "OK"}
+        mock_requests.return_value = mock_response
+
+        get_stock_data("AAPL", "2024-11-20")
+        mock_requests.assert_called_once_with(
+            "https://api.polygon.io/v1/open-close/AAPL/2024-11-20",
+            timeout=polygon_lambda.REQUEST_TIMEOUT,
+        )
+
+    @patch("stocks.services.aws_lambda.polygon_lambda.lambda_function.session.get")
+    def test_get_stock_data_skips_market_holidays(self, mock_requests):
+        """Test get_stock_data never queries a day the market was closed"""
+        mock_response_404 = MagicMock()
+        mock_response_404.status_code = 404
+        mock_response_success = MagicMock()
+        mock_response_success.status_code = 200
+        mock_response_success.json.return_value = {"status": "OK"}
+        mock_requests.side_effect = [mock_response_404, mock_response_success]
+
+        # Sunday after Good Friday 2024
+        get_stock_data("AAPL", "2024-03-31")
+        urls = [call.args[0] for call in mock_requests.call_args_list]
+        assert urls == [
+            "https://api.polygon.io/v1/open-close/AAPL/2024-03-28",
+            "https://api.polygon.io/v1/open-close/AAPL/2024-03-27",
+        ]
+
+    @patch("stocks.services.aws_lambda.polygon_lambda.lambda_function.session.get")
+    def test_get_latest_bar_uses_one_request(self, mock_requests):
+        """Test get_latest_bar maps the latest aggregate to the open-close format"""
+        mock_response = MagicMock()
+        mock_response.status_code = 200
+        mock_response.json.return_value = {
+            "status": "OK",
+            "resultsCount": 1,
+            "results": [
+                {
+                    "o": 226.4,
+                    "h": 226.92,
+                    "l": 224.27,
+                    "c": 225.0,
+                    "v": 45374616,
+                    # 2024-11-15 00:00 America/New_York
+                    "t": 1731646800000,
+                }
+            ],
+        }
+        mock_requests.return_value = mock_response
+
+        response = polygon_lambda.lambda_handler(
+            {"symbol": "AAPL", "start_date": "2024-11-17", "use_aggregates": True},
+            None,
+        )
+
+        assert response["statusCode"] == 200
+        assert response["body"] == {
+            "status": "OK",
+            "from": "2024-11-15",
+            "symbol": "AAPL",
+            "open": 226.4,
+            "high": 226.92,
+            "low": 224.27,
+            "close": 225.0,
+            "volume": 45374616,
+        }
+        mock_requests.assert_called_once_with(
+            "https://api.polygon.io/v2/aggs/ticker/AAPL/range/1/day/2024-11-07/2024-11-17",
+            params={"adjusted": "true", "sort": "desc", "limit": 1},
+            timeout=polygon_lambda.REQUEST_TIMEOUT,
+        )
+
+    @patch("stocks.services.aws_lambda.polygon_lambda.lambda_function.session.get")
+    def test_get_latest_bar_without_results(self, mock_requests):
+        """Test get_latest_bar raises an error when Polygon has no bars"""
+        mock_response = MagicMock()
+        mock_response.status_code = 200
+        mock_response.json.return_value = {"status": "OK", "resultsCount": 0}
+        mock_requests.return_value = mock_response
+
+        with pytest.raises(ValueError, match="Stock data not found for AAPL"):
+            polygon_lambda.get_latest_bar("AAPL", "2024-11-17")
+
+    @patch("stocks.services.aws_lambda.polygon_lambda.lambda_function.session.get")
+    def test_polygon_batch_uses_grouped_daily(self, mock_requests):
+        """Test large batches fetch the whole market in one request per day"""
+        empty_day = MagicMock(status_code=200)
+        empty_day.json.return_value = {"status": "OK", "resultsCount": 0}
+        grouped = MagicMock(status_code=200)
+        grouped.json.return_value = {
+            "status": "OK",
+            "results": [
+                # 2024-11-15 00:00 America/New_York
+                {
+                    "T": t,
+                    "o": 1.0,
+                    "h": 2.0,
+                    "l": 0.5,
+                    "c": 1.5,
+                    "v": 100,
+                    "t": 1731646800000,
+                }
+                for t in ("AAPL", "MSFT", "TSLA")
+            ],
+        }
+        mock_requests.side_effect = [empty_day, grouped]
+
+        with patch.object(polygon_lambda, "GROUPED_MIN_SYMBOLS", 2):
+            response = polygon_lambda.lambda_handler(
+                {"symbols": ["AAPL", "MSFT", "NOPE"], "start_date": "2024-11-18"},
+                None,
+            )
+
+        assert response["statusCode"] == 200
+        assert response["body"]["results"]["MSFT"] == {
+            "status": "OK",
+            "from": "2024-11-15",
+            "symbol": "MSFT",
+            "open": 1.0,
+            "high": 2.0,
+            "low": 0.5,
+            "close": 1.5,
+            "volume": 100,
+        }
+        assert set(response["body"]["results"]) == {"AAPL", "MSFT"}
+        assert response["body"]["errors"] == {"NOPE": "Stock data not found for NOPE."}
+        urls = [call.args[0] for call in mock_requests.call_args_list]
+        assert urls == [
+            "https://api.polygon.io/v2/aggs/grouped/locale/us/market/stocks/2024-11-18",
+            "https://api.polygon.io/v2/aggs/grouped/locale/us/market/stocks/2024-11-15",
+        ]
+
+    @patch("stocks.services.aws_lambda.polygon_lambda.lambda_function.session.get")
+    def test_polygon_history_follows_next_url(self, mock_requests):
+        """Test history mode returns the bars of every page of the range"""
+
+        def page(day, next_url=None):
+            response = MagicMock(status_code=200)
+            response.json.return_value = {
+                "status": "OK",
+                "results": [
+                    {"o": 1.0, "h": 2.0, "l": 0.5, "c": 1.5, "v": 100, "t": day}
+                ],
+                **({"next_url": next_url} if next_url else {}),
+            }
+            return response
+
+        next_url = "https://api.polygon.io/v2/aggs/ticker/AAPL/range/1/day/x/y?cursor=c"
+        # 2024-11-14 and 2024-11-15 00:00 America/New_York
+        mock_requests.side_effect = [
+            page(1731560400000, next_url),
+            page(1731646800000),
+        ]
+
+        response = polygon_lambda.lambda_handler(
+            {"symbol": "AAPL", "start_date": "2024-11-14", "end_date": "2024-11-15"},
+            None,
+        )
+
+        assert response["statusCode"] == 200
+        assert [bar["from"] for bar in response["body"]] == [
+            "2024-11-14",
+            "2024-11-15",
+        ]
+        first, second = mock_requests.call_args_list
+        assert first.args[0] == (
+            "https://api.polygon.io/v2/aggs/ticker/AAPL/range/1/day/2024-11-14/2024-11-15"
+        )
+        assert first.kwargs["params"]["sort"] == "asc"
+        assert second.args[0] == next_url
+        assert "params" not in second.kwargs
+
+    @patch("stocks.services.aws_lambda.polygon_lambda.lambda_function.get_stock_data")
+    def test_polygon_small_batch_fetches_each_symbol(self, mock_get_stock_data):
+        """Test small batches fetch each symbol and report their errors"""
+
+        def get_stock_data(symbol, start_date):
+            if symbol == "NOPE":
+                raise ValueError("Stock data not found for NOPE in the last 3 days.")
+            return {"status": "OK", "symbol": symbol, "from": start_date}
+
+        mock_get_stock_data.side_effect = get_stock_data
+
+        response = polygon_lambda.lambda_handler(
+            {"symbols": ["AAPL", "NOPE"], "start_date": "2024-11-15"}, None
+        )
+
+        assert response["body"] == {
+            "results": {
+                "AAPL": {"status": "OK", "symbol": "AAPL", "from": "2024-11-15"}
+            },
+            "errors": {"NOPE": "Stock data not found for NOPE in the last 3 days."},
+        }
+
+    def test_polygon_session_pools_and_retries(self):
+        """Test the shared session keeps connections alive and retries rate limits"""
+        adapter = polygon_lambda.session.get_adapter("https://api.polygon.io")
+        assert adapter._pool_maxsize == polygon_lambda.POOL_MAXSIZE
+        assert adapter.max_retries.total == polygon_lambda.MAX_RETRIES
+        assert 429 in adapter.max_retries.status_forcelist
+        assert 503 in adapter.max_retries.status_forcelist
+        assert 404 not in adapter.max_retries.status_forcelist
+        assert adapter.max_retries.get_backoff_time() <= polygon_lambda.BACKOFF_MAX
+        assert polygon_lambda.session.headers["Authorization"].startswith("Bearer")
+
     @patch("stocks.services.aws_lambda.marketwatch_lambda.lambda_function.requests.get")
     def test_get_marketwatch_data_success(self, mock_requests):
         """Test get_marketwatch_data parses HTML and returns correct data"""
         mock_response = MagicMock()
         mock_response.status_code = 200
-        mock_response.text = """
-        <html>
-            <head><title>Mocked MarketWatch</title></head>
-            <body>
-                <h1 class="company__name">Tesla Inc.</h1>
-                <div class="element element--table performance">
-                    <tr>
-                        <td>5 Day</td>
-                        <td>-2.68%</td>
-                    </tr>
-                    <tr>
-                        <td>1 Month</td>
-                        <td>7.21%</td>
-                    </tr>
-                </div>
-                <div class="Competitors">
-                    <tr>
-                        <th>Name</th>
-                        <th>Chg %</th>
-                        <th>Market Cap</th>
-                    </tr>
-                    <tr>
-                        <td>Ford Motor Co.</td>
-                        <td>$0.8T</td>
-                    </tr>
-                </div>
-            </body>
-        </html>
-        """
+        mock_response.encoding = "utf-8"
+        mock_response.iter_content.return_value = [MARKETWATCH_PAGE.encode()]
         mock_requests.return_value = mock_response
 
         name, performance, competitors = get_marketwatch_data("TSLA")
@@ -115,6 +352,129 @@ class TestServices:
         assert competitors[0]["name"] == "Ford Motor Co."
         assert competitors[0]["market_cap"] == "$0.8T"
 
+    @patch("stocks.services.aws_lambda.marketwatch_lambda.lambda_function.requests.get")
+    def test_get_marketwatch_data_stops_after_sections(self, mock_requests):
+        """Test the page stops downloading once every section was read"""
+        page = MARKETWATCH_PAGE.replace(
+            "<td>Ford Motor Co.</td>", "<td>Ford <div>Motor</div> Café</td>"
+        ).encode()
+        end_of_sections = page.index(b"</body>")
+        read = []
+
+        def iter_content(chunk_size):
+            # Small chunks split tags and multi-byte characters across reads
+            for start in range(0, len(page), 7):
+                read.append(start)
+                yield page[start : start + 7]
+
+        mock_response = MagicMock()
+        mock_response.status_code = 200
+        mock_response.encoding = "utf-8"
+        mock_response.iter_content.side_effect = iter_content
+        mock_requests.return_value = mock_response
+
+        name, performance, competitors = get_marketwatch_data("TSLA")
+
+        assert name == "Tesla Inc."
+        assert performance == {"5_day": -2.68, "1_month": 7.21}
+        assert competitors == [{"name": "FordMotorCafé", "market_cap": "$0.8T"}]
+        assert read[-1] < end_of_sections
+        mock_response.close.assert_called_once()
+        assert mock_requests.call_args.kwargs["stream"] is True
+        assert (
+            mock_requests.call_args.kwargs["timeout"]
+            == marketwatch_lambda.REQUEST_TIMEOUT
+        )
+
+    @patch(
+        "stocks.services.aws_lambda.marketwatch_lambda.lambda_function.MARKETWATCH_STREAM",
+        False,
+    )
+    @patch("stocks.services.aws_lambda.marketwatch_lambda.lambda_function.requests.get")
+    def test_get_marketwatch_data_without_streaming(self, mock_requests):
+        """Test the whole page is downloaded when streaming is disabled"""
+        mock_response = MagicMock()
+        mock_response.status_code = 200
+        mock_response.text = MARKETWATCH_PAGE
+        mock_requests.return_value = mock_response
+
+        name, _, competitors = get_marketwatch_data("TSLA")
+
+        assert name == "Tesla Inc."
+        assert competitors == [{"name": "Ford Motor Co.", "market_cap": "$0.8T"}]
+        mock_response.iter_content.assert_not_called()
+
+    def test_section_tracker_waits_for_missing_sections(self):
+        """Test the tracker is only done once all the sections were closed"""
+        tracker = marketwatch_lambda.SectionTracker()
+        tracker.feed('<h1 class="company__name">Tesla</h1>')
+        tracker.feed('<div class="Competitors"><div><br></div>')
+        assert not tracker.done
+        tracker.feed('</div><div class="performance">')
+        assert not tracker.done
+        tracker.feed('</div><div class="element element--table performance"><p>')
+        assert not tracker.done
+        tracker.feed("</p></div>")
+        assert tracker.done
+
+    @pytest.mark.parametrize(
+        "parser",
+        [
+            name
+            for name, available in marketwatch_lambda.PARSER_AVAILABLE.items()
+            if available
+        ],
+    )
+    def test_parse_marketwatch_page_parsers_agree(self, parser):
+        """Test every installed HTML parser extracts the same data"""
+        page = MARKETWATCH_PAGE.replace(
+            "<td>Ford Motor Co.</td>",
+            "<td> Ford <!-- ticker --><span>Motor Co.</span> </td>",
+        )
+
+        assert marketwatch_lambda.parse_marketwatch_page(page, parser=parser) == (
+            "Tesla Inc.",
+            {"5_day": -2.68, "1_month": 7.21},
+            [{"name": "FordMotor Co.", "market_cap": "$0.8T"}],
+        )
+
+    def test_parse_marketwatch_page_missing_sections(self):
+        """Test a page without the expected sections returns empty data"""
+        assert marketwatch_lambda.parse_marketwatch_page(
+            "<html><body><p>Not found</p></body></html>"
+        ) == (None, {}, [])
+
+    def test_parse_marketwatch_page_unknown_parser(self):
+        """Test an unavailable parser is reported"""
+        with pytest.raises(ValueError, match="HTML parser 'html5lib' is not available"):
+            marketwatch_lambda.parse_marketwatch_page(MARKETWATCH_PAGE, "html5lib")
+
+    @patch("stocks.services.aws_lambda.marketwatch_lambda.lambda_function.requests.get")
+    def test_marketwatch_batch_reports_errors_per_symbol(self, mock_requests):
+        """Test a batch scrape keeps the symbols that did not fail"""
+
+        def get(url, **kwargs):
+            response = MagicMock()
+            response.status_code = 404 if url.endswith("/nope") else 200
+            response.encoding = "utf-8"
+            response.iter_content.return_value = [MARKETWATCH_PAGE.encode()]
+            return response
+
+        mock_requests.side_effect = get
+
+        with patch.object(marketwatch_lambda, "MARKETWATCH_MAX_CONCURRENCY", 2):
+            response = marketwatch_lambda.lambda_handler(
+                {"symbols": ["TSLA", "NOPE", "F"]}, None
+            )
+
+        assert response["statusCode"] == 200
+        assert set(response["body"]["results"]) == {"TSLA", "F"}
+        assert response["body"]["results"]["F"][0] == "Tesla Inc."
+        assert response["body"]["errors"] == {
+            "NOPE": "Could not fetch data from MarketWatch for NOPE"
+        }
+        assert mock_requests.call_count == 3
+
     @patch("stocks.services.aws_lambda.marketwatch_lambda.lambda_function.requests.get")
     def test_get_marketwatch_data_404(self, mock_requests):
         """Test get_marketwatch_data handles 404 error"""
@@ -126,3 +486,337 @@ class TestServices:
             ValueError, match="Could not fetch data from MarketWatch for TSLA"
         ):
             get_marketwatch_data("TSLA")
+
+
+@pytest.mark.django_db
+class TestPersistence:
+    """Tests for the bulk persistence of upstream data"""
+
+    def polygon_data(self, close=152.0):
+        return {
+            "status": "OK",
+            "open": 150.0,
+            "high": 155.0,
+            "low": 145.0,
+            "close": close,
+            "from": date.today().isoformat(),
+        }
+
+    def test_save_stocks_data_creates_rows(self):
+        """Test save_stocks_data creates every row of new stocks"""
+        errors = save_stocks_data(
+            {
+                "AAPL": (
+                    self.polygon_data(),
+                    [
+                        "Apple Inc.",
+                        {"5_day": 1.5},
+                        [{"name": "Microsoft Corp.", "market_cap": "$3.1T"}],
+                    ],
+                ),
+                "MSFT": (self.polygon_data(), None),
+            }
+        )
+        assert errors == {}
+
+        apple = Stock.objects.with_related().get(company_code="AAPL")
+        assert apple.company_name == "Apple Inc."
+        assert apple.stock_values.close == 152.0
+        assert apple.performance_data.five_days == 1.5
+        assert apple.competitors.get().market_cap.value == 3.1e12
+
+        microsoft = Stock.objects.get(company_code="MSFT")
+        assert microsoft.company_name == ""
+        assert microsoft.stock_values.close == 152.0
+
+    def test_save_stocks_data_updates_rows_in_place(self):
+        """Test save_stocks_data updates existing rows without orphaning market caps"""
+        marketwatch_data = [
+            "Apple Inc.",
+            {},
+            [
+                {"name": "Microsoft Corp.", "market_cap": "$3.1T"},
+                {"name": "HP Inc.", "market_cap": "$35B"},
+            ],
+        ]
+        save_stocks_data({"AAPL": (self.polygon_data(), marketwatch_data)})
+        stock = Stock.objects.get(company_code="AAPL")
+        stock.purchased_amount = 10
+        stock.save()
+
+        marketwatch_data[2] = [
+            {"name": "Microsoft Corp.", "market_cap": "$3.2T"},
+            {"name": "Sony Group Corp.", "market_cap": "¥18.31T"},
+        ]
+        save_stocks_data({"AAPL": (self.polygon_data(close=160.0), marketwatch_data)})
+
+        stock = Stock.objects.with_related().get(company_code="AAPL")
+        assert stock.purchased_amount == 10
+        assert stock.stock_values.close == 160.0
+        competitors = {c.name: c.market_cap for c in stock.competitors.all()}
+        assert set(competitors) == {"Microsoft Corp.", "Sony Group Corp."}
+        assert competitors["Microsoft Corp."].value == 3.2e12
+        assert competitors["Sony Group Corp."].currency == "JPY"
+        assert MarketCap.objects.count() == Competitor.objects.count() == 2
+
+    def test_save_stocks_data_records_daily_bars(self):
+        """Test save_stocks_data keeps one history row per stock and trading day"""
+        save_stocks_data({"AAPL": (self.polygon_data(), None)})
+        save_stocks_data({"AAPL": (self.polygon_data(close=160.0), None)})
+        yesterday = self.polygon_data(close=140.0)
+        yesterday["from"] = date(2024, 11, 14).isoformat()
+        save_stocks_data({"AAPL": (yesterday, None)})
+
+        bars = DailyBar.objects.filter(stock__company_code="AAPL").order_by("date")
+        assert [(bar.date, bar.close) for bar in bars] == [
+            (date(2024, 11, 14), 140.0),
+            (date.today(), 160.0),
+        ]
+
+    def test_save_stocks_data_reports_invalid_data(self):
+        """Test save_stocks_data skips and reports invalid stocks"""
+        errors = save_stocks_data(
+            {
+                "AAPL": (self.polygon_data(), ["Apple Inc.", {}, [{"name": "X"}]]),
+                "MSFT": (self.polygon_data(), None),
+            }
+        )
+        assert list(errors) == ["AAPL"]
+        assert not Stock.objects.filter(company_code="AAPL").exists()
+        assert Stock.objects.filter(company_code="MSFT").exists()
+
+    def count_competitor_refresh_queries(self, stock_symbol, size):
+        """Counts the queries of a competitors refresh that updates, adds and removes rows"""
+        stock = Stock.objects.create(company_code=stock_symbol)
+        refresh.create_or_update_competitors(
+            stock,
+            [{"name": f"Old {i}", "market_cap": "$1B"} for i in range(size)]
+            + [{"name": f"Kept {i}", "market_cap": "$1B"} for i in range(size)],
+        )
+
+        stock = refresh.get_stock(stock_symbol)
+        competitors = [{"name": f"Kept {i}", "market_cap": "$2B"} for i in range(size)]
+        competitors += [{"name": f"New {i}", "market_cap": "€3M"} for i in range(size)]
+        with CaptureQueriesContext(connection) as queries:
+            refresh.create_or_update_competitors(stock, competitors)
+
+        stored = {
+            c.name: c.market_cap
+            for c in refresh.get_stock(stock_symbol).competitors.all()
+        }
+        assert len(stored) == 2 * size
+        assert stored["Kept 0"].value == 2e9
+        assert stored["New 0"].currency == "EUR"
+        assert MarketCap.objects.filter(competitor__stock=stock).count() == 2 * size
+        return len(queries)
+
+    def test_competitors_refresh_runs_constant_queries(self):
+        """Test refreshing competitors doesn't run queries per competitor"""
+        small = self.count_competitor_refresh_queries("AAPL", 2)
+        large = self.count_competitor_refresh_queries("MSFT", 20)
+        assert small == large
+        assert MarketCap.objects.count() == Competitor.objects.count()
+
+
+@pytest.mark.django_db
+class TestHistory:
+    """Tests for the backfill of the price history"""
+
+    def test_backfill_windows(self):
+        """Test long ranges are split into windows of at most a year"""
+        assert get_backfill_windows(date(2023, 1, 1), date(2024, 6, 30)) == [
+            (date(2023, 1, 1), date(2024, 1, 1)),
+            (date(2024, 1, 2), date(2024, 6, 30)),
+        ]
+        assert get_backfill_windows(date(2024, 1, 2), date(2024, 1, 1)) == []
+
+    @override_settings(POLYGON_HISTORY_LAMBDA_TIMEOUT=60.0)
+    @patch("stocks.utils.invoke_lambda")
+    def test_backfill_history(self, mock_invoke_lambda):
+        """Test backfilled bars are stored, overwriting the ones already saved"""
+        stock = Stock.objects.create(company_code="AAPL")
+        DailyBar.objects.create(stock=stock, date=date(2024, 11, 14), close=1.0)
+
+        def bar(day, close):
+            return {"from": day, "open": 1.0, "high": 2.0, "low": 0.5, "close": close}
+
+        mock_invoke_lambda.return_value = {
+            "statusCode": 200,
+            "body": [bar("2024-11-14", 228.22), bar("2024-11-15", 225.0)],
+        }
+
+        saved = backfill_history("AAPL", date(2024, 11, 14), date(2024, 11, 15))
+
+        assert saved == 2
+        mock_invoke_lambda.assert_called_once_with(
+            "polygon_data",
+            {"symbol": "AAPL", "start_date": "2024-11-14", "end_date": "2024-11-15"},
+            timeout=60.0,
+        )
+        assert list(
+            stock.daily_bars.order_by("date").values_list("close", flat=True)
+        ) == [228.22, 225.0]
+
+    def test_backfill_history_through_fixture_data_source(self, tmp_path):
+        """Test a backfill replays the saved bars dated inside the range"""
+        history_dir = tmp_path / "polygon_data" / "history"
+        history_dir.mkdir(parents=True)
+        (history_dir / "AAPL.json").write_text(
+            json.dumps(
+                {
+                    "statusCode": 200,
+                    "body": [
+                        {
+                            "from": day,
+                            "open": 1.0,
+                            "high": 2.0,
+                            "low": 0.5,
+                            "close": 1.5,
+                        }
+                        for day in ("2024-11-13", "2024-11-14", "2024-11-15")
+                    ],
+                }
+            )
+        )
+
+        with override_settings(
+            STOCKS_DATA_SOURCE="stocks.services.data_sources.FixtureDataSource",
+            STOCKS_DATA_SOURCE_FIXTURES_DIR=str(tmp_path),
+        ):
+            load_data_source.cache_clear()
+            try:
+                saved = backfill_history("AAPL", date(2024, 11, 14), date(2024, 11, 15))
+                with pytest.raises(ValueError, match="No history fixture"):
+                    backfill_history("MSFT", date(2024, 11, 14), date(2024, 11, 15))
+            finally:
+                load_data_source.cache_clear()
+
+        assert saved == 2
+        assert list(
+            DailyBar.objects.order_by("date").values_list("date", flat=True)
+        ) == [date(2024, 11, 14), date(2024, 11, 15)]
+
+    @patch("stocks.utils.invoke_lambda")
+    def test_backfill_history_rejects_single_bar(self, mock_invoke_lambda):
+        """Test a data source answering with a single bar fails clearly"""
+        mock_invoke_lambda.return_value = {
+            "statusCode": 200,
+            "body": {"from": "2024-11-15", "close": 225.0},
+        }
+
+        with pytest.raises(ValueError, match="instead of a list of bars"):
+            backfill_history("AAPL", date(2024, 11, 14), date(2024, 11, 15))
+        assert not DailyBar.objects.exists()
+
+
+class TestBackgroundRefresh:
+    """Tests for the background refresh of stale stocks"""
+
+    def setup_method(self):
+        """Replace the refresh thread pool and the refresh itself with mocks"""
+        self.executor = MagicMock()
+        self.patchers = [
+            patch.object(refresh, "get_refresh_executor", return_value=self.executor),
+            patch.object(refresh, "refresh_stock_once"),
+            patch.object(refresh, "connections"),
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+
+    def teardown_method(self):
+        """Stop the mocks after each test"""
+        for patcher in self.patchers:
+            patcher.stop()
+        refresh._pending_refreshes.clear()
+
+    def test_schedule_refresh_skips_pending_symbols(self):
+        """Test a symbol is only scheduled again once its refresh finished"""
+        assert refresh.schedule_refresh("AAPL", "2024-11-20")
+        assert not refresh.schedule_refresh("AAPL", "2024-11-20")
+        self.executor.submit.assert_called_once_with(
+            refresh.run_background_refresh, "AAPL", "2024-11-20"
+        )
+
+        refresh.run_background_refresh("AAPL", "2024-11-20")
+        refresh.refresh_stock_once.assert_called_once_with("AAPL", "2024-11-20")
+        assert refresh.schedule_refresh("AAPL", "2024-11-20")
+
+    def test_background_refresh_failure_is_logged(self):
+        """Test a failed background refresh releases the symbol"""
+        refresh.refresh_stock_once.side_effect = ValueError("polygon_data error")
+        refresh.schedule_refresh("AAPL", "2024-11-20")
+
+        refresh.run_background_refresh("AAPL", "2024-11-20")
+        assert "AAPL" not in refresh._pending_refreshes
+        refresh.connections.close_all.assert_called_once()
+
+
+class TestDataSources:
+    """Tests for the pluggable upstream data sources"""
+
+    def test_lambda_data_source_is_the_default(self):
+        """Test AWS Lambda is used unless another data source is configured"""
+        assert isinstance(get_data_source(), LambdaDataSource)
+        with patch("stocks.utils.invoke_lambda") as mock_invoke_lambda:
+            mock_invoke_lambda.return_value = {"statusCode": 200, "body": {"a": 1}}
+            assert fetch_data_from_lambda("polygon_data", {"symbol": "AAPL"}) == {
+                "a": 1
+            }
+        mock_invoke_lambda.assert_called_once_with(
+            "polygon_data", {"symbol": "AAPL"}, timeout=None
+        )
+
+    @override_settings(
+        STOCKS_DATA_SOURCE="stocks.services.data_sources.LocalDataSource"
+    )
+    @patch(
+        "stocks.services.aws_lambda.marketwatch_lambda.lambda_function.get_marketwatch_data"
+    )
+    def test_local_data_source_calls_handlers_in_process(self, mock_marketwatch):
+        """Test the local data source runs the Lambda handler directly"""
+        mock_marketwatch.return_value = ("Tesla Inc.", {"5_day": 1.0}, [])
+
+        assert isinstance(get_data_source(), LocalDataSource)
+        data = fetch_data_from_lambda("marketwatch_data", {"symbol": "TSLA"})
+        assert data == ["Tesla Inc.", {"5_day": 1.0}, []]
+        mock_marketwatch.assert_called_once_with("TSLA")
+
+    def test_local_data_source_returns_handler_errors(self):
+        """Test handler errors come back in the Lambda response format"""
+        response = LocalDataSource().invoke("polygon_data", {"symbol": "AAPL"})
+        assert response["statusCode"] == 500
+        assert "start_date" in response["body"]["error"]
+
+    def test_fixture_data_source_replays_saved_responses(self, tmp_path):
+        """Test the fixture data source reads per-symbol and default responses"""
+        service_dir = tmp_path / "polygon_data"
+        service_dir.mkdir()
+        (service_dir / "AAPL.json").write_text(
+            '{"statusCode": 200, "body": {"close": 1}}'
+        )
+        (service_dir / "_default.json").write_text(
+            '{"statusCode": 200, "body": {"close": 2}}'
+        )
+
+        with override_settings(
+            STOCKS_DATA_SOURCE="stocks.services.data_sources.FixtureDataSource",
+            STOCKS_DATA_SOURCE_FIXTURES_DIR=str(tmp_path),
+        ):
+            source = FixtureDataSource()
+            assert source.invoke("polygon_data", {"symbol": "aapl"})["body"] == {
+                "close": 1
+            }
+            assert source.invoke("polygon_data", {"symbol": "MSFT"})["body"] == {
+                "close": 2
+            }
+            assert source.invoke("marketwatch_data", {"symbol": "MSFT"}) == {
+                "statusCode": 500,
+                "body": {"error": "No fixture for marketwatch_data/MSFT"},
+            }
+            assert source.invoke("marketwatch_data", {"symbols": ["MSFT"]}) == {
+                "statusCode": 200,
+                "body": {
+                    "results": {},
+                    "errors": {"MSFT": "No fixture for marketwatch_data/MSFT"},
+                },
+            }
@@ -0,0 +1,57 @@
+from datetime import date
+from stocks.services.aws_lambda import trading_calendar
+
+
+class TestTradingCalendar:
+    """Tests for the exchange trading calendar"""
+
+    def test_holidays(self):
+        """Test the holidays of a year match the NYSE schedule"""
+        assert sorted(trading_calendar.holidays(2024)) == [
+            date(2024, 1, 1),
+            date(2024, 1, 15),
+            date(2024, 2, 19),
+            date(2024, 3, 29),
+            date(2024, 5, 27),
+            date(2024, 6, 19),
+            date(2024, 7, 4),
+            date(2024, 9, 2),
+            date(2024, 11, 28),
+            date(2024, 12, 25),
+        ]
+
+    def test_weekend_holidays_are_observed(self):
+        """Test holidays on weekends move to Friday or Monday"""
+        holidays = trading_calendar.holidays(2022)
+        assert date(2022, 6, 20) in holidays
+        assert date(2022, 12, 26) in holidays
+        # New Year's Day on a Saturday is not observed
+        assert date(2021, 12, 31) not in trading_calendar.holidays(2021)
+        assert date(2026, 7, 3) in trading_calendar.holidays(2026)
+
+    def test_early_closes(self):
+        """Test the half days around Independence Day, Thanksgiving and Christmas"""
+        assert trading_calendar.early_closes(2024) == {
+            date(2024, 7, 3),
+            date(2024, 11, 29),
+            date(2024, 12, 24),
+        }
+        # July 3rd 2026 is the observed Independence Day
+        assert trading_calendar.early_closes(2026) == {
+            date(2026, 11, 27),
+            date(2026, 12, 24),
+        }
+        assert trading_calendar.is_early_close(date(2024, 11, 29))
+
+    def test_previous_trading_day(self):
+        """Test previous_trading_day skips weekends and holidays"""
+        # Monday after Thanksgiving weekend
+        assert trading_calendar.previous_trading_day(date(2024, 12, 2)) == date(
+            2024, 11, 29
+        )
+        # Tuesday after New Year's Day
+        assert trading_calendar.previous_trading_day(date(2024, 1, 2)) == date(
+            2023, 12, 29
+        )
+        assert trading_calendar.last_trading_day(date(2024, 3, 31)) == date(2024, 3, 28)
+        assert trading_calendar.last_trading_day(date(2024, 3, 27)) == date(2024, 3, 27)
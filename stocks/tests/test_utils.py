@@ -0,0 +1,148 @@
+import io
+import json
+import os
+import pytest
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from unittest.mock import patch
+from django.test import override_settings
+from stocks import utils
+
+
+class TestLambdaClient:
+    """Tests for the shared Lambda client"""
+
+    def setup_method(self):
+        """Start every test without a cached client"""
+        utils.reset_lambda_pools()
+        self.session_patcher = patch("stocks.utils.boto3.session.Session")
+        self.mock_session = self.session_patcher.start()
+        self.mock_client = self.mock_session.return_value.client.return_value
+        self.mock_client.invoke.side_effect = lambda **kwargs: {
+            "Payload": io.BytesIO(json.dumps({"statusCode": 200}).encode())
+        }
+
+    def teardown_method(self):
+        """Stop the mocks and drop the mocked client"""
+        self.session_patcher.stop()
+        utils.reset_lambda_pools()
+
+    @override_settings(
+        AWS_LAMBDA_MAX_POOL_CONNECTIONS=25,
+        AWS_LAMBDA_CONNECT_TIMEOUT=2.0,
+        AWS_LAMBDA_READ_TIMEOUT=15.0,
+        AWS_LAMBDA_RETRY_MODE="adaptive",
+        AWS_LAMBDA_MAX_ATTEMPTS=4,
+    )
+    def test_client_is_configured_from_settings(self):
+        """Test the client is built with the pool, timeouts and retries from settings"""
+        utils.get_lambda_client()
+
+        service_name, config = (
+            self.mock_session.return_value.client.call_args.args[0],
+            self.mock_session.return_value.client.call_args.kwargs["config"],
+        )
+        assert service_name == "lambda"
+        assert config.max_pool_connections == 25
+        assert config.connect_timeout == 2.0
+        assert config.read_timeout == 15.0
+        assert config.retries == {"mode": "adaptive", "max_attempts": 4}
+
+    @override_settings(AWS_LAMBDA_READ_TIMEOUT=60.0, AWS_LAMBDA_MAX_ATTEMPTS=3)
+    def test_client_matches_the_call_timeout(self):
+        """Test calls with a timeout get their own client reading as long as they wait, without retries"""
+        default_client = utils.get_lambda_client()
+        batch_client = utils.get_lambda_client(120.0)
+
+        default_config, batch_config = (
+            c.kwargs["config"]
+            for c in self.mock_session.return_value.client.call_args_list
+        )
+        assert default_config.read_timeout == 60.0
+        assert default_config.retries["max_attempts"] == 3
+        assert batch_config.read_timeout == 120.0
+        assert batch_config.retries["max_attempts"] == 1
+        assert utils.get_lambda_client(120.0) is batch_client
+        assert utils.get_lambda_client() is default_client
+        assert self.mock_session.return_value.client.call_count == 2
+
+    def test_client_is_reused_between_invocations(self):
+        """Test invoke_lambda builds the client only once"""
+        for _ in range(3):
+            assert utils.invoke_lambda("polygon_data", {"symbol": "AAPL"}) == {
+                "statusCode": 200
+            }
+
+        self.mock_session.assert_called_once()
+        assert self.mock_client.invoke.call_count == 3
+
+    @pytest.mark.skipif(not hasattr(os, "fork"), reason="Requires os.fork")
+    def test_client_is_rebuilt_in_forked_children(self):
+        """Test a forked process doesn't reuse the parent's client"""
+        utils.get_lambda_client()
+        read_fd, write_fd = os.pipe()
+
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            os.write(write_fd, b"1" if not utils._lambda_clients else b"0")
+            os._exit(0)
+
+        os.close(write_fd)
+        os.waitpid(pid, 0)
+        assert os.read(read_fd, 1) == b"1"
+        os.close(read_fd)
+        assert utils._lambda_clients
+
+
+class TestFetchDataFromLambdas:
+    """Tests for the concurrent Lambda calls"""
+
+    def setup_method(self):
+        """Call the services through a pool with a single worker"""
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.executor_patcher = patch(
+            "stocks.utils.get_lambda_executor", return_value=self.executor
+        )
+        self.executor_patcher.start()
+
+    def teardown_method(self):
+        """Stop the mocks and the pool"""
+        self.executor_patcher.stop()
+        self.executor.shutdown()
+
+    @patch("stocks.utils.fetch_data_from_lambda")
+    def test_timeout_starts_with_the_call(self, mock_fetch):
+        """Test time spent waiting for a free worker doesn't count in the timeout"""
+
+        def fetch(service_name, payload, timeout=None):
+            time.sleep(0.2 if service_name == "polygon_data" else 0.01)
+            return service_name
+
+        mock_fetch.side_effect = fetch
+
+        results = utils.fetch_data_from_lambdas(
+            {"polygon_data": {}, "marketwatch_data": {}},
+            timeouts={"marketwatch_data": 0.1},
+        )
+
+        assert results == {
+            "polygon_data": ("polygon_data", None),
+            "marketwatch_data": ("marketwatch_data", None),
+        }
+        mock_fetch.assert_any_call("marketwatch_data", {}, timeout=0.1)
+
+
+class TestLastValidDay:
+    """Tests for get_last_valid_day"""
+
+    @patch("stocks.utils.timezone.localtime")
+    def test_skips_weekends_and_holidays(self, mock_localtime):
+        """Test the last valid day is the previous trading day"""
+        # Tuesday after the Memorial Day weekend
+        mock_localtime.return_value = datetime(2024, 5, 28, 9, 0)
+        assert utils.get_last_valid_day() == "2024-05-24"
+
+        mock_localtime.return_value = datetime(2024, 5, 29, 9, 0)
+        assert utils.get_last_valid_day() == "2024-05-28"
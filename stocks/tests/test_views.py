@@ -1,9 +1,18 @@
+import json
 import pytest
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from rest_framework.test import APIClient
 from unittest.mock import patch
-from stocks.models import Stock
+from django.core.cache import cache
+from django.db import connection
+from django.test import override_settings
+from stocks.models import DailyBar, Stock, StockValues
 from datetime import date
 from django.urls import reverse
+from stocks.services.data_sources import load_data_source
+from stocks.services.refresh import refresh_stock
 from stocks.utils import get_last_valid_day
 
 
@@ -14,6 +23,8 @@ class TestStockAPIView:
     def setup_method(self):
         """Initialize reusable objects and mocks for tests"""
         self.client = APIClient()
+        cache.clear()
+        self.last_valid_day = get_last_valid_day()
 
         # Create reusable database objects
         self.stock = Stock.objects.create(
@@ -35,27 +46,29 @@ class TestStockAPIView:
 
     def test_get_stock_success(self):
         """Test GET request for a stock that's not in the database"""
-        self.mock_invoke_lambda.side_effect = lambda service_name, payload: {
-            "polygon_data": {
-                "statusCode": 200,
-                "body": {
-                    "status": "OK",
-                    "open": 150.0,
-                    "high": 155.0,
-                    "low": 145.0,
-                    "close": 152.0,
-                    "from": date.today().isoformat(),
+        self.mock_invoke_lambda.side_effect = (
+            lambda service_name, payload, timeout=None: {
+                "polygon_data": {
+                    "statusCode": 200,
+                    "body": {
+                        "status": "OK",
+                        "open": 150.0,
+                        "high": 155.0,
+                        "low": 145.0,
+                        "close": 152.0,
+                        "from": date.today().isoformat(),
+                    },
                 },
-            },
-            "marketwatch_data": {
-                "statusCode": 200,
-                "body": [
-                    "Amazon",
-                    {"5_day": 1.5, "1_month": 3.2},
-                    [{"name": "Amazon", "market_cap": "$1.8T"}],
-                ],
-            },
-        }[service_name]
+                "marketwatch_data": {
+                    "statusCode": 200,
+                    "body": [
+                        "Amazon",
+                        {"5_day": 1.5, "1_month": 3.2},
+                        [{"name": "Amazon", "market_cap": "$1.8T"}],
+                    ],
+                },
+            }[service_name]
+        )
 
         url = reverse("stocks:stock-detail", kwargs={"stock_symbol": "AMZN"})
         response = self.client.get(url)
@@ -75,45 +88,184 @@ class TestStockAPIView:
 
     def test_get_stock_not_found(self):
         """Test GET request for a stock that does not exist in the database"""
-        self.mock_invoke_lambda.side_effect = lambda service_name, payload: {
+        self.mock_invoke_lambda.side_effect = (
+            lambda service_name, payload, timeout=None: {
+                "polygon_data": {
+                    "statusCode": 200,
+                    "body": {
+                        "status": "OK",
+                        "open": 150.0,
+                        "high": 110.0,
+                        "low": 90.0,
+                        "close": 105.0,
+                        "from": date.today().isoformat(),
+                    },
+                },
+                "marketwatch_data": {
+                    "body": [
+                        "Tesla Inc.",
+                        {"five_days": -2.0, "one_month": 5.0},
+                        [{"name": "Ford Motor Co.", "market_cap": "$0.8T"}],
+                    ]
+                },
+            }[service_name]
+        )
+
+        url = reverse("stocks:stock-detail", kwargs={"stock_symbol": "TSLA"})
+        response = self.client.get(url)
+        assert response.status_code == 200
+        data = response.json()
+        assert data["company_code"] == "TSLA"
+        assert data["stock_values"]["open_value"] == 150.0
+
+    def lambda_responses(self, service_name, payload, timeout=None):
+        """Successful Lambda responses used by the concurrency tests"""
+        return {
             "polygon_data": {
                 "statusCode": 200,
                 "body": {
                     "status": "OK",
                     "open": 150.0,
-                    "high": 110.0,
-                    "low": 90.0,
-                    "close": 105.0,
-                    "from": date.today().isoformat(),
+                    "high": 155.0,
+                    "low": 145.0,
+                    "close": 152.0,
+                    "from": self.last_valid_day,
                 },
             },
             "marketwatch_data": {
+                "statusCode": 200,
                 "body": [
-                    "Tesla Inc.",
-                    {"five_days": -2.0, "one_month": 5.0},
-                    [{"name": "Ford Motor Co.", "market_cap": "$0.8T"}],
-                ]
+                    "Microsoft Corp.",
+                    {"5_day": 1.5, "1_month": 3.2},
+                    [{"name": "Apple Inc.", "market_cap": "$3.4T"}],
+                ],
             },
         }[service_name]
 
-        url = reverse("stocks:stock-detail", kwargs={"stock_symbol": "TSLA"})
+    def test_get_stock_fetches_lambdas_concurrently(self):
+        """Test GET request invokes both Lambdas at the same time"""
+        barrier = threading.Barrier(2, timeout=5)
+
+        def invoke(service_name, payload, timeout=None):
+            # Both calls must be in flight together to get past the barrier
+            barrier.wait()
+            return self.lambda_responses(service_name, payload)
+
+        self.mock_invoke_lambda.side_effect = invoke
+
+        url = reverse("stocks:stock-detail", kwargs={"stock_symbol": "MSFT"})
         response = self.client.get(url)
         assert response.status_code == 200
         data = response.json()
-        assert data["company_code"] == "TSLA"
-        assert data["stock_values"]["open_value"] == 150.0
+        assert data["company_name"] == "Microsoft Corp."
+        assert data["stock_values"]["close"] == 152.0
+
+    def test_get_stock_marketwatch_failure_returns_partial_data(self):
+        """Test GET request still serves Polygon data when MarketWatch fails"""
+
+        def invoke(service_name, payload, timeout=None):
+            if service_name == "marketwatch_data":
+                return {"statusCode": 500, "body": {"error": "Proxy error"}}
+            return self.lambda_responses(service_name, payload)
+
+        self.mock_invoke_lambda.side_effect = invoke
+
+        url = reverse("stocks:stock-detail", kwargs={"stock_symbol": "AAPL"})
+        response = self.client.get(url)
+        assert response.status_code == 200
+        data = response.json()
+        assert data["company_name"] == "Apple Inc."
+        assert data["stock_values"]["close"] == 152.0
+        assert data["competitors"] == []
+        assert cache.get("stock_AAPL") is None
+
+    def test_get_stock_polygon_failure(self):
+        """Test GET request returns 502 when Polygon fails"""
+
+        def invoke(service_name, payload, timeout=None):
+            if service_name == "polygon_data":
+                return {"statusCode": 500, "body": {"error": "Rate limited"}}
+            return self.lambda_responses(service_name, payload)
+
+        self.mock_invoke_lambda.side_effect = invoke
+
+        url = reverse("stocks:stock-detail", kwargs={"stock_symbol": "MSFT"})
+        response = self.client.get(url)
+        assert response.status_code == 502
+        assert response.json()["error"] == "polygon_data error: Rate limited"
+
+    @override_settings(LAMBDA_TIMEOUTS={"polygon_data": 0.05, "marketwatch_data": 0.05})
+    def test_get_stock_polygon_timeout(self):
+        """Test GET request returns 504 when Polygon exceeds its timeout"""
+
+        def invoke(service_name, payload, timeout=None):
+            if service_name == "polygon_data":
+                time.sleep(0.3)
+            return self.lambda_responses(service_name, payload)
+
+        self.mock_invoke_lambda.side_effect = invoke
+
+        url = reverse("stocks:stock-detail", kwargs={"stock_symbol": "MSFT"})
+        response = self.client.get(url)
+        assert response.status_code == 504
+        assert response.json()["error"] == "polygon_data timed out after 0.05s"
+
+    def test_get_stock_serves_stale_cache_while_refreshing(self):
+        """Test GET request returns stale cached data and refreshes it in background"""
+        stale_data = {"company_code": "AAPL", "request_data": "2024-11-20"}
+        cache.set("stock_AAPL", stale_data)
+
+        with patch("stocks.views.schedule_refresh") as mock_schedule_refresh:
+            url = reverse("stocks:stock-detail", kwargs={"stock_symbol": "aapl"})
+            response = self.client.get(url)
+
+        assert response.status_code == 200
+        assert response.json() == stale_data
+        assert response["X-Cache"] == "STALE"
+        assert response["X-Data-As-Of"] == "2024-11-20"
+        assert response["X-Last-Trading-Day"] == self.last_valid_day
+        mock_schedule_refresh.assert_called_once_with("AAPL", self.last_valid_day)
+        self.mock_invoke_lambda.assert_not_called()
+
+    @override_settings(STOCK_CACHE_STALE_WHILE_REVALIDATE=False)
+    def test_get_stock_refreshes_stale_cache_when_disabled(self):
+        """Test GET request blocks on the refresh when stale data can't be served"""
+        cache.set("stock_MSFT", {"company_code": "MSFT", "request_data": "2024-11-20"})
+        self.mock_invoke_lambda.side_effect = self.lambda_responses
+
+        url = reverse("stocks:stock-detail", kwargs={"stock_symbol": "MSFT"})
+        response = self.client.get(url)
+        assert response.status_code == 200
+        assert response["X-Cache"] == "MISS"
+        assert response.json()["request_data"] == self.last_valid_day
+
+    def test_get_stock_miss_query_count(self, django_assert_num_queries):
+        """Test a cache miss runs a fixed number of queries"""
+        self.mock_invoke_lambda.side_effect = self.lambda_responses
+        url = reverse("stocks:stock-detail", kwargs={"stock_symbol": "MSFT"})
+
+        # Lookup, stock uniqueness check and inserts, daily bar upsert,
+        # competitors upsert in a savepoint, then the row lock and a single
+        # prefetched re-read for the response in another savepoint.
+        with django_assert_num_queries(18):
+            assert self.client.get(url).status_code == 200
+
+        cache.clear()
+        with django_assert_num_queries(14):
+            response = self.client.get(url)
+        assert response.status_code == 200
+        assert response.json()["competitors"][0]["market_cap"]["value"] == 3.4e12
 
     def test_post_stock_add_units(self):
         """Test POST request to add purchased units to an existing stock"""
-        with patch("stocks.views.StockAPIView.get_stock", return_value=self.stock):
-            url = reverse("stocks:stock-detail", kwargs={"stock_symbol": "AAPL"})
-            response = self.client.post(url, {"amount": 50}, format="json")
-            assert response.status_code == 201
-            data = response.json()
-            assert (
-                data["message"]
-                == f"50 units of stock {self.stock.company_code} were added to your stock record."
-            )
+        url = reverse("stocks:stock-detail", kwargs={"stock_symbol": "AAPL"})
+        response = self.client.post(url, {"amount": 50}, format="json")
+        assert response.status_code == 201
+        data = response.json()
+        assert (
+            data["message"]
+            == f"50 units of stock {self.stock.company_code} were added to your stock record."
+        )
 
         # Verify the updated purchased amount
         self.stock.refresh_from_db()
@@ -133,6 +285,49 @@ class TestStockAPIView:
         new_stock = Stock.objects.get(company_code="NVDA")
         assert new_stock.purchased_amount == 20
 
+    def test_post_stock_query_count(self, django_assert_num_queries):
+        """Test a purchase is an increment and a read of the new amount"""
+        url = reverse("stocks:stock-detail", kwargs={"stock_symbol": "AAPL"})
+
+        # The other two open and release the transaction's savepoint.
+        with django_assert_num_queries(4) as captured:
+            response = self.client.post(url, {"amount": 50}, format="json")
+
+        assert response.status_code == 201
+        assert not any("JOIN" in query["sql"] for query in captured.captured_queries)
+
+    def test_post_stock_patches_cached_data(self):
+        """Test a purchase updates the cached stock instead of dropping it"""
+        cache.set(
+            "stock_AAPL",
+            {
+                "company_code": "AAPL",
+                "purchased_amount": 100,
+                "purchased_status": "active",
+                "request_data": self.last_valid_day,
+            },
+        )
+        url = reverse("stocks:stock-detail", kwargs={"stock_symbol": "AAPL"})
+
+        self.client.post(url, {"amount": 50}, format="json")
+        response = self.client.get(url)
+
+        assert response["X-Cache"] == "HIT"
+        assert response.json()["purchased_amount"] == 150
+        self.mock_invoke_lambda.assert_not_called()
+
+    def test_post_stock_drops_rendered_response_without_cached_data(self):
+        """Test a purchase deletes a rendered response left without its data"""
+        cache.set(
+            "stock_json_AAPL",
+            (self.last_valid_day, '"etag"', b'{"purchased_amount":100}'),
+        )
+        url = reverse("stocks:stock-detail", kwargs={"stock_symbol": "AAPL"})
+
+        self.client.post(url, {"amount": 50}, format="json")
+
+        assert cache.get("stock_json_AAPL") is None
+
     def test_get_stock_from_cache(self):
         """Test retrieving stock data directly from cache"""
         cache_data = {
@@ -174,3 +369,638 @@ class TestStockAPIView:
             assert data["stock_values"]["open_value"] == 150.0
             assert len(data["competitors"]) == 1
             assert data["competitors"][0]["name"] == "Microsoft Corp."
+
+    def test_get_stock_serves_rendered_cache_hits(self):
+        """Test a refreshed stock is served from its rendered JSON with an ETag"""
+        self.mock_invoke_lambda.side_effect = self.lambda_responses
+        url = reverse("stocks:stock-detail", kwargs={"stock_symbol": "MSFT"})
+        miss = self.client.get(url)
+
+        with patch("stocks.views.Response") as mock_response:
+            response = self.client.get(url)
+
+        mock_response.assert_not_called()
+        assert response.status_code == 200
+        assert response["X-Cache"] == "HIT"
+        assert response["Content-Type"] == "application/json"
+        assert response.json() == miss.json()
+        assert response.content == cache.get("stock_json_MSFT")[2]
+
+        etag = response["ETag"]
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 304
+        assert response.content == b""
+        assert response["ETag"] == etag
+
+        self.client.post(url, {"amount": 5}, format="json")
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 200
+        assert response["ETag"] != etag
+        assert response.json()["purchased_amount"] == 5
+
+
+@pytest.mark.django_db(transaction=True)
+class TestConcurrentPurchases:
+    """Tests for purchases of the same stock made in parallel"""
+
+    def setup_method(self):
+        cache.clear()
+
+    def post_purchases(self, stock_symbol, count, workers):
+        url = reverse("stocks:stock-detail", kwargs={"stock_symbol": stock_symbol})
+
+        def post(_):
+            try:
+                return APIClient().post(url, {"amount": 1}, format="json").status_code
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(post, range(count)))
+
+    def test_parallel_purchases_are_not_lost(self):
+        """Test every parallel purchase is counted in the database and the cache"""
+        Stock.objects.create(company_code="AAPL", purchased_amount=100)
+        cache.set(
+            "stock_AAPL",
+            {
+                "company_code": "AAPL",
+                "purchased_amount": 100,
+                "request_data": get_last_valid_day(),
+            },
+        )
+
+        statuses = self.post_purchases("AAPL", 300, workers=16)
+
+        assert statuses == [201] * 300
+        assert Stock.objects.get(company_code="AAPL").purchased_amount == 400
+        assert cache.get("stock_AAPL")["purchased_amount"] == 400
+
+    def test_refresh_caches_under_row_lock(self):
+        """Test a refresh caches the stock in the transaction holding its row lock"""
+        Stock.objects.create(company_code="AAPL", purchased_amount=100)
+        polygon_data = {
+            "status": "OK",
+            "open": 150.0,
+            "high": 155.0,
+            "low": 145.0,
+            "close": 152.0,
+            "from": get_last_valid_day(),
+        }
+        marketwatch_data = ["Apple Inc.", {"five_days": 1.5}, []]
+        in_atomic_block = []
+
+        def cache_stocks(data):
+            in_atomic_block.append(connection.in_atomic_block)
+
+        with (
+            patch(
+                "stocks.services.refresh.fetch_upstream_data",
+                return_value=(polygon_data, marketwatch_data),
+            ),
+            patch("stocks.services.refresh.cache_stocks", side_effect=cache_stocks),
+        ):
+            data = refresh_stock("AAPL", get_last_valid_day())
+
+        assert in_atomic_block == [True]
+        assert data["purchased_amount"] == 100
+
+    def test_parallel_first_purchases_create_one_stock(self):
+        """Test parallel purchases of a new stock create it once"""
+        statuses = self.post_purchases("NVDA", 100, workers=16)
+
+        assert statuses == [201] * 100
+        assert Stock.objects.get(company_code="NVDA").purchased_amount == 100
+
+    def test_parallel_batches_are_not_lost(self):
+        """Test parallel batches of purchases of the same stocks all count"""
+        url = reverse("stocks:stock-purchases")
+        purchases = [{"symbol": "MSFT", "amount": 1}, {"symbol": "AAPL", "amount": 2}]
+
+        def post(_):
+            try:
+                return APIClient().post(url, purchases, format="json").status_code
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            statuses = list(executor.map(post, range(100)))
+
+        assert statuses == [201] * 100
+        assert dict(Stock.objects.values_list("company_code", "purchased_amount")) == {
+            "AAPL": 200,
+            "MSFT": 100,
+        }
+
+
+@pytest.mark.django_db
+class TestStockPurchaseBatchAPIView:
+    """Tests for StockPurchaseBatchAPIView"""
+
+    def setup_method(self):
+        self.client = APIClient()
+        cache.clear()
+        self.url = reverse("stocks:stock-purchases")
+        Stock.objects.create(company_code="AAPL", purchased_amount=100)
+        cache.set(
+            "stock_AAPL",
+            {
+                "company_code": "AAPL",
+                "purchased_amount": 100,
+                "request_data": get_last_valid_day(),
+            },
+        )
+
+    def test_post_purchases(self, django_assert_num_queries):
+        """Test purchases are aggregated per stock and applied together"""
+        cache.set("portfolio", {"positions": []})
+        purchases = [
+            {"symbol": "AAPL", "amount": 10},
+            {"symbol": "nvda", "amount": 3},
+            {"symbol": "MSFT", "amount": -1},
+            {"symbol": "aapl", "amount": 5},
+        ]
+
+        # Insert, lock and update, plus the transaction's savepoint
+        with django_assert_num_queries(5):
+            response = self.client.post(self.url, purchases, format="json")
+
+        assert response.status_code == 201
+        assert response.json() == {
+            "results": [
+                {
+                    "status": "added",
+                    "symbol": "AAPL",
+                    "amount": 10,
+                    "purchased_amount": 115,
+                },
+                {
+                    "status": "added",
+                    "symbol": "NVDA",
+                    "amount": 3,
+                    "purchased_amount": 3,
+                },
+                {
+                    "status": "rejected",
+                    "error": "The 'amount' field must be a positive number.",
+                },
+                {
+                    "status": "added",
+                    "symbol": "AAPL",
+                    "amount": 5,
+                    "purchased_amount": 115,
+                },
+            ],
+            "purchased_amounts": {"AAPL": 115, "NVDA": 3},
+        }
+        assert Stock.objects.get(company_code="AAPL").purchased_amount == 115
+        nvda = Stock.objects.get(company_code="NVDA")
+        assert nvda.purchased_amount == 3
+        assert nvda.purchased_status == "active"
+        assert cache.get("stock_AAPL")["purchased_amount"] == 115
+        assert cache.get("stock_NVDA") is None
+        assert cache.get("portfolio") is None
+
+    def test_post_purchases_ndjson(self):
+        """Test purchases can be streamed as newline-delimited JSON"""
+        body = '{"symbol": "AAPL", "amount": 10}\n\n{"symbol": "TSLA", "amount": 2}\n'
+
+        response = self.client.post(self.url, body, content_type="application/x-ndjson")
+
+        assert response.status_code == 201
+        assert response.json()["purchased_amounts"] == {"AAPL": 110, "TSLA": 2}
+
+    def test_post_purchases_invalid_ndjson(self):
+        """Test a malformed line is reported with its number"""
+        body = '{"symbol": "AAPL", "amount": 10}\n{"symbol": \n'
+
+        response = self.client.post(self.url, body, content_type="application/x-ndjson")
+
+        assert response.status_code == 400
+        assert "line 2" in response.json()["detail"]
+        assert Stock.objects.get(company_code="AAPL").purchased_amount == 100
+
+    def test_post_purchases_all_rejected(self):
+        """Test nothing is applied when no purchase is valid"""
+        response = self.client.post(
+            self.url,
+            [
+                {"amount": 10},
+                "AAPL",
+                {"symbol": "A" * 21, "amount": 10},
+                {"symbol": "AAPL", "amount": True},
+            ],
+            format="json",
+        )
+
+        assert response.status_code == 400
+        assert [r["error"] for r in response.json()["results"]] == [
+            "The 'symbol' field is required.",
+            "Each purchase must be an object.",
+            "The 'symbol' field must have at most 20 characters.",
+            "The 'amount' field must be a positive number.",
+        ]
+        assert response.json()["purchased_amounts"] == {}
+
+    def test_post_purchases_requires_list(self, settings):
+        """Test the body must be a list of at most the allowed purchases"""
+        settings.STOCK_PURCHASE_BATCH_MAX_ITEMS = 1
+        response = self.client.post(
+            self.url, {"symbol": "AAPL", "amount": 10}, format="json"
+        )
+        assert response.status_code == 400
+
+        response = self.client.post(
+            self.url,
+            [{"symbol": "AAPL", "amount": 1}, {"symbol": "MSFT", "amount": 1}],
+            format="json",
+        )
+        assert response.status_code == 400
+        assert response.json()["error"] == "At most 1 purchases can be sent at once."
+
+
+@pytest.mark.django_db
+class TestStockBatchAPIView:
+    """Tests for StockBatchAPIView"""
+
+    def setup_method(self):
+        """Initialize reusable objects and mocks for tests"""
+        self.client = APIClient()
+        cache.clear()
+        self.last_valid_day = get_last_valid_day()
+        self.url = reverse("stocks:stock-list")
+
+        self.mock_invoke_lambda_patcher = patch("stocks.utils.invoke_lambda")
+        self.mock_invoke_lambda = self.mock_invoke_lambda_patcher.start()
+        self.mock_invoke_lambda.side_effect = self.lambda_responses
+
+    def teardown_method(self):
+        """Stop the mocks after each test"""
+        self.mock_invoke_lambda_patcher.stop()
+
+    def lambda_responses(self, service_name, payload, timeout=None):
+        """Lambda responses keyed by the requested symbol"""
+        if "symbols" in payload:
+            results, errors = {}, {}
+            for symbol in payload["symbols"]:
+                response = self.lambda_responses(service_name, {"symbol": symbol})
+                if response["statusCode"] == 200:
+                    results[symbol] = response["body"]
+                else:
+                    errors[symbol] = response["body"]["error"]
+            return {"statusCode": 200, "body": {"results": results, "errors": errors}}
+
+        symbol = payload["symbol"]
+        if symbol == "FAIL":
+            return {"statusCode": 500, "body": {"error": "Unknown symbol"}}
+        if service_name == "polygon_data":
+            return {
+                "statusCode": 200,
+                "body": {
+                    "status": "OK",
+                    "open": 10.0,
+                    "high": 12.0,
+                    "low": 9.0,
+                    "close": 11.0,
+                    "from": self.last_valid_day,
+                },
+            }
+        return {
+            "statusCode": 200,
+            "body": [
+                f"{symbol} Corp.",
+                {"5_day": 1.5},
+                [
+                    {"name": f"{symbol} Rival", "market_cap": "$1.2B"},
+                    {"name": "Other Inc.", "market_cap": "$3M"},
+                ],
+            ],
+        }
+
+    def test_get_batch_fetches_missing_symbols(self):
+        """Test GET batch request fetches, saves and caches every symbol"""
+        response = self.client.get(self.url, {"symbols": "msft,AAPL,msft"})
+        assert response.status_code == 200
+        data = response.json()
+        assert [s["company_code"] for s in data["results"]] == ["MSFT", "AAPL"]
+        assert data["errors"] == {}
+
+        msft = data["results"][0]
+        assert msft["company_name"] == "MSFT Corp."
+        assert msft["stock_values"]["close"] == 11.0
+        assert msft["performance_data"]["five_days"] == 1.5
+        assert msft["competitors"][0]["name"] == "MSFT Rival"
+        assert msft["competitors"][0]["market_cap"] == {
+            "currency": "USD",
+            "value": 1.2e9,
+        }
+
+        assert Stock.objects.filter(company_code__in=["MSFT", "AAPL"]).count() == 2
+        assert cache.get("stock_MSFT")["company_name"] == "MSFT Corp."
+        # One batch invocation of each Lambda for both symbols
+        calls = {c.args[0]: c.args[1] for c in self.mock_invoke_lambda.call_args_list}
+        assert calls == {
+            "polygon_data": {
+                "symbols": ["MSFT", "AAPL"],
+                "start_date": self.last_valid_day,
+            },
+            "marketwatch_data": {"symbols": ["MSFT", "AAPL"]},
+        }
+
+    def test_get_batch_serves_cached_symbols(self):
+        """Test GET batch request only fetches the symbols missing from cache"""
+        cache.set(
+            "stock_AAPL",
+            {"company_code": "AAPL", "request_data": self.last_valid_day},
+        )
+
+        response = self.client.get(self.url, {"symbols": "AAPL,MSFT"})
+        assert response.status_code == 200
+        data = response.json()
+        assert [s["company_code"] for s in data["results"]] == ["AAPL", "MSFT"]
+        requested = {
+            symbol
+            for c in self.mock_invoke_lambda.call_args_list
+            for symbol in c.args[1].get("symbols", [c.args[1].get("symbol")])
+        }
+        assert requested == {"MSFT"}
+
+    def test_get_batch_reports_per_symbol_errors(self):
+        """Test GET batch request keeps the symbols that did not fail"""
+        response = self.client.get(self.url, {"symbols": "MSFT,FAIL"})
+        assert response.status_code == 200
+        data = response.json()
+        assert [s["company_code"] for s in data["results"]] == ["MSFT"]
+        assert data["errors"] == {"FAIL": "polygon_data error: Unknown symbol"}
+
+    def test_get_batch_keeps_symbols_without_marketwatch_data(self):
+        """Test GET batch request saves the Polygon data of symbols MarketWatch failed"""
+
+        def lambda_responses(service_name, payload, timeout=None):
+            response = self.lambda_responses(service_name, payload)
+            if service_name == "marketwatch_data":
+                response["body"]["errors"]["AAPL"] = "Could not fetch data"
+                del response["body"]["results"]["AAPL"]
+            return response
+
+        self.mock_invoke_lambda.side_effect = lambda_responses
+
+        response = self.client.get(self.url, {"symbols": "MSFT,AAPL"})
+        assert response.status_code == 200
+        data = response.json()
+        assert data["errors"] == {}
+        aapl = data["results"][1]
+        assert aapl["company_code"] == "AAPL"
+        assert aapl["stock_values"]["close"] == 11.0
+        assert aapl["competitors"] == []
+        # Partial data is not cached
+        assert cache.get("stock_AAPL") is None
+        assert cache.get("stock_MSFT")["company_name"] == "MSFT Corp."
+
+    def test_get_batch_through_fixture_data_source(self, settings, tmp_path):
+        """Test the batch endpoint runs offline on the saved responses"""
+        (tmp_path / "polygon_data").mkdir()
+        (tmp_path / "polygon_data" / "_default.json").write_text(
+            json.dumps(
+                {
+                    "statusCode": 200,
+                    "body": {
+                        "status": "OK",
+                        "open": 10.0,
+                        "high": 12.0,
+                        "low": 9.0,
+                        "close": 11.0,
+                        "from": self.last_valid_day,
+                    },
+                }
+            )
+        )
+        (tmp_path / "marketwatch_data").mkdir()
+        (tmp_path / "marketwatch_data" / "AAPL.json").write_text(
+            json.dumps({"statusCode": 200, "body": ["Apple Inc.", {"5_day": 1.5}, []]})
+        )
+        settings.STOCKS_DATA_SOURCE = "stocks.services.data_sources.FixtureDataSource"
+        settings.STOCKS_DATA_SOURCE_FIXTURES_DIR = str(tmp_path)
+        load_data_source.cache_clear()
+        try:
+            response = self.client.get(self.url, {"symbols": "AAPL,MSFT"})
+        finally:
+            load_data_source.cache_clear()
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["errors"] == {}
+        aapl, msft = data["results"]
+        assert aapl["company_name"] == "Apple Inc."
+        assert aapl["stock_values"]["close"] == 11.0
+        # Without a MarketWatch fixture MSFT only has its Polygon data.
+        assert msft["stock_values"]["close"] == 11.0
+        assert msft["competitors"] == []
+        self.mock_invoke_lambda.assert_not_called()
+
+    def test_get_batch_polygon_failure(self):
+        """Test GET batch request reports every symbol when the Polygon batch fails"""
+        self.mock_invoke_lambda.side_effect = (
+            lambda service_name, payload, timeout=None: (
+                {"statusCode": 500, "body": {"error": "Rate limited"}}
+                if service_name == "polygon_data"
+                else self.lambda_responses(service_name, payload)
+            )
+        )
+
+        response = self.client.get(self.url, {"symbols": "MSFT,AAPL"})
+        assert response.status_code == 200
+        data = response.json()
+        assert data["results"] == []
+        assert data["errors"] == {
+            "MSFT": "polygon_data error: Rate limited",
+            "AAPL": "polygon_data error: Rate limited",
+        }
+
+    def test_get_batch_requires_symbols(self):
+        """Test GET batch request without symbols is rejected"""
+        response = self.client.get(self.url)
+        assert response.status_code == 400
+
+    @override_settings(STOCK_BATCH_MAX_SYMBOLS=2)
+    def test_get_batch_rejects_too_many_symbols(self):
+        """Test GET batch request with too many symbols is rejected"""
+        response = self.client.get(self.url, {"symbols": "A,B,C"})
+        assert response.status_code == 400
+        self.mock_invoke_lambda.assert_not_called()
+
+
+@pytest.mark.django_db
+class TestStockHistoryAPIView:
+    """Tests for StockHistoryAPIView"""
+
+    def setup_method(self):
+        self.client = APIClient()
+        stock = Stock.objects.create(company_code="AAPL")
+        other = Stock.objects.create(company_code="MSFT")
+        self.days = [date(2024, 11, day) for day in (11, 12, 13, 14, 15, 18, 19)]
+        DailyBar.objects.bulk_create(
+            [
+                DailyBar(stock=stock, date=day, close=100.0 + i, volume=1000)
+                for i, day in enumerate(self.days)
+            ]
+            + [DailyBar(stock=other, date=day, close=1.0) for day in self.days]
+        )
+        self.url = reverse("stocks:stock-history", kwargs={"stock_symbol": "aapl"})
+
+    @patch("stocks.utils.invoke_lambda")
+    def test_get_history_range(self, mock_invoke_lambda):
+        """Test the bars of the requested range are returned oldest first"""
+        response = self.client.get(self.url, {"from": "2024-11-12", "to": "2024-11-18"})
+
+        assert response.status_code == 200
+        results = response.json()["results"]
+        assert [bar["date"] for bar in results] == [
+            "2024-11-12",
+            "2024-11-13",
+            "2024-11-14",
+            "2024-11-15",
+            "2024-11-18",
+        ]
+        assert results[0] == {
+            "date": "2024-11-12",
+            "open_value": 0.0,
+            "high": 0.0,
+            "low": 0.0,
+            "close": 101.0,
+            "volume": 1000.0,
+        }
+        assert response.json()["next"] is None
+        mock_invoke_lambda.assert_not_called()
+
+    def test_get_history_pages(self, django_assert_num_queries):
+        """Test pages are read with one query each by following the next links"""
+        dates, url = [], self.url + "?limit=3"
+        while url:
+            with django_assert_num_queries(1):
+                response = self.client.get(url)
+            dates.extend(bar["date"] for bar in response.json()["results"])
+            url = response.json()["next"]
+
+        assert dates == [day.isoformat() for day in self.days]
+
+    def test_get_history_unknown_symbol(self):
+        """Test a symbol without history returns no bars"""
+        url = reverse("stocks:stock-history", kwargs={"stock_symbol": "NOPE"})
+        response = self.client.get(url)
+
+        assert response.status_code == 200
+        assert response.json()["results"] == []
+
+    def test_get_history_invalid_date(self):
+        """Test dates that are not ISO formatted are rejected"""
+        response = self.client.get(self.url, {"from": "11/12/2024"})
+
+        assert response.status_code == 400
+
+
+@pytest.mark.django_db
+class TestPortfolioAPIView:
+    """Tests for PortfolioAPIView"""
+
+    def setup_method(self):
+        self.client = APIClient()
+        cache.clear()
+        self.url = reverse("stocks:portfolio")
+
+        apple = Stock.objects.create(
+            company_code="AAPL", purchased_amount=10, request_data=date(2024, 11, 15)
+        )
+        StockValues.objects.create(stock=apple, open_value=151.0, close=152.0)
+        DailyBar.objects.create(stock=apple, date=date(2024, 11, 14), close=150.0)
+        microsoft = Stock.objects.create(
+            company_code="MSFT", purchased_amount=5, request_data=date(2024, 11, 15)
+        )
+        StockValues.objects.create(stock=microsoft, open_value=400.0, close=410.0)
+        Stock.objects.create(company_code="NVDA", purchased_amount=3)
+        Stock.objects.create(company_code="TSLA", purchased_amount=0)
+
+    def test_get_portfolio(self, django_assert_num_queries):
+        """Test positions and totals are valued in one query, then cached"""
+        with django_assert_num_queries(1):
+            response = self.client.get(self.url)
+
+        assert response.status_code == 200
+        assert response["X-Cache"] == "MISS"
+        data = response.json()
+        assert [p["company_code"] for p in data["positions"]] == [
+            "MSFT",
+            "AAPL",
+            "NVDA",
+        ]
+        msft, aapl, nvda = data["positions"]
+        # MSFT has no previous close stored, so its day change is from the open.
+        assert msft["market_value"] == 2050.0
+        assert msft["day_change"] == 50.0
+        assert msft["day_change_percent"] == 2.5
+        assert aapl["market_value"] == 1520.0
+        assert aapl["day_change"] == 20.0
+        assert aapl["weight"] == pytest.approx(1520 / 3570 * 100, abs=1e-4)
+        assert nvda["market_value"] is None
+        assert nvda["weight"] is None
+        assert data["total_market_value"] == 3570.0
+        assert data["total_day_change"] == 70.0
+        assert data["total_day_change_percent"] == pytest.approx(
+            70 / 3500 * 100, abs=1e-4
+        )
+
+        with django_assert_num_queries(0):
+            response = self.client.get(self.url)
+        assert response["X-Cache"] == "HIT"
+        assert response.json() == data
+
+    def test_purchase_invalidates_portfolio(self):
+        """Test a purchase is reflected in the next valuation"""
+        self.client.get(self.url)
+
+        stock_url = reverse("stocks:stock-detail", kwargs={"stock_symbol": "AAPL"})
+        self.client.post(stock_url, {"amount": 10}, format="json")
+        response = self.client.get(self.url)
+
+        assert response["X-Cache"] == "MISS"
+        assert response.json()["positions"][0]["company_code"] == "AAPL"
+        assert response.json()["total_market_value"] == 5090.0
+
+    def test_refresh_invalidates_portfolio(self):
+        """Test a refreshed close is reflected in the next valuation"""
+        self.client.get(self.url)
+        polygon_data = {
+            "status": "OK",
+            "open": 152.0,
+            "high": 160.0,
+            "low": 150.0,
+            "close": 157.0,
+            "from": "2024-11-18",
+        }
+
+        with patch(
+            "stocks.services.refresh.fetch_upstream_data",
+            return_value=(polygon_data, None),
+        ):
+            refresh_stock("AAPL", "2024-11-18")
+        response = self.client.get(self.url)
+
+        aapl = next(
+            p for p in response.json()["positions"] if p["company_code"] == "AAPL"
+        )
+        assert aapl["market_value"] == 1570.0
+        # Measured from the last close stored before the refreshed day
+        assert aapl["day_change"] == 70.0
+
+    def test_empty_portfolio(self):
+        """Test a portfolio without purchases is worth nothing"""
+        Stock.objects.update(purchased_amount=0)
+
+        response = self.client.get(self.url)
+
+        assert response.json() == {
+            "positions": [],
+            "total_market_value": 0.0,
+            "total_day_change": 0.0,
+            "total_day_change_percent": None,
+        }
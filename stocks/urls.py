@@ -1,7 +1,33 @@
 from django.urls import path
-from .views import StockAPIView
+from .views import (
+    CacheMetricsAPIView,
+    PortfolioAPIView,
+    StockAnalyticsAPIView,
+    StockAPIView,
+    StockBatchAPIView,
+    StockHistoryAPIView,
+    StockPurchaseBatchAPIView,
+)
 
 
 urlpatterns = [
     path("stock/<str:stock_symbol>/", StockAPIView.as_view(), name="stock-detail"),
+    path(
+        "stock/<str:stock_symbol>/history/",
+        StockHistoryAPIView.as_view(),
+        name="stock-history",
+    ),
+    path(
+        "stock/<str:stock_symbol>/analytics/",
+        StockAnalyticsAPIView.as_view(),
+        name="stock-analytics",
+    ),
+    path("stocks/", StockBatchAPIView.as_view(), name="stock-list"),
+    path(
+        "stocks/purchases/",
+        StockPurchaseBatchAPIView.as_view(),
+        name="stock-purchases",
+    ),
+    path("portfolio/", PortfolioAPIView.as_view(), name="portfolio"),
+    path("metrics/cache/", CacheMetricsAPIView.as_view(), name="cache-metrics"),
 ]
@@ -1,18 +1,92 @@
 import boto3
 import json
 import logging
-from datetime import timedelta
+import os
+import threading
+import time
+from botocore.config import Config
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from django.conf import settings
 from django.utils import timezone
+from .services.aws_lambda.trading_calendar import previous_trading_day
 
 
 logger = logging.getLogger("stocks")
 
+_lambda_clients = {}
+_lambda_client_lock = threading.Lock()
+_lambda_executor = None
+_lambda_executor_lock = threading.Lock()
 
-def invoke_lambda(service_name, payload):
+
+class LambdaTimeoutError(Exception):
+    """
+    Raised when a Lambda service does not answer within its configured timeout.
+    """
+
+
+def get_lambda_client(timeout=None):
     """
-    Calls an AWS Lambda function and returns the response.
+    Returns the process-wide Lambda client for calls waited on for `timeout`
+    seconds, creating it on first use.
+
+    boto3 clients are thread-safe, so every thread shares the same client and
+    its pool of keep-alive connections instead of building a new one per call.
+
+    Without a timeout, the client reads and retries as configured by the
+    AWS_LAMBDA_* settings. With one, it reads for as long as the caller waits
+    and makes a single attempt, as a retry could not finish in time and would
+    only keep the worker busy after the caller gave up.
     """
-    client = boto3.client("lambda")
+    client = _lambda_clients.get(timeout)
+    if client is None:
+        with _lambda_client_lock:
+            client = _lambda_clients.get(timeout)
+            if client is None:
+                config = Config(
+                    max_pool_connections=settings.AWS_LAMBDA_MAX_POOL_CONNECTIONS,
+                    connect_timeout=settings.AWS_LAMBDA_CONNECT_TIMEOUT,
+                    read_timeout=(
+                        settings.AWS_LAMBDA_READ_TIMEOUT if timeout is None else timeout
+                    ),
+                    retries={
+                        "mode": settings.AWS_LAMBDA_RETRY_MODE,
+                        "max_attempts": (
+                            settings.AWS_LAMBDA_MAX_ATTEMPTS if timeout is None else 1
+                        ),
+                    },
+                    tcp_keepalive=True,
+                )
+                # Sessions are not thread-safe, so the client gets its own.
+                client = boto3.session.Session().client("lambda", config=config)
+                _lambda_clients[timeout] = client
+    return client
+
+
+def reset_lambda_pools():
+    """
+    Drops the Lambda clients and thread pool so they are rebuilt on next use.
+
+    Runs in forked children: connections and threads inherited from the parent
+    must not be shared with it, and its locks may have been held while forking.
+    """
+    global _lambda_clients, _lambda_client_lock, _lambda_executor, _lambda_executor_lock
+    _lambda_clients = {}
+    _lambda_client_lock = threading.Lock()
+    _lambda_executor = None
+    _lambda_executor_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=reset_lambda_pools)
+
+
+def invoke_lambda(service_name, payload, timeout=None):
+    """
+    Calls an AWS Lambda function and returns the response, giving up after
+    `timeout` seconds if one is given.
+    """
+    client = get_lambda_client(timeout)
     response = client.invoke(
         FunctionName=service_name,
         InvocationType="RequestResponse",
@@ -21,12 +95,179 @@ def invoke_lambda(service_name, payload):
     return json.loads(response["Payload"].read())
 
 
+def fetch_data_from_lambda(service_name, payload, timeout=None):
+    """
+    Fetches data from a specific Lambda service and validates the response.
+
+    The service runs on the data source selected by STOCKS_DATA_SOURCE, AWS
+    Lambda by default.
+    """
+    # Imported here because the data sources import this module.
+    from .services.data_sources import get_data_source
+
+    response = get_data_source().invoke(service_name, payload, timeout=timeout)
+    if response.get("statusCode") != 200:
+        error_msg = response.get("body", {}).get("error", "Unknown error")
+        raise ValueError(f"{service_name} error: {error_msg}")
+    return response.get("body")
+
+
+def get_lambda_executor():
+    """
+    Returns the process-wide thread pool used to call Lambda services.
+    """
+    global _lambda_executor
+    if _lambda_executor is None:
+        with _lambda_executor_lock:
+            if _lambda_executor is None:
+                _lambda_executor = ThreadPoolExecutor(
+                    max_workers=settings.LAMBDA_MAX_WORKERS,
+                    thread_name_prefix="stocks-lambda",
+                )
+    return _lambda_executor
+
+
+def fetch_data_from_lambdas(calls, timeouts=None):
+    """
+    Fetches data from several Lambda services at the same time.
+
+    `calls` maps each service name to its payload. Returns a dict mapping each
+    service name to a `(data, error)` tuple, so one failing or slow service does
+    not discard the data returned by the others.
+
+    The timeout of each service counts from when a worker starts its call, not
+    while it waits for a free worker. A call that times out can't be stopped,
+    but its Lambda client gives up after the same timeout.
+    """
+    timeouts = timeouts or {}
+    executor = get_lambda_executor()
+    started = {service_name: threading.Event() for service_name in calls}
+    started_at = {}
+
+    def fetch(service_name, payload):
+        started_at[service_name] = time.monotonic()
+        started[service_name].set()
+        return fetch_data_from_lambda(
+            service_name, payload, timeout=timeouts.get(service_name)
+        )
+
+    futures = {
+        service_name: executor.submit(fetch, service_name, payload)
+        for service_name, payload in calls.items()
+    }
+
+    results = {}
+    for service_name, future in futures.items():
+        timeout = timeouts.get(service_name)
+        remaining = None
+        if timeout is not None:
+            # Queued calls end within their client's timeouts, so this wait is bounded.
+            started[service_name].wait()
+            elapsed = time.monotonic() - started_at[service_name]
+            remaining = max(timeout - elapsed, 0)
+
+        try:
+            results[service_name] = (future.result(timeout=remaining), None)
+        except FutureTimeoutError:
+            results[service_name] = (
+                None,
+                LambdaTimeoutError(f"{service_name} timed out after {timeout}s"),
+            )
+        except Exception as e:
+            results[service_name] = (None, e)
+    return results
+
+
+def fetch_upstream_data(stock_symbol, last_valid_day):
+    """
+    Fetches Polygon and MarketWatch data for a stock concurrently.
+
+    Polygon data is required, so its errors are raised. A MarketWatch failure
+    only returns None, letting the caller keep the data already stored.
+    """
+    results = fetch_data_from_lambdas(
+        {
+            "polygon_data": {"symbol": stock_symbol, "start_date": last_valid_day},
+            "marketwatch_data": {"symbol": stock_symbol},
+        },
+        timeouts=settings.LAMBDA_TIMEOUTS,
+    )
+
+    polygon_data, polygon_error = results["polygon_data"]
+    if polygon_error:
+        raise polygon_error
+    logger.debug(f"Polygon data fetched: {polygon_data}")
+
+    marketwatch_data, marketwatch_error = results["marketwatch_data"]
+    if marketwatch_error:
+        logger.warning(
+            f"Marketwatch data unavailable for {stock_symbol}: {marketwatch_error}"
+        )
+        return polygon_data, None
+    logger.debug(f"Marketwatch data fetched for {stock_symbol}: {marketwatch_data}")
+
+    return polygon_data, marketwatch_data
+
+
+def fetch_upstream_data_many(stock_symbols, last_valid_day):
+    """
+    Fetches the upstream data of several stocks with one batch invocation
+    of each Lambda service, made concurrently.
+
+    Returns a dict with the `(polygon_data, marketwatch_data)` of each stock
+    and a dict with the error of each stock that could not be fetched. Like
+    `fetch_upstream_data`, a stock without MarketWatch data is returned with
+    None instead.
+    """
+    data, errors = {}, {}
+    if not stock_symbols:
+        return data, errors
+
+    symbols = list(stock_symbols)
+    results = fetch_data_from_lambdas(
+        {
+            "polygon_data": {"symbols": symbols, "start_date": last_valid_day},
+            "marketwatch_data": {"symbols": symbols},
+        },
+        timeouts=settings.LAMBDA_BATCH_TIMEOUTS,
+    )
+
+    polygon_batch, polygon_error = results["polygon_data"]
+    if polygon_error:
+        logger.error(f"Error while fetching Polygon data: {polygon_error}")
+        polygon_batch = {"results": {}, "errors": {}}
+
+    marketwatch_batch, marketwatch_error = results["marketwatch_data"]
+    if marketwatch_error:
+        logger.warning(f"Marketwatch data unavailable: {marketwatch_error}")
+        marketwatch_batch = {"results": {}, "errors": {}}
+
+    for stock_symbol in symbols:
+        polygon_data = polygon_batch["results"].get(stock_symbol)
+        if polygon_data is None:
+            if polygon_error:
+                error = str(polygon_error)
+            else:
+                message = polygon_batch["errors"].get(stock_symbol, "No data")
+                error = f"polygon_data error: {message}"
+            logger.error(f"Error while fetching data for {stock_symbol}: {error}")
+            errors[stock_symbol] = error
+            continue
+
+        marketwatch_data = marketwatch_batch["results"].get(stock_symbol)
+        if marketwatch_data is None and not marketwatch_error:
+            message = marketwatch_batch["errors"].get(stock_symbol, "No data")
+            logger.warning(
+                f"Marketwatch data unavailable for {stock_symbol}: {message}"
+            )
+        data[stock_symbol] = (polygon_data, marketwatch_data)
+    return data, errors
+
+
 def get_last_valid_day():
     """
-    Returns the last valid trading day (ignores weekends).
+    Returns the last valid trading day (skips weekends and exchange holidays).
     """
-    current_date = timezone.localtime().date() - timedelta(days=1)
-    while current_date.weekday() in [5, 6]:
-        current_date -= timedelta(days=1)
+    current_date = previous_trading_day(timezone.localtime().date())
     logger.debug(f"Last valid trading day: {current_date.isoformat()}")
     return current_date.isoformat()
@@ -1,163 +1,95 @@
 import boto3
 import json
 import logging
+import os
+from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
+from rest_framework.parsers import JSONParser
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from datetime import date, timedelta
+from django.conf import settings
 from django.core.cache import cache
-from django.db.models import Prefetch
+from django.http import HttpResponse, HttpResponseNotModified
 from django.utils import timezone
-from .models import Competitor, Stock
+from django.utils.http import parse_etags
+from .local_cache import (
+    cache_stocks,
+    get_cached_stock,
+    get_local_cache,
+    metrics,
+)
+from .models import DailyBar, Stock
+from .pagination import DailyBarPagination
+from .parsers import NDJSONParser
 from .serializers import (
+    DailyBarSerializer,
+    PortfolioResponseSerializer,
+    StockAnalyticsResponseSerializer,
     StockSerializer,
-    StockValuesSerializer,
-    StockPerformanceSerializer,
-    MarketCapSerializer,
-    CompetitorSerializer,
     StockResponseSerializer,
+    StockBatchResponseSerializer,
+    StockHistoryResponseSerializer,
+    StockPurchaseBatchResponseSerializer,
+    StockPurchaseSerializer,
     StockRequestSerializer,
 )
-from .utils import invoke_lambda, get_last_valid_day
+from .services.analytics import get_stock_analytics
+from .services.persistence import save_stocks_data
+from .services.portfolio import get_portfolio, invalidate_portfolio
+from .services.purchases import record_purchase, record_purchases
+from .services.refresh import refresh_stock_once, schedule_refresh
+from .utils import LambdaTimeoutError, fetch_upstream_data_many, get_last_valid_day
 
 
 logger = logging.getLogger("stocks")
 
 
 class StockAPIView(APIView):
-    def fetch_data_from_lambda(self, service_name, payload):
-        """
-        Fetches data from a specific Lambda service and validates the response.
-        """
-        response = invoke_lambda(service_name, payload)
-        if response.get("statusCode") != 200:
-            error_msg = response.get("body", {}).get("error", "Unknown error")
-            raise ValueError(f"{service_name} error: {error_msg}")
-        return response.get("body")
-
-    def create_or_update_stock_data(self, stock_symbol, company_name, polygon_data):
-        stock = self.get_stock(stock_symbol)
-
-        stock_data = {
-            "status": polygon_data.get("status"),
-            "request_data": polygon_data.get("from"),
-            "company_code": stock_symbol,
-            "company_name": company_name,
-        }
-
-        stock_serializer = StockSerializer(instance=stock, data=stock_data)
-        stock_serializer.is_valid(raise_exception=True)
-        return stock_serializer.save()
-
-    def create_or_update_stock_values(self, stock, polygon_data):
-        """
-        Updates stock values using the polygon data.
-        """
-        stock_values_data = {
-            "open_value": polygon_data.get("open"),
-            "high": polygon_data.get("high"),
-            "low": polygon_data.get("low"),
-            "close": polygon_data.get("close"),
-        }
-
-        stock_values_serializer = StockValuesSerializer(
-            instance=getattr(stock, "stock_values", None), data=stock_values_data
-        )
-        stock_values_serializer.is_valid(raise_exception=True)
-        stock_values_serializer.save(stock=stock)
-
-    def create_or_update_performance_data(self, stock, performance_data):
-        """
-        Updates stock performance data using the provided data.
-        """
-        stock_performance_data = {
-            "five_days": performance_data.get("5_day", 0.0),
-            "one_month": performance_data.get("1_month", 0.0),
-            "three_months": performance_data.get("3_month", 0.0),
-            "year_to_date": performance_data.get("ytd", 0.0),
-            "one_year": performance_data.get("1_year", 0.0),
-        }
-
-        stock_performance_serializer = StockPerformanceSerializer(
-            instance=getattr(stock, "performance_data", None),
-            data=stock_performance_data,
-        )
-        stock_performance_serializer.is_valid(raise_exception=True)
-        stock_performance_serializer.save(stock=stock)
-
-    def create_or_update_competitors(self, stock, competitors):
-        """
-        Updates the stock's competitors data.
-        """
-        existing_competitors = (
-            {c.name: c for c in stock.competitors.all()}
-            if stock.competitors.exists()
-            else {}
-        )
-
-        for competitor in competitors:
-            market_cap_data = competitor.get("market_cap")
-            market_cap_serializer = MarketCapSerializer(
-                data={}, context={"raw_market_cap": market_cap_data}
-            )
-            market_cap_serializer.is_valid(raise_exception=True)
-            market_cap = market_cap_serializer.save()
-
-            competitor_name = competitor.get("name")
-            competitor_instance = existing_competitors.get(competitor_name, None)
-            competitor_data = {
-                "name": competitor_name,
-                "market_cap_id": market_cap.id,
-            }
-
-            competitor_serializer = CompetitorSerializer(
-                instance=competitor_instance, data=competitor_data
-            )
-            competitor_serializer.is_valid(raise_exception=True)
-            competitor_serializer.save(stock=stock)
-
     @swagger_auto_schema(
         operation_description="Retrieve stock data for a given symbol",
         responses={200: StockResponseSerializer()},
     )
     def get(self, request, stock_symbol):
         stock_symbol = stock_symbol.upper()
-        cache_key = f"stock_{stock_symbol}"
-        cached_data = cache.get(cache_key)
         last_valid_day = get_last_valid_day()
+        rendered, cached_data = get_cached_stock(stock_symbol, last_valid_day)
 
-        if cached_data and last_valid_day == cached_data.get("request_data"):
+        if rendered:
             logger.info(f"Cache hit for {stock_symbol} on {last_valid_day}")
-            return Response(cached_data, status=200)
-
-        try:
-            logger.info(f"Fetching data for {stock_symbol}")
-            polygon_data = self.fetch_data_from_lambda(
-                "polygon_data", {"symbol": stock_symbol, "start_date": last_valid_day}
+            # The body was rendered when it was cached, so it is sent as is
+            # instead of going through DRF's content negotiation and renderer.
+            headers = {"X-Cache": "HIT", "ETag": rendered.etag}
+            if self.etag_matches(request, rendered.etag):
+                return HttpResponseNotModified(headers=headers)
+            return HttpResponse(
+                rendered.body, content_type="application/json", headers=headers
             )
-            logger.debug(f"Polygon data fetched: {polygon_data}")
 
-            logger.info(f"Fetching data from Market watch")
-            company_name, performance_data, competitors = self.fetch_data_from_lambda(
-                "marketwatch_data", {"symbol": stock_symbol}
-            )
-            logger.debug(
-                f"Marketwatch data fetched for {stock_symbol}: {company_name}, {performance_data}, {competitors}"
+        if cached_data and settings.STOCK_CACHE_STALE_WHILE_REVALIDATE:
+            logger.info(
+                f"Serving stale data for {stock_symbol} from {cached_data.get('request_data')}"
             )
-
-            stock = self.create_or_update_stock_data(
-                stock_symbol, company_name, polygon_data
+            schedule_refresh(stock_symbol, last_valid_day)
+            return Response(
+                cached_data,
+                status=200,
+                headers={
+                    "X-Cache": "STALE",
+                    "X-Data-As-Of": str(cached_data.get("request_data")),
+                    "X-Last-Trading-Day": last_valid_day,
+                },
             )
-            self.create_or_update_stock_values(stock, polygon_data)
-            self.create_or_update_performance_data(stock, performance_data)
-            self.create_or_update_competitors(stock, competitors)
 
-            stock.refresh_from_db()
-            stock_serializer = StockSerializer(stock)
-            data = stock_serializer.data
-            cache.set(cache_key, data, timeout=86400 * 7)
+        try:
+            # Concurrent misses on the same symbol wait for a single refresh
+            # instead of all invoking the Lambdas.
+            data = refresh_stock_once(stock_symbol, last_valid_day)
+            return Response(data, status=200, headers={"X-Cache": "MISS"})
 
-            return Response(data, status=200)
+        except LambdaTimeoutError as e:
+            logger.error(f"Timeout while fetching stock data: {e}")
+            return Response({"error": str(e)}, status=504)
 
         except ValueError as e:
             logger.error(f"Error while fetching stock data: {e}")
@@ -181,30 +113,7 @@ class StockAPIView(APIView):
                     {"error": "The 'amount' field must be a positive number."},
                     status=400,
                 )
-            stock = self.get_stock(stock_symbol)
-
-            if not stock:
-                stock_data = {
-                    "company_code": stock_symbol,
-                    "purchased_amount": amount,
-                    "purchased_status": "active",
-                }
-
-                stock_serializer = StockSerializer(data=stock_data)
-                stock_serializer.is_valid(raise_exception=True)
-                stock = stock_serializer.save()
-            else:
-                stock.purchased_amount += int(amount)
-                stock.save()
-
-                cache_key = f"stock_{stock_symbol}"
-                if cache.get(cache_key):
-                    data = cache.get(cache_key)
-                    data["purchased_amount"] = stock.purchased_amount
-                    data["purchased_status"] = "active"
-                else:
-                    data = stock
-                cache.set(cache_key, data, timeout=86400 * 7)
+            record_purchase(stock_symbol, int(amount))
 
             return Response(
                 {
@@ -215,15 +124,295 @@ class StockAPIView(APIView):
         except Exception as e:
             return Response({"error": str(e)}, status=500)
 
-    def get_stock(self, company_code):
-        return (
-            Stock.objects.select_related("stock_values", "performance_data")
-            .prefetch_related(
-                Prefetch(
-                    "competitors",
-                    queryset=Competitor.objects.select_related("market_cap"),
-                )
+    def etag_matches(self, request, etag):
+        """
+        Returns whether the client already has the response with this ETag.
+        """
+        etags = parse_etags(request.headers.get("If-None-Match", ""))
+        return "*" in etags or etag in {e.removeprefix("W/") for e in etags}
+
+
+class StockBatchAPIView(APIView):
+    def get_symbols(self, request):
+        symbols = request.query_params.get("symbols", "")
+        # dict.fromkeys drops duplicates while keeping the requested order
+        return list(
+            dict.fromkeys(s.strip().upper() for s in symbols.split(",") if s.strip())
+        )
+
+    def refresh_stocks(self, stock_symbols, last_valid_day):
+        """
+        Fetches and saves the stocks missing from the cache as one batch.
+        """
+        stocks_data, errors = fetch_upstream_data_many(stock_symbols, last_valid_day)
+        errors.update(save_stocks_data(stocks_data))
+        if stocks_data:
+            invalidate_portfolio()
+
+        saved_symbols = [s for s in stocks_data if s not in errors]
+        stocks = Stock.objects.with_related().filter(company_code__in=saved_symbols)
+
+        results, cache_data = {}, {}
+        for stock in stocks:
+            data = StockSerializer(stock).data
+            results[stock.company_code] = data
+            # Partial data is not cached, so the next request retries MarketWatch.
+            if stocks_data[stock.company_code][1]:
+                cache_data[stock.company_code] = data
+        cache_stocks(cache_data)
+        return results, errors
+
+    @swagger_auto_schema(
+        operation_description="Retrieve stock data for several symbols at once",
+        manual_parameters=[
+            openapi.Parameter(
+                "symbols",
+                openapi.IN_QUERY,
+                description="Comma-separated stock symbols (e.g., AAPL,MSFT)",
+                type=openapi.TYPE_STRING,
+                required=True,
+            )
+        ],
+        responses={200: StockBatchResponseSerializer()},
+    )
+    def get(self, request):
+        stock_symbols = self.get_symbols(request)
+        if not stock_symbols:
+            return Response(
+                {"error": "The 'symbols' query parameter is required."}, status=400
+            )
+        if len(stock_symbols) > settings.STOCK_BATCH_MAX_SYMBOLS:
+            return Response(
+                {
+                    "error": f"At most {settings.STOCK_BATCH_MAX_SYMBOLS} symbols can be requested at once."
+                },
+                status=400,
+            )
+
+        last_valid_day = get_last_valid_day()
+        cached_data = cache.get_many([f"stock_{s}" for s in stock_symbols])
+
+        results, errors = {}, {}
+        for stock_symbol in stock_symbols:
+            data = cached_data.get(f"stock_{stock_symbol}")
+            if data and last_valid_day == data.get("request_data"):
+                results[stock_symbol] = data
+
+        missing_symbols = [s for s in stock_symbols if s not in results]
+        logger.info(
+            f"Batch cache hits: {len(results)}, misses: {len(missing_symbols)} on {last_valid_day}"
+        )
+        if missing_symbols:
+            try:
+                refreshed, errors = self.refresh_stocks(missing_symbols, last_valid_day)
+                results.update(refreshed)
+            except Exception as e:
+                logger.error(f"Error while fetching stock data: {e}")
+                return Response({"error": str(e)}, status=500)
+
+        return Response(
+            {
+                "results": [results[s] for s in stock_symbols if s in results],
+                "errors": errors,
+            },
+            status=200,
+        )
+
+
+class StockPurchaseBatchAPIView(APIView):
+    parser_classes = [JSONParser, NDJSONParser]
+
+    def parse_purchase(self, item):
+        """
+        Returns the symbol and amount of a purchase, with the same rules as a
+        single purchase. Raises ValueError when the purchase is invalid.
+        """
+        if not isinstance(item, dict):
+            raise ValueError("Each purchase must be an object.")
+        symbol = item.get("symbol")
+        if not isinstance(symbol, str) or not symbol.strip():
+            raise ValueError("The 'symbol' field is required.")
+        symbol = symbol.strip().upper()
+        max_length = Stock._meta.get_field("company_code").max_length
+        if len(symbol) > max_length:
+            raise ValueError(
+                f"The 'symbol' field must have at most {max_length} characters."
             )
-            .filter(company_code=company_code)
-            .first()
+        amount = item.get("amount")
+        # bool is a subclass of int, but `true` is not an amount.
+        if (
+            isinstance(amount, bool)
+            or not isinstance(amount, (int, float))
+            or amount <= 0
+        ):
+            raise ValueError("The 'amount' field must be a positive number.")
+        return symbol, int(amount)
+
+    @swagger_auto_schema(
+        operation_description="Add purchased units to several stocks at once, from a JSON array or NDJSON (application/x-ndjson) of purchases",
+        request_body=StockPurchaseSerializer(many=True),
+        responses={201: StockPurchaseBatchResponseSerializer()},
+    )
+    def post(self, request):
+        purchases = request.data
+        if not isinstance(purchases, list) or not purchases:
+            return Response(
+                {"error": "The body must be a non-empty list of purchases."},
+                status=400,
+            )
+        if len(purchases) > settings.STOCK_PURCHASE_BATCH_MAX_ITEMS:
+            return Response(
+                {
+                    "error": f"At most {settings.STOCK_PURCHASE_BATCH_MAX_ITEMS} purchases can be sent at once."
+                },
+                status=400,
+            )
+
+        parsed, amounts = [], {}
+        for item in purchases:
+            try:
+                symbol, amount = self.parse_purchase(item)
+            except ValueError as e:
+                parsed.append((item, str(e)))
+                continue
+            parsed.append(((symbol, amount), None))
+            # Purchases of the same stock are applied as one increment.
+            amounts[symbol] = amounts.get(symbol, 0) + amount
+
+        try:
+            purchased_amounts = record_purchases(amounts)
+        except Exception as e:
+            logger.error(f"Error while recording purchases: {e}")
+            return Response({"error": str(e)}, status=500)
+
+        results = []
+        for value, error in parsed:
+            if error:
+                results.append({"status": "rejected", "error": error})
+                continue
+            symbol, amount = value
+            results.append(
+                {
+                    "status": "added",
+                    "symbol": symbol,
+                    "amount": amount,
+                    "purchased_amount": purchased_amounts[symbol],
+                }
+            )
+        return Response(
+            {"results": results, "purchased_amounts": purchased_amounts},
+            status=201 if amounts else 400,
+        )
+
+
+class StockHistoryAPIView(APIView):
+    def get_date(self, request, param):
+        value = request.query_params.get(param)
+        return date.fromisoformat(value) if value else None
+
+    @swagger_auto_schema(
+        operation_description="Retrieve the stored daily bars of a stock, oldest first",
+        manual_parameters=[
+            openapi.Parameter(
+                "from",
+                openapi.IN_QUERY,
+                description="First day of the range (YYYY-MM-DD)",
+                type=openapi.TYPE_STRING,
+            ),
+            openapi.Parameter(
+                "to",
+                openapi.IN_QUERY,
+                description="Last day of the range (YYYY-MM-DD)",
+                type=openapi.TYPE_STRING,
+            ),
+            openapi.Parameter(
+                "limit",
+                openapi.IN_QUERY,
+                description="Number of bars per page",
+                type=openapi.TYPE_INTEGER,
+            ),
+        ],
+        responses={200: StockHistoryResponseSerializer()},
+    )
+    def get(self, request, stock_symbol):
+        try:
+            start_date = self.get_date(request, "from")
+            end_date = self.get_date(request, "to")
+        except ValueError:
+            return Response(
+                {"error": "The 'from' and 'to' parameters must be YYYY-MM-DD dates."},
+                status=400,
+            )
+
+        # Only reads the stored history, never the Lambdas.
+        bars = DailyBar.objects.filter(stock__company_code=stock_symbol.upper())
+        if start_date:
+            bars = bars.filter(date__gte=start_date)
+        if end_date:
+            bars = bars.filter(date__lte=end_date)
+
+        paginator = DailyBarPagination()
+        page = paginator.paginate_queryset(
+            bars.values(*DailyBarSerializer.Meta.fields), request, view=self
+        )
+        return paginator.get_paginated_response(page)
+
+
+class StockAnalyticsAPIView(APIView):
+    @swagger_auto_schema(
+        operation_description="Returns, volatility, moving averages and drawdown computed from the stored price history of a stock",
+        responses={200: StockAnalyticsResponseSerializer()},
+    )
+    def get(self, request, stock_symbol):
+        stock_symbol = stock_symbol.upper()
+        last_valid_day = get_last_valid_day()
+        cache_key = f"analytics_{stock_symbol}_{last_valid_day}"
+        cached_data = cache.get(cache_key)
+        if cached_data:
+            return Response(cached_data, status=200, headers={"X-Cache": "HIT"})
+
+        data = get_stock_analytics(
+            [stock_symbol],
+            date.fromisoformat(last_valid_day),
+            settings.STOCK_ANALYTICS_LOOKBACK_DAYS,
+        ).get(stock_symbol)
+
+        if data is None:
+            return Response(
+                {"error": f"No price history stored for {stock_symbol}."}, status=404
+            )
+        # Analytics missing the bar of the last trading day are not cached, so
+        # they are computed again once the stock is refreshed.
+        if data["as_of"] == last_valid_day:
+            cache.set(cache_key, data, timeout=settings.STOCK_ANALYTICS_CACHE_TIMEOUT)
+        return Response(data, status=200, headers={"X-Cache": "MISS"})
+
+
+class PortfolioAPIView(APIView):
+    @swagger_auto_schema(
+        operation_description="Market value, day change and weight of every purchased stock and of the whole portfolio",
+        responses={200: PortfolioResponseSerializer()},
+    )
+    def get(self, request):
+        portfolio, cached = get_portfolio()
+        return Response(
+            portfolio, status=200, headers={"X-Cache": "HIT" if cached else "MISS"}
+        )
+
+
+class CacheMetricsAPIView(APIView):
+    @swagger_auto_schema(
+        operation_description="Hits, misses and hit ratio of each cache tier in the process serving the request",
+        responses={200: "Cache metrics of the local (l1) and Redis tiers"},
+    )
+    def get(self, request):
+        local_cache = get_local_cache()
+        return Response(
+            {
+                "pid": os.getpid(),
+                "l1_enabled": local_cache is not None,
+                "l1_size": len(local_cache) if local_cache is not None else 0,
+                "tiers": metrics.snapshot(),
+            },
+            status=200,
         )